@@ -0,0 +1,328 @@
+"""Headless batch mode that runs the salary models for many employees in parallel."""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from bonusmodel_v1 import run_engine, selected_engine
+from html_report import write_employee_page, write_index
+from json_stream import iter_file_records
+from profiling import context, enable, enabled, stage, take_events, write_profile
+from result_writer import result_writer
+from unknown_timecodes import employee_inventory, merge_inventories, write_inventory
+
+
+def list_timesheet_files(source: str) -> list[str]:
+    """List the per-employee Deltek dumps to process.
+
+    Args:
+        source (str): Directory with one ``<employee>.json`` dump per employee, or a manifest
+            file with one dump path per line. Relative manifest paths are resolved against the
+            directory of the manifest.
+
+    Returns:
+        list[str]: Paths to the timesheet dumps, sorted.
+    """
+
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.endswith(".json") and not name.endswith(".checkpoints.json")
+        )
+
+    base_dir = os.path.dirname(source)
+    paths = []
+    with open(source, "r") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            paths.append(os.path.join(base_dir, line))
+    return sorted(paths)
+
+
+def employee_id(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_timesheet_records(path: str) -> list[dict]:
+    """Load the timesheet lines of a Deltek dump, either a full container or a bare record list."""
+
+    with open(path, "r") as fp:
+        data = json.load(fp)
+    if isinstance(data, dict):
+        return data["panes"]["filter"]["records"]
+    return data
+
+
+def yearly_totals(report: dict) -> dict:
+    rtot_val = report["info"]["Rtotal"]
+    rlin_val = report["info"]["Rlinear"]
+    rlon_val = report["info"]["Rlon"]
+
+    totals = {}
+    for year, year_data in report["years"].items():
+        info = year_data["info"]
+        current = info["Rtotal_payments"] * rtot_val + info["Rlinear_hours"] * rlin_val
+        new = info["Rlon_hours"] * rlon_val
+        totals[year] = {
+            "Rtotal_payments": info["Rtotal_payments"],
+            "Rlinear_hours": info["Rlinear_hours"],
+            "Rlon_hours": info["Rlon_hours"],
+            "Rtotal_hours_lost": info["Rtotal_hours_lost"],
+            "total_current": current,
+            "total_new": new,
+        }
+    return totals
+
+
+def year_rows(employee: str, report: dict, totals: dict) -> list[dict]:
+    """One flat row per year for ``result_writer``."""
+
+    rows = []
+    for year, year_data in report["years"].items():
+        rows.append(
+            {
+                "employee": employee,
+                "year": year,
+                "Rtotal_rate": report["info"]["Rtotal"],
+                "Rlinear_rate": report["info"]["Rlinear"],
+                "Rlon_rate": report["info"]["Rlon"],
+                **totals[year],
+                "Rtotal_december": year_data.get("Rtotal_december", 0),
+            }
+        )
+    return rows
+
+
+def month_rows(employee: str, report: dict) -> list[dict]:
+    """One flat row per month for ``result_writer``."""
+
+    rows = []
+    for year, year_data in report["years"].items():
+        for month, month_data in year_data["months"].items():
+            rows.append(
+                {
+                    "employee": employee,
+                    "year": year,
+                    "month": month,
+                    "hours": month_data["hours"],
+                    "hours_adjusted_rtotal": month_data["hours_adjusted_rtotal"],
+                    "hours_adjusted_rlin": month_data["hours_adjusted_rlin"],
+                    "hours_adjusted_rlon": month_data["hours_adjusted_rlon"],
+                    "Rtotal_received": bool(month_data["Rtotal"]),
+                    "rtot_bank": month_data["rtot_bank"],
+                    "Rlin": month_data["Rlin"],
+                    "Rlön": month_data["Rlön"],
+                }
+            )
+    return rows
+
+
+def process_employee(path: str, output_dir: str, rows: bool = False, html: bool = False) -> dict:
+    """Run the models for one employee and write the result to ``<output_dir>/<employee>.json``.
+
+    Nothing is printed, so workers never contend for the terminal. Errors are returned as part
+    of the result instead of aborting the whole batch. With ``rows`` the year and month rows for
+    ``result_writer`` are returned as well. With ``html`` the employee's page is written to
+    ``<output_dir>/html/<employee>.html``. With profiling on, the worker's stage timings are
+    returned in ``profile``.
+    """
+
+    employee = employee_id(path)
+    with context(employee=employee), stage("employee"):
+        result = _process_employee(path, output_dir, employee, rows, html)
+    if enabled():
+        result["profile"] = take_events()
+    return result
+
+
+def _process_employee(path: str, output_dir: str, employee: str, rows: bool, html: bool) -> dict:
+    try:
+        unknown = {}
+        if selected_engine() == "streaming":
+            records = iter_file_records(path)
+        else:
+            with stage("parse"):
+                records = load_timesheet_records(path)
+        checkpoint_file = os.path.join(output_dir, f"{employee}.checkpoints.json")
+        report = run_engine(
+            records,
+            unknown,
+            output_file=None,
+            checkpoint_file=checkpoint_file,
+            employee=employee,
+            keep_records=False,
+        )
+    except Exception as e:
+        return {"employee": employee, "error": str(e), "years": {}, "unknown": {}}
+
+    totals = yearly_totals(report)
+    result = {**report, "employee": employee, "unknown": unknown}
+    with stage("render", output="json"):
+        with open(os.path.join(output_dir, f"{employee}.json"), "w") as fp:
+            json.dump(result, fp)
+    if html:
+        with stage("render", output="html"):
+            write_employee_page(report, employee, os.path.join(output_dir, "html", f"{employee}.html"), unknown)
+
+    # The unknown timecodes are reduced to a small inventory here, and merged for the org in ``run_batch``
+    inventory = employee_inventory(unknown)
+    if rows:
+        return {
+            "employee": employee,
+            "error": None,
+            "years": totals,
+            "unknown": inventory,
+            "year_rows": year_rows(employee, report, totals),
+            "month_rows": month_rows(employee, report),
+        }
+    return {"employee": employee, "error": None, "years": totals, "unknown": inventory}
+
+
+def summarize(results: list[dict]) -> dict:
+    """Combine the per-employee totals into an org-wide summary by year."""
+
+    org = {}
+    for result in results:
+        for year, totals in result["years"].items():
+            if year not in org:
+                org[year] = {
+                    "employees": 0,
+                    "Rtotal_payments": 0.0,
+                    "Rlinear_hours": 0.0,
+                    "Rlon_hours": 0.0,
+                    "total_current": 0.0,
+                    "total_new": 0.0,
+                    "employees_better_off_new": 0,
+                }
+            org[year]["employees"] += 1
+            for key in ["Rtotal_payments", "Rlinear_hours", "Rlon_hours", "total_current", "total_new"]:
+                org[year][key] += totals[key]
+            if totals["total_new"] > totals["total_current"]:
+                org[year]["employees_better_off_new"] += 1
+
+    return {
+        "org": dict(sorted(org.items())),
+        "employees": {result["employee"]: result["years"] for result in results if not result["error"]},
+        "errors": {result["employee"]: result["error"] for result in results if result["error"]},
+    }
+
+
+def stream_rows(results, path: str, output_format: str, months: bool):
+    """Write the rows of each employee result as it arrives, and pass the results on without them."""
+
+    with result_writer(path, output_format, months) as writer:
+        for result in results:
+            for row in result.pop("year_rows", []):
+                writer.write_year(row)
+            for row in result.pop("month_rows", []):
+                writer.write_month(row)
+            yield result
+
+
+def run_batch(
+    source: str,
+    output_dir: str,
+    workers: int | None = None,
+    output_format: str = "",
+    months: bool = False,
+    html: bool = False,
+) -> dict:
+    """Run the salary models for every employee dump in ``source`` across a process pool.
+
+    Args:
+        source (str): Directory of per-employee Deltek dumps, or a manifest file listing them.
+        output_dir (str): Directory receiving one result file per employee, ``summary.json`` and
+            ``unknown_timecodes.json``.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        output_format (str, optional): "jsonl" or "csv" to also stream one row per employee and year
+            to ``<output_dir>/results.<format>`` as the employees finish. Defaults to no rows.
+        months (bool, optional): Stream a row per employee and month as well. Defaults to False.
+        html (bool, optional): Render a page per employee in the workers and ``<output_dir>/index.html``
+            with the org totals. Defaults to False.
+
+    Returns:
+        dict: The org summary that was written to ``summary.json``.
+    """
+
+    paths = list_timesheet_files(source)
+    os.makedirs(output_dir, exist_ok=True)
+    if html:
+        os.makedirs(os.path.join(output_dir, "html"), exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    # Large chunks keep the per-task IPC overhead low, several chunks per worker keep the load balanced
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = [bool(output_format)] * len(paths)
+        pages = [html] * len(paths)
+        results = pool.map(process_employee, paths, [output_dir] * len(paths), rows, pages, chunksize=chunksize)
+        if output_format:
+            results_file = os.path.join(output_dir, f"results.{output_format}")
+            results = stream_rows(results, results_file, output_format, months)
+        results = list(results)
+
+    events = [event for result in results for event in result.pop("profile", [])]
+    inventory = merge_inventories(result.pop("unknown") for result in results)
+    write_inventory(inventory, os.path.join(output_dir, "unknown_timecodes.json"))
+    summary = summarize(results)
+    summary["unknown_timecodes"] = len(inventory)
+    with open(os.path.join(output_dir, "summary.json"), "w") as fp:
+        json.dump(summary, fp, indent=2)
+    if html:
+        write_index(summary, os.path.join(output_dir, "index.html"))
+    write_profile(events)
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the salary models for many employees at once.")
+    parser.add_argument("source", help="Directory of per-employee Deltek dumps, or a manifest file listing them")
+    parser.add_argument("-o", "--output", default="results", help="Output directory (default: results)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument(
+        "--engine",
+        choices=["python", "numpy", "streaming", "incremental", "sqlite", "parallel"],
+        help="Calculation engine, same as envar ENGINE. With parallel each worker sums the years of its employee in"
+        " processes of its own, which pays off for few employees with long histories",
+    )
+    parser.add_argument(
+        "--format", choices=["jsonl", "csv"], help="Also stream one row per employee and year to results.<format>"
+    )
+    parser.add_argument("--months", action="store_true", help="Stream a row per employee and month as well")
+    parser.add_argument("--html", action="store_true", help="Render HTML pages per employee and an index page")
+    parser.add_argument(
+        "--profile", metavar="TRACE", help="Time each stage and write a Chrome trace, same as envar PROFILE"
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        os.environ["PROFILE"] = args.profile
+        enable()
+
+    if args.engine:
+        # Set before the pool starts so the worker processes inherit it
+        os.environ["ENGINE"] = args.engine
+    if args.engine == "sqlite" and "TIMESHEET_STORE" not in os.environ:
+        os.makedirs(args.output, exist_ok=True)
+        os.environ["TIMESHEET_STORE"] = os.path.join(args.output, "timesheets.db")
+
+    summary = run_batch(
+        args.source,
+        args.output,
+        workers=args.workers,
+        output_format=args.format or "",
+        months=args.months,
+        html=args.html,
+    )
+    print(f"Processed {len(summary['employees'])} employees, {len(summary['errors'])} errors")
+    print(f"{summary['unknown_timecodes']} unknown timecodes listed in unknown_timecodes.json")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Benchmarks of the calculation steps on synthetic timesheets, with results saved for comparing versions.
+
+Each benchmark runs on the history of one synthetic employee (see ``synthetic_timesheets.py``) at several
+lengths, and reports the best and the median of a number of repeats. Save the results of one version with
+``--output`` and compare a later run against them with ``--compare``.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+from bonusmodel_v1 import calculate_years, daily_result, get_monthly_billable_hours_by_year, print_report, sort_records
+from holiday_api import get_ascension_day, get_easter_holidays, get_midsummers_eve, holiday_index
+from synthetic_timesheets import generate_records
+from work_calendar import year_calendar
+
+START_YEAR = 2000
+
+
+def prepare(years: int, seed: int = 0) -> dict:
+    """The inputs of the benchmarks for a history of ``years`` years."""
+
+    records = generate_records(seed, START_YEAR, years)
+    sorted_records = sort_records(records)
+    lines = [
+        line for months in sorted_records.values() for days in months.values() for day in days.values() for line in day
+    ]
+    return {
+        "records": records,
+        "sorted_records": sorted_records,
+        "lines": lines,
+        "report": calculate_years(sorted_records, {}, None),
+        "years": list(range(START_YEAR, START_YEAR + years)),
+    }
+
+
+def bench_sort_records(data: dict):
+    sort_records(data["records"])
+
+
+def bench_daily_result(data: dict):
+    unknown = {}
+    for line in data["lines"]:
+        daily_result(line, unknown)
+
+
+def bench_calculate_years(data: dict):
+    calculate_years(data["sorted_records"], {}, None)
+
+
+def bench_print_report(data: dict):
+    print_report(data["report"], io.StringIO())
+
+
+def bench_holidays(data: dict):
+    # Cold caches, as in a fresh process
+    holiday_index.cache_clear()
+    year_calendar.cache_clear()
+    for year in data["years"]:
+        get_easter_holidays(year)
+        get_ascension_day(year)
+        get_midsummers_eve(year)
+        get_monthly_billable_hours_by_year(year)
+
+
+BENCHMARKS = {
+    "sort_records": bench_sort_records,
+    "daily_result": bench_daily_result,
+    "calculate_years": bench_calculate_years,
+    "print_report": bench_print_report,
+    "holidays": bench_holidays,
+}
+
+
+def time_benchmark(benchmark, data: dict, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark(data)
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": statistics.median(timings)}
+
+
+def version() -> str:
+    """The git commit of the code being measured, marked dirty when there are local changes."""
+
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return result.stdout.strip() or "unknown"
+
+
+def run_benchmarks(sizes: list[int], names: list[str], repeat: int = 5) -> dict:
+    """Run the benchmarks at each history length.
+
+    Args:
+        sizes (list[int]): History lengths in years.
+        names (list[str]): Benchmarks to run, keys of ``BENCHMARKS``.
+        repeat (int, optional): Runs of each benchmark and size. Defaults to 5.
+
+    Returns:
+        dict: The environment and, by benchmark and size, the ``lines`` and the ``best`` and ``median``
+            times in seconds.
+    """
+
+    results = {name: {} for name in names}
+    for years in sizes:
+        data = prepare(years)
+        for name in names:
+            timing = time_benchmark(BENCHMARKS[name], data, repeat)
+            results[name][str(years)] = {"lines": len(data["lines"]), **timing}
+    return {
+        "version": version(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def print_results(results: dict, previous: dict | None = None):
+    header = f"{'benchmark':<16} {'years':>5} {'lines':>7} {'best ms':>10} {'median ms':>10}"
+    if previous:
+        header += f" {previous['version'][:12]:>12} {'change':>7}"
+    print(f"Version {results['version']}, Python {results['python']}, best of {results['repeat']}")
+    print(header)
+    for name, sizes in results["results"].items():
+        for years, timing in sizes.items():
+            line = f"{name:<16} {years:>5} {timing['lines']:>7}"
+            line += f" {timing['best'] * 1000:>10.2f} {timing['median'] * 1000:>10.2f}"
+            before = previous["results"].get(name, {}).get(years) if previous else None
+            if before:
+                change = (timing["best"] - before["best"]) / before["best"] * 100
+                line += f" {before['best'] * 1000:>12.2f} {change:>+6.1f}%"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the calculation steps on synthetic timesheets.")
+    parser.add_argument("--sizes", default="1,5,20", help="History lengths in years (default: 1,5,20)")
+    parser.add_argument(
+        "--benchmarks", default=",".join(BENCHMARKS), help=f"Benchmarks to run (default: {','.join(BENCHMARKS)})"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Runs of each benchmark (default: 5)")
+    parser.add_argument("-o", "--output", help="Save the results to this JSON file")
+    parser.add_argument("-c", "--compare", help="Compare with the results saved from another version")
+    args = parser.parse_args()
+
+    names = args.benchmarks.split(",")
+    for name in names:
+        if name not in BENCHMARKS:
+            raise Exception(f"Unknown benchmark {name}")
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as fp:
+            previous = json.load(fp)
+
+    results = run_benchmarks([int(size) for size in args.sizes.split(",")], names, args.repeat)
+    print_results(results, previous)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,3 @@
-import calendar as cal
-from termcolor import colored
 import io
 import json
 import math
@@ -7,13 +5,43 @@ import os
 import sys
 from getpass import getpass
 
-from deltek import UnauthorizedException, read_dailysheetlines
-from holiday_api import get_ascension_day, get_easter_holidays, get_midsummers_eve
+from deltek import (
+    UnauthorizedException,
+    read_dailysheetlines,
+    stream_dailysheetlines,
+    sync_active,
+    sync_dailysheetlines,
+)
+from profiling import stage, write_profile
+from timecode_mapping import timecode_mapping, timeline_sheet_record
+from work_calendar import employee_schedule, monthly_hours, schedule, year_calendar
 
 _rtotal_color = 'yellow'
 _rlin_color = 'blue'
 _rlon_color = 'green'
 
+
+def colored(text, color: str) -> str:
+    # termcolor is only loaded once something is printed, headless runs never import it
+    from termcolor import colored as termcolor_colored
+
+    return termcolor_colored(text, color)
+
+
+def load_timecode_mapping() -> timecode_mapping:
+    """Load the timecode mapping from envar TIMECODE_MAPPING, or the timecode_mapping.json next to this file."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "timecode_mapping.json")
+    if "TIMECODE_MAPPING" in os.environ:
+        path = os.environ["TIMECODE_MAPPING"]
+    return timecode_mapping(path)
+
+
+_timecodes = load_timecode_mapping()
+
+
+def get_timecode_mapping() -> timecode_mapping:
+    return _timecodes
+
 def day_to_string(date):
     match date.weekday():
         case 0:
@@ -34,58 +62,73 @@ def day_to_string(date):
             return "hmm"
 
 
-def get_monthly_billable_hours_by_year(year: int):
-    goodfriday, eastermonday = get_easter_holidays(year)
-    ascension_day = get_ascension_day(year)
-    calendar = cal.Calendar()
-    res = []
-    for i in range(12):
-        month = i + 1
-        count = 0
-        for date in calendar.itermonthdates(year, month):
-            if date.month != month or date.year != year:
-                continue
-            if date.weekday() == 5 or date.weekday() == 6:
-                continue
-            if date.month == 1 and date.day == 1:
-                # New years day
-                continue
-            if date.month == 1 and date.day == 6:
-                # Trettondagen
-                continue
-            if date.isoformat() in [goodfriday, eastermonday]:
-                # Påsken
-                continue
-            if date.month == 5 and date.day == 1:
-                # First of May
-                continue
-            if date.isoformat() == ascension_day:
-                # Ascension Day
-                continue
-            if date.month == 6 and date.day == 6:
-                # Nationaldagen
-                continue
-            if date.month == 12 and date.day in [24, 25, 26, 31]:
-                # Jul och nyårsafton
-                continue
-            count += 1
-        if month == 6:
-            # Midsommarafton
-            count -= 1
-        res.append(count * 8)
+def get_monthly_billable_hours_by_year(year: int) -> tuple[int, ...]:
+    """The full-time working hours of each month of a year, see ``work_calendar``."""
+    return year_calendar(year).month_hours
+
+
+def classify_record(record: dict) -> str:
+    return classify(
+        record["jobnumber"], record["activitynumber"], record["taskname"], record["invoiceable"], record["internaljob"]
+    )
+
+
+def classify(jobnumber: str, activitynumber: str, taskname: str, invoicable: bool, internaljob: bool) -> str:
+    bonus_type = _timecodes.classify(jobnumber, activitynumber, taskname)
+    if bonus_type != "unknown":
+        return bonus_type
+
+    if internaljob and not invoicable:
+        return "internal"
+
+    if invoicable:
+        return "billable"
+
+    return "unknown"
 
-    return res
+
+def add_unknown(unknown: dict | list, jobnumber, jobname, activitynumber, desc, hours):
+    """Add the hours of an unclassified line to ``unknown``.
+
+    A list only collects the lines, to be added later with ``add_unknown_lines``. The hours are summed in the
+    order of the lines either way, so the totals are exactly those of adding the lines one by one.
+    """
+
+    if isinstance(unknown, list):
+        unknown.append((jobnumber, jobname, activitynumber, desc, hours))
+        return
+    if jobnumber not in unknown:
+        unknown[jobnumber] = {"description": jobname, "activities": {}}
+    if activitynumber not in unknown[jobnumber]["activities"]:
+        unknown[jobnumber]["activities"][activitynumber] = {"description": desc, "hours": 0}
+    unknown[jobnumber]["activities"][activitynumber]["hours"] += hours
+
+
+def add_unknown_lines(unknown: dict, lines: list):
+    """Add the unclassified lines collected in a list by ``add_unknown``, in order."""
+
+    for jobnumber, jobname, activitynumber, desc, hours in lines:
+        add_unknown(unknown, jobnumber, jobname, activitynumber, desc, hours)
 
 
 # return: interntid, rtotalgrundande, rlingrundande, okänt
-def daily_result(record: dict, unknown: dict):
+def daily_result(record: dict | timeline_sheet_record, unknown: dict):
+
+    if isinstance(record, timeline_sheet_record):
+        # The compact line doubles as the parsed line, no extra dict per line
+        record.type = classify(
+            record.jobnumber, record.activitynumber, record.taskname, record.invoiceable, record.internaljob
+        )
+        if record.type == "unknown":
+            add_unknown(
+                unknown, record.jobnumber, record.jobname, record.activitynumber, record.entrytext, record.hours
+            )
+        return record
 
     hours = record["numbertransferred"]
     jobnumber = record["jobnumber"]
     jobname = record["description"]
     activitynumber = record["activitynumber"]
-    invoicable = record["invoiceable"]
-    internaljob = record["internaljob"]
     taskname = record["taskname"]
     desc = record["entrytext"]
 
@@ -94,51 +137,13 @@ def daily_result(record: dict, unknown: dict):
         'activitynumber':activitynumber,
         'taskname':taskname,
         'hours':hours,
-        'type':'unknown',
+        'type':classify_record(record),
         "description": desc
     }
 
-    if "9830Internt" == jobnumber:
-        bonus_type = ""
-        match res['taskname']:
-            case "181":
-                bonus_type = "bonus"
-            case "280":
-                bonus_type = "förtroendeuppdrag"
-            case _:
-                bonus_type = "internal"
-        res['type'] = bonus_type
-        return res 
-    
-    if "9930Frånvaro" == jobnumber:
-        bonus_type = ""
-        match res['taskname']:
-            case "120":
-                bonus_type = "vacation"
-            case "130":
-                bonus_type = "parental"
-            case "140":
-                bonus_type = "VAB"
-            case _:
-                bonus_type = "internal"
-        res['type'] = bonus_type
-        return res 
-
-    if internaljob and not invoicable:
-        res['type'] = "internal"
-        return res 
+    if res['type'] == 'unknown':
+        add_unknown(unknown, jobnumber, jobname, activitynumber, desc, hours)
 
-    if invoicable:
-        res['type'] = 'billable'
-        return res 
-        
-    if jobnumber not in unknown:
-        unknown[jobnumber] = {"description": jobname, "activities": {}}
-    if activitynumber not in unknown[jobnumber]["activities"]:
-        unknown[jobnumber]["activities"][activitynumber] = {"description": desc, "hours": 0}
-    unknown[jobnumber]["activities"][activitynumber]["hours"] += hours
-
-    res['type'] = 'unknown'
     return res
 
 
@@ -191,37 +196,21 @@ def print_report(report, output_file=sys.stdout):
             print(f"  Received Rlön={month_data['Rlön']:.1f}h", file=output_file)
             print("", file=output_file)
 
-            grouped_month = {}
-            for record in month_data["records"]:
-                jobnum = record["jobnumber"]
-                actnum = record["activitynumber"]
-                taskname = record["taskname"]
-                if jobnum not in grouped_month:
-                    grouped_month[jobnum] = {}
-                if actnum not in grouped_month[jobnum]:
-                    grouped_month[jobnum][actnum] = {}
-                if taskname not in grouped_month[jobnum][actnum]:
-                    grouped_month[jobnum][actnum][taskname] = {
-                        'hours':0,
-                        'type':record['type'],
-                        'description': record['description']
-                    }
-                grouped_month[jobnum][actnum][taskname]['hours'] += record['hours']
-            print("  Monthly time sheet lines with hours combined:")
-            for jobnumber in grouped_month.keys():
-                for activitynumber in grouped_month[jobnumber].keys():
-                    for taskname in grouped_month[jobnumber][activitynumber].keys():
-                        hours = grouped_month[jobnumber][activitynumber][taskname]['hours']
-                        bonus_type = grouped_month[jobnumber][activitynumber][taskname]['type']
-                        desc = grouped_month[jobnumber][activitynumber][taskname]['description']
-                        if hours == 0:
-                            continue
-                        print(f"    {desc} - job={jobnumber}, activity={activitynumber}, task={taskname}, {hours=:.1f}, type={bonus_type}")
-
-        print(f"")
-        print(f"  {report['years'][year]['info']['Rtotal']}")
-        if 'Rtotal_december' in report['years'][year]['info']:
-            print(f"  {report['years'][year]['info']['Rtotal_december']}h carries over from December")
+            print("  Monthly time sheet lines with hours combined:", file=output_file)
+            for line in rollup_lines(month_data["rollup"]):
+                if line["hours"] == 0:
+                    continue
+                print(
+                    f"    {line['description']} - job={line['jobnumber']}, activity={line['activitynumber']},"
+                    f" task={line['taskname']}, hours={line['hours']:.1f}, type={line['type']}",
+                    file=output_file,
+                )
+
+        print(f"", file=output_file)
+        print(f"  {report['years'][year]['info']['Rtotal']}", file=output_file)
+        # evaluate_year keeps the December carry-over on the year, next to its info
+        if report['years'][year].get('Rtotal_december'):
+            print(f"  {report['years'][year]['Rtotal_december']:.1f}h carries over from December", file=output_file)
 
 
 def print_yearly_report(report, output_file=sys.stdout):
@@ -248,204 +237,475 @@ def print_yearly_report(report, output_file=sys.stdout):
         print(f"                 {rlon_count*rlon_val:.0f} kr", file=output_file)
 
 
-def calculate_years(records: dict[int, dict[int, dict[int, list[dict]]]], unknown: dict = {}):
+def new_month_sums() -> dict:
+    return {
+        "billed": 0,
+        "bonus": 0,
+        "non_bonus": 0,
+        "unknown": 0,
+        "rlon_billable": 0,
+        "rlin_vacation": 0,
+        "rlon_vacation": 0,
+        "vab_equivalent": 0,
+    }
+
+
+def add_to_rollup(rollup: dict, jobnumber, activitynumber, taskname, line_type, hours, desc):
+    """Add hours to a month's rollup, the hours combined by jobnumber, activitynumber, taskname and type.
+
+    The first line of each combination gives its description.
+    """
+
+    if jobnumber not in rollup:
+        rollup[jobnumber] = {}
+    if activitynumber not in rollup[jobnumber]:
+        rollup[jobnumber][activitynumber] = {}
+    if taskname not in rollup[jobnumber][activitynumber]:
+        rollup[jobnumber][activitynumber][taskname] = {}
+    types = rollup[jobnumber][activitynumber][taskname]
+    if line_type not in types:
+        types[line_type] = {"hours": 0, "description": desc}
+    types[line_type]["hours"] += hours
+
+
+def rollup_lines(rollup: dict):
+    """Iterate over a month's rollup as combined lines, dicts like the parsed lines of ``daily_result``."""
+
+    for jobnumber, activities in rollup.items():
+        for activitynumber, tasks in activities.items():
+            for taskname, types in tasks.items():
+                for line_type, line in types.items():
+                    yield {
+                        "jobnumber": jobnumber,
+                        "activitynumber": activitynumber,
+                        "taskname": taskname,
+                        "hours": line["hours"],
+                        "type": line_type,
+                        "description": line["description"],
+                    }
+
+
+def sum_month(
+    days: dict[int, list[dict]],
+    month: str,
+    last_day_was_billable: bool,
+    unknown: dict,
+    month_records: list | None,
+    month_rollup: dict | None = None,
+) -> tuple[dict, bool]:
+    """Classify and sum the timesheet lines of one month.
+
+    Args:
+        month_records (list | None): Receives the parsed lines, None to not keep them.
+        month_rollup (dict, optional): Receives the hours combined by jobnumber, activitynumber,
+            taskname and type, see ``add_to_rollup``.
+
+    Returns:
+        tuple[dict, bool]: The monthly sums and whether the last day of the month was billable.
+    """
+
+    sums = new_month_sums()
+    for day in days.keys():
+        day_is_billable = "No"
+        for record in days[day]:
+            parsed_record = daily_result(record, unknown)
+
+            if month_records is not None:
+                month_records.append(parsed_record)
+            hours = parsed_record["hours"]
+            match parsed_record["type"]:
+                case "internal":
+                    sums["non_bonus"] += hours
+                case "unknown":
+                    sums["unknown"] += hours
+                case "billable":
+                    sums["billed"] += hours
+                    sums["bonus"] += hours
+                    day_is_billable = "Yes"
+                case "vacation":
+                    sums["bonus"] += hours
+                    if last_day_was_billable:
+                        sums["rlon_vacation"] += hours
+                    if month in ["07", "08", "12", "01"]:
+                        sums["rlin_vacation"] += hours
+                    parsed_record["type"] += " /w bonus"
+                    day_is_billable = "Vacay"
+                case "förtroendeuppdrag":
+                    if last_day_was_billable:
+                        sums["bonus"] += hours
+                        sums["rlon_billable"] += hours
+                        parsed_record['type'] += " /w bonus"
+                    day_is_billable="Förtroendeuppdrag"
+                case "VAB":
+                    sums["vab_equivalent"] += hours
+                case "parental":
+                    sums["vab_equivalent"] += hours
+                case "bonus":
+                    sums["bonus"] += hours
+            if month_rollup is not None:
+                add_to_rollup(
+                    month_rollup,
+                    parsed_record["jobnumber"],
+                    parsed_record["activitynumber"],
+                    parsed_record["taskname"],
+                    parsed_record["type"],
+                    hours,
+                    parsed_record["description"],
+                )
+
+        # This is relevant for how to count vacay or fiduciary duties,
+        # as they count the same as "surrounding time".
+        # TODO: Inquire with finance on how this is calculated when ending
+        #       assignment during vacation.
+        if day_is_billable == "No":
+            last_day_was_billable = False
+        elif day_is_billable == "Yes":
+            last_day_was_billable = True
+
+    return sums, last_day_was_billable
+
+
+def new_report(rtot_val, rlin_val, rlon_val) -> dict:
+    report = {"info": {}, "years": {}}
+    report["info"]["Rtotal"] = rtot_val
+    report["info"]["Rlinear"] = rlin_val
+    report["info"]["Rlon"] = rlon_val
+    return report
+
+
+def model_rates(rtot_val: int, rlin_val: int) -> tuple[int, int, int]:
+    """The Rtotal, Rlinear and Rlön rates, with Rlön derived from the other two."""
+    rlon_val = math.ceil(rlin_val + rtot_val / 37)
+    return rtot_val, rlin_val, rlon_val
+
+
+def get_rates() -> tuple[int, int, int]:
     rtot_val = 2000
     rlin_val = 40
     if "RTOTAL" in os.environ:
         rtot_val = int(os.environ["RTOTAL"])
     if "RLIN" in os.environ:
         rlin_val = int(os.environ["RLIN"])
-    rlon_val = math.ceil(rlin_val + rtot_val / 37)
-
-    years = {}
-    report = {"info": {}, "years": {}}
-
-    report["info"]["Rtotal"] = rtot_val
-    report["info"]["Rlinear"] = rlin_val
-    report["info"]["Rlon"] = rlon_val
+    return model_rates(rtot_val, rlin_val)
+
+
+def evaluate_year(
+    year_report: dict,
+    year: str,
+    month_sums: dict[str, dict],
+    extra_bonus_hours_from_december,
+    work_schedule: schedule = None,
+):
+    """Apply the Rtotal, Rlinear and Rlön models to the monthly sums of one year.
+
+    This is the sequential part of the calculation: the Rtotal hour bank flows from month to month
+    and the December surplus flows into the next year. With a part-time schedule the hours of each
+    month are the scheduled ones, and the 130 hour thresholds are reduced by the same share.
+
+    Args:
+        year_report (dict): The ``report["years"][year]`` entry, filled in place.
+        year (str): The year being evaluated.
+        month_sums (dict[str, dict]): Monthly sums by month, see ``new_month_sums``.
+        extra_bonus_hours_from_december: Rtotal hours carried over from the previous year.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        Rtotal hours carried over into the next year.
+    """
+
+    year_bonus_hours = 0
+    year_lon_hours = 0
+    with stage("holidays", year=year):
+        hours_by_month, shares = monthly_hours(int(year), work_schedule)
+    rtot_bank = extra_bonus_hours_from_december  # extra hours not compensated are carried into the next year
+    rtot_count = 0.0
+    rlin_count = 0
+    rlon_count = 0
+    for month, sums in month_sums.items():
+        if month not in year_report["months"]:
+            year_report["months"][month] = {"rollup": {}}
+        month_report = year_report["months"][month]
+        monthly_billed_hours = sums["billed"]
+        monthly_bonus_hours = sums["bonus"]
+        vab_equivalent_hours = sums["vab_equivalent"]
+
+        hour_for_month = hours_by_month[int(month) - 1]
+        threshold = 130 * shares[int(month) - 1]
+        month_report["hours"] = hour_for_month
+
+        rtotal_required_hours = hour_for_month - vab_equivalent_hours
+        month_report["hours_adjusted_rtotal"] = rtotal_required_hours
+        if monthly_bonus_hours >= rtotal_required_hours:
+            rtot_increment = 1
+            if vab_equivalent_hours > 0:
+                rtot_increment = min(1.0, monthly_bonus_hours / hour_for_month)
+            rtot_count += 1
+            excess_bonus_hours = monthly_bonus_hours - rtotal_required_hours
+            month_report["Rtotal"] = "True, with %.1fh hours extra" % (excess_bonus_hours)
+            rtot_bank += excess_bonus_hours
+            extra_bonus_hours_from_december = excess_bonus_hours
+        else:
+            extra_bonus_hours_from_december = 0
+            if monthly_bonus_hours + rtot_bank >= rtotal_required_hours:
+                rtot_count += 1
+                month_report["Rtotal"] = "True, using %.1fh from hour bank" % (
+                    rtotal_required_hours - monthly_bonus_hours
+                )
+                rtot_bank -= rtotal_required_hours - monthly_bonus_hours
+            else:
+                month_report["Rtotal"] = False
+        year_bonus_hours += monthly_bonus_hours
+
+        rlin_threshold = threshold
+        if sums["rlin_vacation"] > 0:
+            rlin_threshold = max(min(threshold, monthly_billed_hours / hour_for_month * threshold), 0)
+        month_report["hours_adjusted_rlin"] = rlin_threshold
+        h_lin = max(monthly_billed_hours - rlin_threshold, 0)
+
+        month_report["hours_adjusted_rlon"] = threshold
+        h_lon = max(monthly_billed_hours + sums["rlon_vacation"] + sums["rlon_billable"] - threshold, 0)
+        year_lon_hours += monthly_billed_hours + sums["rlon_vacation"]
+        rlin_count += h_lin
+        rlon_count += h_lon
+        month_report["Rlin"] = h_lin
+        month_report["Rlön"] = h_lon
+        month_report["rtot_bank"] = rtot_bank
+
+    # Calculate year bonuses
+    yearly_hours = sum(hours_by_month)
+    if year_bonus_hours >= yearly_hours - 40:
+        if year_bonus_hours >= yearly_hours:
+            rtot_count = 12 + min(1, (year_bonus_hours - yearly_hours) / 168)
+            year_report["info"]["Rtotal"] = "More bonus hours than hours in year. Hard at work!"
+            extra_bonus_hours_from_december = (
+                0  # extra bonus hours only carry over if not paid out by excess hours previous year
+            )
+        else:
+            if rtot_count < 11:
+                year_report["info"]["Rtotal"] = (
+                    "Within 40 hours of all hours in year, meaning you got %d retroactively" % (11 - rtot_count)
+                )
+            else:
+                year_report["info"][
+                    "Rtotal"
+                ] = "Within 40 hours of all hours in year, but already received 11 Rtotal bonuses, so no adjustment made"
+            rtot_count = 11
+    else:
+        year_report["info"]["Rtotal"] = (
+            "You have %d bonus hours, you need %d (yearly hours - 40) to qualify for retroactive RTotal"
+            % (year_bonus_hours, (yearly_hours - 40))
+        )
+    year_report["info"]["Rtotal_payments"] = rtot_count
+    year_report["info"]["Rlinear_hours"] = rlin_count
+    year_report["info"]["Rlon_hours"] = rlon_count
+    year_report["info"]["Rtotal_hours_lost"] = year_bonus_hours - year_lon_hours
+    if extra_bonus_hours_from_december > 0:
+        year_report['Rtotal_december'] = extra_bonus_hours_from_december
+
+    return extra_bonus_hours_from_december
+
+
+def print_year_result(report: dict, year: str, unknown: dict, output_file=sys.stdout):
+    rtot_val = report["info"]["Rtotal"]
+    rlin_val = report["info"]["Rlinear"]
+    rlon_val = report["info"]["Rlon"]
+    rtot_count = report["years"][year]["info"]["Rtotal_payments"]
+    rlin_count = report["years"][year]["info"]["Rlinear_hours"]
+    rlon_count = report["years"][year]["info"]["Rlon_hours"]
+    rtot_hours_lost = report["years"][year]["info"]["Rtotal_hours_lost"]
+
+    print(f"-- {year} --", file=output_file)
+    print(f"  Rtotal payments: {colored(rtot_count, _rtotal_color)}st", file=output_file)
+    print(f"  Rlinear hours:   {colored(f'{rlin_count:.1f}', _rlin_color)}h", file=output_file)
+    print(f"  Rlön hours:      {colored(f'{rlon_count:.1f}', _rlon_color)}h", file=output_file)
+    if rtot_hours_lost != 0:
+        print(f"  Previous Rtotal hours lost: {colored(f'{rtot_hours_lost:.1f}', 'red')}h", file=output_file)
+    if len(unknown.keys()) > 0:
+        print(f"  {json.dumps(unknown, indent=2)}", file=output_file)
+    print("", file=output_file)
+
+    curr_color = 'green'
+    new_color = 'red'
+    if rtot_count*rtot_val + rlin_count*rlin_val < rlon_count*rlon_val:
+        curr_color = 'red'
+        new_color = 'green'
+
+    print(f"  Total current: {rtot_count:.1f}*{rtot_val} + {rlin_count:.1f}*{rlin_val}=", file=output_file)
+    print(
+        f"                 {colored(f'{rtot_count*rtot_val + rlin_count*rlin_val:.0f}', curr_color)} kr",
+        file=output_file,
+    )
+    print(f"  Total new:     {rlon_count:.1f}*{rlon_val}=", file=output_file)
+    print(f"                 {colored(f'{rlon_count*rlon_val:.0f}', new_color)} kr", file=output_file)
+
+
+def calculate_years(
+    records: dict[str, dict[str, dict[str, list[timeline_sheet_record]]]],
+    unknown: dict = None,
+    output_file=sys.stdout,
+    keep_records: bool = True,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+):
+    """Run the models on the timesheet lines grouped by ``sort_records``.
+
+    Each month of the report holds a ``rollup``, the hours combined by jobnumber, activitynumber,
+    taskname and type (see ``add_to_rollup``), and unless ``keep_records`` is False also every parsed
+    line in ``records``.
+
+    Args:
+        records (dict): Timesheet lines grouped by ``sort_records``.
+        unknown (dict, optional): Filled with the hours of unclassified job/activity numbers.
+        output_file (optional): Where the yearly results are printed, None to print nothing.
+        keep_records (bool, optional): Keep the parsed lines of each month. Defaults to True.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to
+            the rates of envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+    """
+
+    if unknown is None:
+        unknown = {}
+    if rates is None:
+        rates = get_rates()
+    report = new_report(*rates)
 
     extra_bonus_hours_from_december = 0
     last_day_was_billable=False
     for year in records.keys():
         if year not in report["years"]:
             report["years"][year] = {"info": {}, "months": {}}
-        year_bonus_hours = 0
-        year_lon_hours = 0
-        hours_by_month: list[int] = get_monthly_billable_hours_by_year(int(year))
-        rtot_bank = extra_bonus_hours_from_december  # extra hours not compensated are carried into the next year
-        rtot_count = 0.0
-        rlin_count = 0
-        rlon_count = 0
+        month_sums = {}
         for month in records[year].keys():
             if month not in report["years"][year]["months"]:
-                report["years"][year]["months"][month] = {"records": []}
-            rlon_billable = 0
-            monthly_billed_hours = 0
-            monthly_bonus_hours = 0
-            monthly_non_bonus_hours = 0
-            monthly_unknown_hours = 0
-            rlin_vacation_hours = 0
-            rlon_vacation_hours = 0
-            vab_equivalent_hours = 0
-
-            for day in records[year][month].keys():
-                day_is_billable = "No"
-                for record in records[year][month][day]:
-                    parsed_record = daily_result(record, unknown)
-
-                    report["years"][year]["months"][month]["records"].append(parsed_record)
-                    match parsed_record["type"]:
-                        case "internal":
-                            monthly_non_bonus_hours += parsed_record["hours"]
-                        case "unknown":
-                            monthly_unknown_hours += parsed_record["hours"]
-                        case "billable":
-                            monthly_billed_hours += parsed_record["hours"]
-                            monthly_bonus_hours += parsed_record["hours"]
-                            day_is_billable = "Yes"
-                        case "vacation":
-                            monthly_bonus_hours += parsed_record["hours"]
-                            if last_day_was_billable:
-                                rlon_vacation_hours += parsed_record["hours"]
-                            if month in ["07", "08", "12", "01"]:
-                                rlin_vacation_hours += parsed_record["hours"]
-                            parsed_record["type"] += " /w bonus"
-                            day_is_billable = "Vacay"
-                        case "förtroendeuppdrag":
-                            if last_day_was_billable:
-                                monthly_bonus_hours += parsed_record['hours']
-                                rlon_billable += parsed_record['hours']
-                                parsed_record['type'] += " /w bonus"
-                            day_is_billable="Förtroendeuppdrag"
-                        case "VAB":
-                            vab_equivalent_hours += parsed_record['hours']
-                        case "parental":
-                            vab_equivalent_hours += parsed_record['hours']
-                        case "bonus":
-                            monthly_bonus_hours += parsed_record["hours"]
-
-                # This is relevant for how to count vacay or fiduciary duties,
-                # as they count the same as "surrounding time".
-                # TODO: Inquire with finance on how this is calculated when ending
-                #       assignment during vacation.
-                if day_is_billable == "No":
-                    last_day_was_billable = False
-                elif day_is_billable == "Yes":
-                    last_day_was_billable = True
-
-            hour_for_month = hours_by_month[int(month) - 1]
-            report["years"][year]["months"][month]["hours"] = hour_for_month
-
-            rtotal_required_hours = hour_for_month - vab_equivalent_hours
-            report["years"][year]["months"][month]["hours_adjusted_rtotal"] = rtotal_required_hours
-            if monthly_bonus_hours >= rtotal_required_hours:
-                rtot_increment = 1
-                if vab_equivalent_hours > 0:
-                    rtot_increment = min(1.0, monthly_bonus_hours / hour_for_month)
-                rtot_count += 1
-                excess_bonus_hours = monthly_bonus_hours - rtotal_required_hours
-                report["years"][year]["months"][month]["Rtotal"] = "True, with %.1fh hours extra" % (excess_bonus_hours)
-                rtot_bank += excess_bonus_hours
-                extra_bonus_hours_from_december = excess_bonus_hours
-            else:
-                extra_bonus_hours_from_december = 0
-                if monthly_bonus_hours + rtot_bank >= rtotal_required_hours:
-                    rtot_count += 1
-                    report["years"][year]["months"][month]["Rtotal"] = "True, using %.1fh from hour bank" % (
-                        rtotal_required_hours - monthly_bonus_hours
-                    )
-                    rtot_bank -= rtotal_required_hours - monthly_bonus_hours
-                else:
-                    report["years"][year]["months"][month]["Rtotal"] = False
-            year_bonus_hours += monthly_bonus_hours
-
-            rlin_threshold = 130
-            if rlin_vacation_hours > 0:
-                rlin_threshold = max(min(130, monthly_billed_hours / hour_for_month * 130), 0)
-            report["years"][year]["months"][month]["hours_adjusted_rlin"] = rlin_threshold
-            h_lin = max(monthly_billed_hours - rlin_threshold, 0)
-
-            report["years"][year]["months"][month]["hours_adjusted_rlon"] = 130
-            h_lon = max(monthly_billed_hours + rlon_vacation_hours + rlon_billable - 130, 0)
-            year_lon_hours += monthly_billed_hours + rlon_vacation_hours
-            rlin_count += h_lin
-            rlon_count += h_lon
-            report["years"][year]["months"][month]["Rlin"] = h_lin
-            report["years"][year]["months"][month]["Rlön"] = h_lon
-            report["years"][year]["months"][month]["rtot_bank"] = rtot_bank
-
-        # Calculate year bonuses
-        yearly_hours = sum(hours_by_month)
-        if year_bonus_hours >= yearly_hours - 40:
-            if year_bonus_hours >= yearly_hours:
-                rtot_count = 12 + min(1, (year_bonus_hours - yearly_hours) / 168)
-                report["years"][year]["info"]["Rtotal"] = "More bonus hours than hours in year. Hard at work!"
-                extra_bonus_hours_from_december = (
-                    0  # extra bonus hours only carry over if not paid out by excess hours previous year
+                report["years"][year]["months"][month] = {"records": []} if keep_records else {}
+            month_rollup = {}
+            with stage("classify", year=year, month=month):
+                month_sums[month], last_day_was_billable = sum_month(
+                    records[year][month],
+                    month,
+                    last_day_was_billable,
+                    unknown,
+                    report["years"][year]["months"][month].get("records"),
+                    month_rollup,
                 )
-            else:
-                if rtot_count < 11:
-                    report["years"][year]["info"]["Rtotal"] = (
-                        "Within 40 hours of all hours in year, meaning you got %d retroactively" % (11 - rtot_count)
-                    )
-                else:
-                    report["years"][year]["info"][
-                        "Rtotal"
-                    ] = "Within 40 hours of all hours in year, but already received 11 Rtotal bonuses, so no adjustment made"
-                rtot_count = 11
-        else:
-            report["years"][year]["info"]["Rtotal"] = (
-                "You have %d bonus hours, you need %d (yearly hours - 40) to qualify for retroactive RTotal"
-                % (year_bonus_hours, (yearly_hours - 40))
+            report["years"][year]["months"][month]["rollup"] = month_rollup
+
+        with stage("model", year=year):
+            extra_bonus_hours_from_december = evaluate_year(
+                report["years"][year], year, month_sums, extra_bonus_hours_from_december, work_schedule
             )
-        years[year] = {"rtot": rtot_count, "rlin": rlin_count, "rlon": rlon_count}
-        if extra_bonus_hours_from_december > 0:
-            report["years"][year]['Rtotal_december'] = extra_bonus_hours_from_december
-
-        print(f"-- {year} --")
-        print(f"  Rtotal payments: {colored(rtot_count, _rtotal_color)}st")
-        print(f"  Rlinear hours:   {colored(f'{rlin_count:.1f}', _rlin_color)}h")
-        print(f"  Rlön hours:      {colored(f'{rlon_count:.1f}', _rlon_color)}h")
-        if year_lon_hours != year_bonus_hours:
-            rtot_hours_lost= year_bonus_hours - year_lon_hours
-            print(f"  Previous Rtotal hours lost: {colored(f'{rtot_hours_lost:.1f}', 'red')}h")
-        if len(unknown.keys()) > 0:
-            print(f"  {json.dumps(unknown, indent=2)}")
-        print("")
-        
-        curr_color = 'green'
-        new_color = 'red'
-        if rtot_count*rtot_val + rlin_count*rlin_val < rlon_count*rlon_val:
-            curr_color = 'red'
-            new_color = 'green'
-            
-        print(f"  Total current: {rtot_count:.1f}*{rtot_val} + {rlin_count:.1f}*{rlin_val}=")
-        print(f"                 {colored(f'{rtot_count*rtot_val + rlin_count*rlin_val:.0f}', curr_color)} kr")
-        print(f"  Total new:     {rlon_count:.1f}*{rlon_val}=")
-        print(f"                 {colored(f'{rlon_count*rlon_val:.0f}', new_color)} kr")
+
+        if output_file is not None:
+            with stage("render", year=year):
+                print_year_result(report, year, unknown, output_file)
     return report
 
 
-def sort_records(records: list[dict]) -> dict:
+def sort_records(records: list[dict] | list[timeline_sheet_record]) -> dict:
+    """Group the timesheet lines by year, month and day, as compact ``timeline_sheet_record`` lines."""
     sorted_records = {}
-    current_year = 0
-    current_month = 0
-    for record in records:
-        data = record["data"]
-        year, month, day = tuple(data["thedate"].split("-"))
+    with stage("sort"):
+        for record in records:
+            if isinstance(record, timeline_sheet_record):
+                data = record
+            else:
+                data = timeline_sheet_record.from_deltek(record["data"])
+            year, month, day = tuple(data.date.split("-"))
 
-        if year not in sorted_records:
-            sorted_records[year] = {}
-        if month not in sorted_records[year]:
-            sorted_records[year][month] = {}
-        if day not in sorted_records[year][month]:
-            sorted_records[year][month][day] = []
+            if year not in sorted_records:
+                sorted_records[year] = {}
+            if month not in sorted_records[year]:
+                sorted_records[year][month] = {}
+            if day not in sorted_records[year][month]:
+                sorted_records[year][month][day] = []
 
-        sorted_records[year][month][day].append(data)
+            sorted_records[year][month][day].append(data)
 
     return sorted_records
 
 
+def selected_engine() -> str:
+    """The calculation engine set with envar ENGINE: python (default), numpy, streaming, incremental, sqlite
+    or parallel."""
+    engines = ["numpy", "streaming", "incremental", "sqlite", "parallel"]
+    if "ENGINE" in os.environ and os.environ["ENGINE"].lower() in engines:
+        return os.environ["ENGINE"].lower()
+    return "python"
+
+
+def read_records(username: str = "", password: str = ""):
+    if sync_active():
+        return sync_dailysheetlines(username=username, password=password)
+    if selected_engine() == "streaming":
+        return stream_dailysheetlines(username=username, password=password)
+    return read_dailysheetlines(username=username, password=password)
+
+
+def store_file() -> str:
+    """The SQLite store used by ENGINE=sqlite, set with envar TIMESHEET_STORE."""
+    return os.environ["TIMESHEET_STORE"] if "TIMESHEET_STORE" in os.environ else "timesheets.db"
+
+
+def run_engine(
+    records,
+    unknown: dict = None,
+    output_file=sys.stdout,
+    checkpoint_file: str = "checkpoints.json",
+    employee: str = "me",
+    keep_records: bool = True,
+    rates: tuple[int, int, int] = None,
+) -> dict:
+    """Run the models on the timesheet records with the engine selected by envar ENGINE.
+
+    Only the python engine keeps the parsed lines of each month, and only with ``keep_records``,
+    the others keep just the ``rollup``. The employee's part-time schedule is taken from the file in
+    envar SCHEDULES, see ``work_calendar``. Every engine uses ``rates`` when given, otherwise the rates
+    of envars RTOTAL and RLIN.
+    """
+    if unknown is None:
+        unknown = {}
+    work_schedule = employee_schedule(employee)
+    engine = selected_engine()
+    with stage("calculate", engine=engine):
+        match engine:
+            case "numpy":
+                from numpy_engine import calculate_years_vectorized
+
+                return calculate_years_vectorized(records, unknown, output_file, rates, work_schedule)
+            case "streaming":
+                from streaming import calculate_years_streaming
+
+                return calculate_years_streaming(records, unknown, output_file, rates, work_schedule)
+            case "incremental":
+                from incremental import calculate_years_incremental
+
+                if not isinstance(records, dict):
+                    records = sort_records(records)
+                return calculate_years_incremental(
+                    records, unknown, output_file, checkpoint_file, rates=rates, work_schedule=work_schedule
+                )
+            case "sqlite":
+                from contextlib import closing
+
+                from timesheet_store import calculate_years_store, open_store, store_records
+
+                with closing(open_store(store_file())) as conn:
+                    store_records(conn, employee, records)
+                    return calculate_years_store(conn, employee, unknown, output_file, rates, work_schedule)
+            case "parallel":
+                from parallel_years import calculate_years_parallel
+
+                if not isinstance(records, dict):
+                    records = sort_records(records)
+                return calculate_years_parallel(records, unknown, output_file, rates=rates, work_schedule=work_schedule)
+            case _:
+                if not isinstance(records, dict):
+                    records = sort_records(records)
+                return calculate_years(records, unknown, output_file, keep_records, rates, work_schedule)
+
+
 def the_main_program():
     
     print("")
@@ -458,12 +718,13 @@ def the_main_program():
     print("")
     print("  This programm will is inteded to compare the current traditional salary model")
     print("  with the proposed changes to the salary model.")
-    print("  NOTE: Some features are not implemented, such as part-time parental leave or part-time leave.")
+    print("  NOTE: Part-time work or part-time parental leave is only taken into account when listed in the")
+    print("        schedules file in envar SCHEDULES.")
     print("")
 
     records = []
     try:
-        records = read_dailysheetlines()
+        records = read_records()
     except Exception:
         print("")
         print("  This program will use your Deltek credentials to download your reported timesheet lines.")
@@ -472,7 +733,7 @@ def the_main_program():
         username = input("Enter Deltek username: ")
         password = getpass()
         try:
-            records = read_dailysheetlines(username=username, password=password)
+            records = read_records(username=username, password=password)
         except UnauthorizedException as ue:
             print("Unable to execute program")
             print("  Could not download time sheets due to: ")
@@ -487,14 +748,19 @@ def the_main_program():
             print("exiting...")
             return
 
-    records = sort_records(records)
+    if selected_engine() in ["python", "incremental", "sqlite", "parallel"]:
+        # Only the compact lines are kept, the raw Deltek records can be freed
+        records = sort_records(records)
 
     print("")
-    report = calculate_years(records)
+    # The monthly breakdown is printed from the rollup, the parsed lines are not needed
+    report = run_engine(records, keep_records=False)
     if True or "VERBOSE" in os.environ and os.environ["VERBOSE"].lower() == "true":
         print("")
         input("Press enter to diplay monthly breakdown")
-        print_report(report)
+        with stage("render"):
+            print_report(report)
+    write_profile()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+"""Regression check that every calculation engine gives exactly the results of ``calculate_years``.
+
+Each engine that can be selected with ENGINE runs through ``run_engine`` on synthetic employees (see
+``synthetic_timesheets.py``), and its report, unknown timecodes and printed results are compared with those of
+``calculate_years`` with ``keep_records=False``. The incremental engine runs twice, the second time from its
+checkpoints. The synthetic hours are whole and half hours, which add up the same in any order, so every history
+is also checked with a tenth of an hour added to each line, to catch an engine that sums in another order.
+
+    python check_engines.py --employees 20 --years 6
+
+Prints the mismatches and exits with status 1 when there are any.
+"""
+
+import argparse
+import copy
+import io
+import json
+import os
+import sys
+import tempfile
+
+from bonusmodel_v1 import calculate_years, print_report, run_engine, sort_records
+from synthetic_timesheets import generate_records
+
+ENGINES = ["python", "numpy", "streaming", "incremental", "sqlite", "parallel"]
+
+
+def add_tenth(records: list[dict]) -> list[dict]:
+    """The records with a tenth of an hour added to every line."""
+
+    records = copy.deepcopy(records)
+    for record in records:
+        record["data"]["numbertransferred"] += 0.1
+    return records
+
+
+def results(report: dict, unknown: dict, output: str) -> dict:
+    """What is compared between the engines: the report, the unknown timecodes and everything printed."""
+
+    printed = io.StringIO()
+    print_report(report, printed)
+    return {
+        "report": json.dumps(report, sort_keys=True),
+        "unknown": json.dumps(unknown, sort_keys=True),
+        "yearly output": output,
+        "report output": printed.getvalue(),
+    }
+
+
+def engine_results(engine: str, records: list[dict], work_dir: str, employee: str) -> dict:
+    os.environ["ENGINE"] = engine
+    unknown = {}
+    output = io.StringIO()
+    report = run_engine(
+        copy.deepcopy(records),
+        unknown,
+        output,
+        checkpoint_file=os.path.join(work_dir, f"{employee}.checkpoints.json"),
+        employee=employee,
+        keep_records=False,
+    )
+    return results(report, unknown, output.getvalue())
+
+
+def check_employee(records: list[dict], engines: list[str], work_dir: str, employee: str) -> list[str]:
+    """The mismatches of the engines with ``calculate_years`` on one history, as messages."""
+
+    unknown = {}
+    output = io.StringIO()
+    report = calculate_years(sort_records(copy.deepcopy(records)), unknown, output, keep_records=False)
+    expected = results(report, unknown, output.getvalue())
+
+    mismatches = []
+    for engine in engines:
+        runs = ["", " (from checkpoints)"] if engine == "incremental" else [""]
+        for run in runs:
+            actual = engine_results(engine, records, work_dir, employee)
+            for name, value in expected.items():
+                if actual[name] != value:
+                    mismatches.append(f"{employee}: {engine}{run} differs in the {name}")
+    return mismatches
+
+
+def check_engines(employees: int, years: int, engines: list[str] = ENGINES, start_year: int = 2019) -> list[str]:
+    """Run the engines on synthetic employees, as generated and with a tenth of an hour added to every line.
+
+    Args:
+        employees (int): Number of synthetic employees, seeded 0, 1, ...
+        years (int): Length of each history in years.
+        engines (list[str], optional): The engines to check. Defaults to all of them.
+        start_year (int, optional): First year of the histories. Defaults to 2019.
+
+    Returns:
+        list[str]: The mismatches, empty when every engine matched.
+    """
+
+    previous = {name: os.environ.get(name) for name in ("ENGINE", "TIMESHEET_STORE")}
+    mismatches = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            os.environ["TIMESHEET_STORE"] = os.path.join(work_dir, "timesheets.db")
+            for seed in range(employees):
+                records = generate_records(seed, start_year, years)
+                mismatches += check_employee(records, engines, work_dir, f"emp{seed:04d}")
+                mismatches += check_employee(add_tenth(records), engines, work_dir, f"emp{seed:04d}.tenth")
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every engine gives the results of calculate_years.")
+    parser.add_argument("-n", "--employees", type=int, default=10, help="Number of employees (default: 10)")
+    parser.add_argument("--years", type=int, default=6, help="Number of years (default: 6)")
+    parser.add_argument(
+        "--engines", default=",".join(ENGINES), help=f"Engines to check (default: {','.join(ENGINES)})"
+    )
+    args = parser.parse_args()
+
+    engines = args.engines.split(",")
+    for engine in engines:
+        if engine not in ENGINES:
+            raise Exception(f"Unknown engine {engine}")
+    mismatches = check_engines(args.employees, args.years, engines)
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(engines)} engines on {args.employees} employees: {len(mismatches)} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,19 @@
 import base64
 import json
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from json_stream import iter_file_records
+from profiling import stage
+from timecode_mapping import timeline_sheet_record
+from timesheet_cache import read_cache, write_cache
 
 
 class UnauthorizedException(Exception):
@@ -19,6 +30,10 @@ def verbose_active() -> bool:
     return "VERBOSE" in os.environ and os.environ["VERBOSE"].lower() == "true"
 
 
+def sync_active() -> bool:
+    return "DELTEK_SYNC" in os.environ and os.environ["DELTEK_SYNC"].lower() == "true"
+
+
 def construct_auth_credentials(encoded_credentials: str = "", username: str = "", password: str = "") -> str:
     if not encoded_credentials and "DELTEK_CREDENTIALS" in os.environ:
         encoded_credentials = os.environ["DELTEK_CREDENTIALS"]
@@ -37,17 +52,76 @@ def construct_auth_credentials(encoded_credentials: str = "", username: str = ""
     return encoded_credentials
 
 
-def deltek_request(url: str, encoded_credentials: str) -> dict:
+DELTEK_URL = "https://me52774-webclient.deltekfirst.com/maconomy-api/containers/me52774"
+PAGE_SIZE = 1000
+DOWNLOAD_WORKERS = 4
+# Lines this many days before the latest cached line are downloaded again on sync, as they can still be edited
+SYNC_LOOKBACK_DAYS = 35
+# The fields of a timesheet line the models read, and those identifying a line on sync. Only these are downloaded.
+FIELDS = [
+    "instancekey",
+    "linenumber",
+    "thedate",
+    "jobnumber",
+    "description",
+    "activitynumber",
+    "taskname",
+    "entrytext",
+    "numbertransferred",
+    "invoiceable",
+    "internaljob",
+]
+# Pages are fetched by offset, concurrently, so every page must come from the same stable order. Date order also
+# keeps the lines of a day and a month together, as ENGINE=streaming requires.
+ORDER_BY = "thedate, linenumber, instancekey"
+
+_session = None
+
+
+def deltek_url() -> str:
+    """Base URL of the Maconomy containers, overridden with envar DELTEK_URL."""
+    return os.environ["DELTEK_URL"] if "DELTEK_URL" in os.environ else DELTEK_URL
+
+
+def get_session() -> requests.Session:
+    """The shared session, which keeps connections to Deltek alive and retries transient errors.
+
+    Connection errors and 429/5xx responses are retried up to five times with exponential backoff,
+    honouring any Retry-After header.
+    """
 
-    headers = {
-        "Authorization": f"Basic {encoded_credentials}",
-        "Accept-Language": "en-US",
-        "Accept": "application/vnd.deltek.maconomy.containers-v2+json",
-    }
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=DOWNLOAD_WORKERS, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(
+            {
+                "Accept-Language": "en-US",
+                "Accept": "application/vnd.deltek.maconomy.containers-v2+json",
+                # The JSON compresses around tenfold, requests decompresses it as it is read
+                "Accept-Encoding": "gzip, deflate",
+            }
+        )
+        _session = session
+    return _session
+
+
+def deltek_request(url: str, encoded_credentials: str, params: dict = None) -> dict:
 
     if verbose_active():
-        print(f">> Outgoing request to {url}")
-    response = requests.get(url, headers=headers, timeout=30)
+        print(f">> Outgoing request to {url} {params if params else ''}")
+    response = get_session().get(
+        url, headers={"Authorization": f"Basic {encoded_credentials}"}, params=params, timeout=(10, 30)
+    )
 
     if response.status_code == 401:
         err = response.json()
@@ -62,7 +136,234 @@ def deltek_request(url: str, encoded_credentials: str) -> dict:
     return response.json()
 
 
-def read_dailysheetlines(username: str = "", password: str = "") -> list[dict]:
+def _restriction_date(day: str) -> str:
+    year, month, day = day.split("-")
+    return f"date({int(year)}, {int(month)}, {int(day)})"
+
+
+def date_restriction(since: str = "", until: str = "") -> str:
+    """Filter restriction for the timesheet lines dated from ``since`` to ``until`` (YYYY-MM-DD), both included.
+
+    Either end can be left out, with neither the restriction is empty.
+    """
+    conditions = []
+    if since:
+        conditions.append(f"thedate >= {_restriction_date(since)}")
+    if until:
+        conditions.append(f"thedate <= {_restriction_date(until)}")
+    return " and ".join(conditions)
+
+
+def download_range() -> tuple[str, str]:
+    """The dates to download lines from and to, set with envars DELTEK_FROM and DELTEK_TO.
+
+    Each is a date (YYYY-MM-DD) or a year, meaning its first day for DELTEK_FROM and its last for DELTEK_TO.
+    Empty when not set.
+    """
+    since = os.environ["DELTEK_FROM"] if "DELTEK_FROM" in os.environ else ""
+    until = os.environ["DELTEK_TO"] if "DELTEK_TO" in os.environ else ""
+    if len(since) == 4:
+        since = f"{since}-01-01"
+    if len(until) == 4:
+        until = f"{until}-12-31"
+    return since, until
+
+
+def fetch_dailysheetlines_page(
+    encoded_credentials: str, offset: int, page_size: int = PAGE_SIZE, restriction: str = ""
+) -> list[dict]:
+    """Fetch one page of timesheet records, starting at record number ``offset`` in ``ORDER_BY`` order, with
+    only the ``FIELDS``."""
+
+    url = f"{deltek_url()}/dailytimesheetlines/filter"
+    params = {"offset": offset, "limit": page_size, "fields": ",".join(FIELDS), "orderby": ORDER_BY}
+    if restriction:
+        params["restriction"] = restriction
+    timetable = deltek_request(url, encoded_credentials, params=params)
+    return timetable["panes"]["filter"]["records"]
+
+
+def download_dailysheetlines(
+    encoded_credentials: str, page_size: int = PAGE_SIZE, workers: int = DOWNLOAD_WORKERS, restriction: str = ""
+) -> Iterator[list[dict]]:
+    """Download the timesheet records page by page.
+
+    The first page is fetched right away, so authentication errors are raised before this returns.
+    After that up to ``workers`` pages are requested at a time over the pooled session, until a page
+    comes back short.
+
+    Args:
+        encoded_credentials (str): base64 encoded credentials.
+        page_size (int, optional): Records per request. Defaults to PAGE_SIZE.
+        workers (int, optional): Number of pages requested at a time. Defaults to DOWNLOAD_WORKERS.
+        restriction (str, optional): Filter restriction, for example from ``date_restriction``.
+
+    Returns:
+        Iterator[list[dict]]: The pages of timesheet records, in order.
+    """
+
+    first_page = fetch_dailysheetlines_page(encoded_credentials, 0, page_size, restriction)
+    return _iter_pages(encoded_credentials, first_page, page_size, workers, restriction)
+
+
+def _iter_pages(
+    encoded_credentials: str, first_page: list[dict], page_size: int, workers: int, restriction: str
+) -> Iterator[list]:
+    yield first_page
+    if len(first_page) < page_size:
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        next_offset = page_size
+        while True:
+            # Keep the pool busy with the pages following the one being waited for
+            while len(pending) < workers:
+                page_request = (encoded_credentials, next_offset, page_size, restriction)
+                pending.append(executor.submit(fetch_dailysheetlines_page, *page_request))
+                next_offset += page_size
+            page = pending.popleft().result()
+            if page:
+                yield page
+            if len(page) < page_size:
+                for future in pending:
+                    future.cancel()
+                return
+
+
+def _pages_to_cache(pages: Iterator[list[dict]], cache_file: str) -> Iterator[dict]:
+    partial_file = cache_file + ".partial"
+    with open(partial_file, "w") as fp:
+        fp.write('{"panes": {"filter": {"records": [')
+        separator = ""
+        for page in pages:
+            for record in page:
+                fp.write(separator)
+                fp.write(json.dumps(record))
+                separator = ", "
+                yield record
+        fp.write("]}}}")
+    os.replace(partial_file, cache_file)
+
+
+def stream_dailysheetlines(
+    username: str = "", password: str = "", cache_file: str = "timesheets.json"
+) -> Iterator[dict]:
+    """Stream the timesheet records one by one, from the cached file or straight from Deltek Maconomy.
+
+    When downloading, the records are written to the cache file as the pages arrive, so only the pages
+    in flight are ever held in memory. Credentials are supplied as for ``read_dailysheetlines``, and
+    authentication errors are raised before this returns.
+
+    Returns:
+        Iterator[dict]: Timesheet records, in the same form as the elements of ``read_dailysheetlines``.
+    """
+
+    if os.path.exists(cache_file) and os.path.getsize(cache_file) > 0:
+        if verbose_active():
+            print("Timesheet streamed from cached file")
+        return iter_file_records(cache_file)
+
+    encoded_credentials = construct_auth_credentials(username=username, password=password)
+
+    restriction = date_restriction(*download_range())
+    return _pages_to_cache(download_dailysheetlines(encoded_credentials, restriction=restriction), cache_file)
+
+
+def line_identity(record: dict):
+    """What identifies a timesheet line across downloads, its instance key when Deltek provides one."""
+    data = record["data"]
+    if "instancekey" in data:
+        return data["instancekey"]
+    return (data["thedate"], data["jobnumber"], data["activitynumber"], data["taskname"], data.get("linenumber"))
+
+
+def merge_records(cached: list[dict], fresh: list[dict], since: str) -> list[dict]:
+    """Merge the lines downloaded from ``since`` (YYYY-MM-DD) on into the cached lines.
+
+    A fresh line replaces the cached line with the same identity, wherever its date was. Cached lines
+    dated ``since`` or later that were not downloaded again have been removed in Deltek and are dropped.
+    """
+
+    fresh_identities = {line_identity(record) for record in fresh}
+    kept = [
+        record
+        for record in cached
+        if record["data"]["thedate"] < since and line_identity(record) not in fresh_identities
+    ]
+    return kept + fresh
+
+
+def sync_dailysheetlines(
+    username: str = "",
+    password: str = "",
+    cache_file: str = "timesheets.json",
+    lookback_days: int = SYNC_LOOKBACK_DAYS,
+) -> list[dict]:
+    """Bring the cached timesheet lines up to date with Deltek Maconomy and return them.
+
+    The date of the latest cached line is kept in the cache as its high-water mark. Only the lines from
+    ``lookback_days`` before it and onward are downloaded, and merged into the cache by line identity.
+    Without a cache the whole history is downloaded. Credentials are supplied as for ``read_dailysheetlines``.
+
+    Returns:
+        list[dict]: List of timetable records.
+    """
+
+    cached = []
+    highwater = None
+    try:
+        with open(cache_file, "r") as fp, stage("parse", source=cache_file):
+            timetable = json.load(fp)
+        cached = timetable["panes"]["filter"]["records"]
+        if "sync" in timetable:
+            highwater = timetable["sync"]["highwater"]
+        elif cached:
+            highwater = max(record["data"]["thedate"] for record in cached)
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    encoded_credentials = construct_auth_credentials(username=username, password=password)
+
+    if highwater is None:
+        since, _ = download_range()
+        with stage("download"):
+            pages = download_dailysheetlines(encoded_credentials, restriction=date_restriction(since))
+            records = [record for page in pages for record in page]
+        if verbose_active():
+            print(f"Downloaded {len(records)} timesheet lines")
+    else:
+        since = (date.fromisoformat(highwater) - timedelta(days=lookback_days)).isoformat()
+        with stage("download", since=since):
+            pages = download_dailysheetlines(encoded_credentials, restriction=date_restriction(since))
+            fresh = [record for page in pages for record in page]
+        records = merge_records(cached, fresh, since)
+        if verbose_active():
+            print(f"Synced {len(fresh)} timesheet lines from {since}")
+
+    highwater = max((record["data"]["thedate"] for record in records), default=None)
+    partial_file = cache_file + ".partial"
+    # json.dumps encodes in C, json.dump would go through the pure Python encoder
+    dump = json.dumps({"panes": {"filter": {"records": records}}, "sync": {"highwater": highwater}})
+    with open(partial_file, "w") as fp:
+        fp.write(dump)
+    os.replace(partial_file, cache_file)
+
+    return records
+
+
+def read_binary_cache(cache_file: str = "timesheets.bin", json_file: str = "timesheets.json"):
+    """The lines of the binary cache, or None when it is missing or older than the JSON cache."""
+    # The JSON cache is newer after a sync, the binary cache is then rebuilt from it
+    if os.path.exists(cache_file) and os.path.exists(json_file):
+        if os.path.getmtime(json_file) > os.path.getmtime(cache_file):
+            return None
+    return read_cache(cache_file)
+
+
+def read_dailysheetlines(
+    username: str = "", password: str = "", use_binary_cache: bool = True
+) -> list[dict] | list[timeline_sheet_record]:
     """
     Read user timetables from Deltek Maconomy.
 
@@ -81,35 +382,52 @@ def read_dailysheetlines(username: str = "", password: str = "") -> list[dict]:
         encoded_credentials (str, optional): base64 encoded credentials. Defaults to "".
         username (str, optional): Username in clear text. Defaults to "".
         password (str, optional): Password in clear text. Defaults to "".
+        use_binary_cache (bool, optional): Load the lines from timesheets.bin when it is up to date, and
+            write it for the next run. Defaults to True.
 
     Raises:
         Exception: Thrown when no valid authentication was provided.
         Exception: Thrown when the HTTP request fails.
 
     Returns:
-        list[dict]: List of timetable records.
+        list[dict] | list[timeline_sheet_record]: List of timetable records, or of compact lines when
+            loaded from the binary cache.
     """
 
+    if use_binary_cache:
+        with stage("parse", source="timesheets.bin"):
+            lines = read_binary_cache()
+        if lines is not None:
+            if verbose_active():
+                print("Timesheet loaded from binary cache")
+            return lines
+
     try:
-        with open("timesheets.json", "r") as fp:
+        with open("timesheets.json", "r") as fp, stage("parse", source="timesheets.json"):
             data = json.load(fp)
             if data:
                 if verbose_active():
                     print("Timesheet loaded from cached file")
-                return data["panes"]["filter"]["records"]
+                records = data["panes"]["filter"]["records"]
+                if use_binary_cache:
+                    with stage("cache"):
+                        write_cache(records, "timesheets.bin")
+                return records
     except Exception:
         pass
 
     encoded_credentials = construct_auth_credentials(username=username, password=password)
 
-    url = "https://me52774-webclient.deltekfirst.com/maconomy-api/containers/me52774/dailytimesheetlines/filter?limit=0"
-
-    timetable = deltek_request(url, encoded_credentials)
-
-    records = timetable["panes"]["filter"]["records"]
+    restriction = date_restriction(*download_range())
+    with stage("download"):
+        pages = download_dailysheetlines(encoded_credentials, restriction=restriction)
+        records = [record for page in pages for record in page]
 
+    dump = json.dumps({"panes": {"filter": {"records": records}}})
     with open("timesheets.json", "w") as fp:
-        json.dump(timetable, fp)
+        fp.write(dump)
+    if use_binary_cache:
+        write_cache(records, "timesheets.bin")
 
     return records
 
@@ -131,11 +449,11 @@ def print_records(records: list[dict]) -> None:
             print("(Icke bonusgrundande)")
         else:
             print("")
-            bonus_tot += data["numberof"]
+            bonus_tot += data["numbertransferred"]
 
         print(f'  Job name: {data["description"]}')
         print(f'  Task: {data["entrytext"]}')
-        print(f'  Time: {data["numberof"]} {data["timeregistrationunit"]}')
+        print(f'  Time: {data["numbertransferred"]} hours')
         print("______________________")
 
     print("")
@@ -146,5 +464,5 @@ def print_records(records: list[dict]) -> None:
 
 
 if __name__ == "__main__":
-    timetable_records = read_dailysheetlines()
+    timetable_records = read_dailysheetlines(use_binary_cache=False)
     print_records(timetable_records)
@@ -1,12 +1,87 @@
+import datetime
 import json
-from termcolor import colored
+from functools import cache
 import os
 
 import requests
 
+_holiday_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "holidays")
+
+
+def easter_sunday(year: int) -> datetime.date:
+    """Date of Easter Sunday, using the anonymous Gregorian computus."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    lam = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * lam) // 451
+    month, day = divmod(h + lam - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _first_saturday_from(date: datetime.date) -> datetime.date:
+    return date + datetime.timedelta(days=(5 - date.weekday()) % 7)
+
+
+def compute_holidays(year: int) -> list[dict]:
+    """Swedish public holidays of a year, in the same format as the API Ninjas response.
+
+    Easter follows the computus, Midsummer Day is the Saturday between 20 and 26 June and
+    All Saints' Day the Saturday between 31 October and 6 November.
+    """
+    easter = easter_sunday(year)
+    days = [
+        (datetime.date(year, 1, 1), "New Year's Day"),
+        (datetime.date(year, 1, 6), "Epiphany"),
+        (easter - datetime.timedelta(days=2), "Good Friday"),
+        (easter, "Easter Sunday"),
+        (easter + datetime.timedelta(days=1), "Easter Monday"),
+        (datetime.date(year, 5, 1), "May 1st"),
+        (easter + datetime.timedelta(days=39), "Ascension Day"),
+        (easter + datetime.timedelta(days=49), "Whit Sunday"),
+        (datetime.date(year, 6, 6), "National day"),
+        (_first_saturday_from(datetime.date(year, 6, 20)), "Midsummer Day"),
+        (_first_saturday_from(datetime.date(year, 10, 31)), "All Saints' Day"),
+        (datetime.date(year, 12, 25), "Christmas Day"),
+        (datetime.date(year, 12, 26), "Boxing Day"),
+    ]
+    return [
+        {
+            "country": "Sweden",
+            "iso": "SE",
+            "year": year,
+            "date": date.isoformat(),
+            "day": date.strftime("%A"),
+            "name": name,
+            "type": "PUBLIC_HOLIDAY",
+        }
+        for date, name in days
+    ]
+
+
+@cache
+def holiday_index(year: int) -> dict[str, str]:
+    """Holiday dates of a year by holiday name, memoized per year.
+
+    The dates are computed locally. A ``holidays/holidays_{year}.json`` file, if present, overrides
+    the computed dates of the holidays it lists. No network requests are made.
+    """
+    index = {holiday["name"]: holiday["date"] for holiday in compute_holidays(year)}
+    try:
+        with open(os.path.join(_holiday_dir, f"holidays_{year}.json"), "r") as fp:
+            index.update({holiday["name"]: holiday["date"] for holiday in json.load(fp)})
+    except FileNotFoundError:
+        pass
+    return index
+
 
 def fetch_holidays_for_year(year) -> dict:
-    file_name = f"holidays/holidays_{year}.json"
+    """Read the holiday override file of a year, fetching it from API Ninjas when missing."""
+    file_name = os.path.join(_holiday_dir, f"holidays_{year}.json")
     try:
         with open(file_name, "r") as fp:
             data = json.load(fp)
@@ -15,6 +90,8 @@ def fetch_holidays_for_year(year) -> dict:
         pass
 
     if "API_NINJA_KEY" not in os.environ:
+        from termcolor import colored
+
         print("")
         print(colored("ERROR: ", 'red') + "Cached data not found and no API_NINJA_KEY environment variable not present")
         print(colored("ERROR: ", 'red') + "Calculations will be incorrect because easter and other holidays will not be taken into account")
@@ -43,44 +120,17 @@ def fetch_holidays_for_year(year) -> dict:
 
 
 def get_easter_holidays(year):
-    goodfriday = "error"
-    eastermonday = "error"
-    holidays = fetch_holidays_for_year(year)
-
-    for holiday in holidays:
-        if holiday["name"] == "Good Friday":
-            # print("Långfredag är " + holiday['date'])
-            goodfriday = holiday["date"]
-        if holiday["name"] == "Easter Monday":
-            # print("Annandag påsk är " + holiday['date'])
-            eastermonday = holiday["date"]
-
-    return goodfriday, eastermonday
+    holidays = holiday_index(int(year))
+    return holidays["Good Friday"], holidays["Easter Monday"]
 
 
 def get_ascension_day(year):
-    day = "error"
-    holidays = fetch_holidays_for_year(year)
-
-    for holiday in holidays:
-        if holiday["name"] == "Ascension Day":
-            day = holiday["date"]
-
-    return day
+    return holiday_index(int(year))["Ascension Day"]
 
 
 def get_midsummers_eve(year):
-    day = "error"
-    holidays = fetch_holidays_for_year(year)
-
-    for holiday in holidays:
-        if holiday["name"] == "Midsummer Day":
-            day = holiday["date"]
-    if day != "error":
-        parts = [int(x) for x in day.split("-")]
-        parts[2] -= 1
-        day = "-".join([str(x) for x in parts])
-    return day
+    midsummer_day = datetime.date.fromisoformat(holiday_index(int(year))["Midsummer Day"])
+    return (midsummer_day - datetime.timedelta(days=1)).isoformat()
 
 
 if __name__ == "__main__":
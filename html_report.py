@@ -0,0 +1,317 @@
+"""HTML pages with the yearly and monthly results of each employee, and an index with the org totals.
+
+The page templates are compiled once, to bound ``str.format`` methods, when the module is loaded and the
+pages are written piece by piece as they are rendered, so rendering a whole company is bounded by the file
+writes. Batch mode renders each employee's page in the worker that calculated it, see ``batch.py --html``.
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+
+from bonusmodel_v1 import rollup_lines
+
+BUFFER_SIZE = 1 << 16
+
+_style = """
+body { font-family: sans-serif; margin: 2em; color: #222; }
+table { border-collapse: collapse; margin: 0.5em 0 1.5em; }
+th, td { border: 1px solid #ccc; padding: 0.2em 0.6em; text-align: right; }
+th { background: #f0f0f0; }
+td.text, th.text { text-align: left; }
+th.sortable { cursor: pointer; }
+.better { color: #1a7f37; font-weight: bold; }
+.worse { color: #cf222e; }
+.rtotal { color: #9a6700; }
+.rlin { color: #0550ae; }
+.rlon { color: #1a7f37; }
+"""
+
+_page_head = """<!DOCTYPE html>
+<html lang="sv">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>{style}</style>
+</head>
+<body>
+<h1>{title}</h1>
+{subtitle}""".format
+
+_rates = "<p>Rtotal={rtot_val} kr, Rlinear={rlin_val} kr/h, Rlön={rlon_val} kr/h</p>\n".format
+
+_page_tail = """{script}</body>
+</html>
+""".format
+
+_year_section = """<h2>{year}</h2>
+<table>
+<tr><th class="text">Rtotal payments</th><td class="rtotal">{rtot_count} st</td></tr>
+<tr><th class="text">Rlinear hours</th><td class="rlin">{rlin_count} h</td></tr>
+<tr><th class="text">Rlön hours</th><td class="rlon">{rlon_count} h</td></tr>
+<tr><th class="text">Previous Rtotal hours lost</th><td>{hours_lost} h</td></tr>
+<tr><th class="text">Total current</th>
+<td class="{current_class}">{rtot_count}*{rtot_val} + {rlin_count}*{rlin_val} = {current} kr</td></tr>
+<tr><th class="text">Total new</th>
+<td class="{new_class}">{rlon_count}*{rlon_val} = {new} kr</td></tr>
+</table>
+<p>{rtotal_info}{december}</p>
+<table>
+<tr><th>Month</th><th>Hours</th><th>Rtotal threshold</th><th>Rlin threshold</th><th>Rlön threshold</th>
+<th>Rtotal</th><th>Hour bank</th><th>Rlin</th><th>Rlön</th></tr>
+""".format
+
+_month_row = """<tr><td>{year}-{month}</td><td>{hours} h</td><td>{rtotal_threshold}</td><td>{rlin_threshold}</td>
+<td>{rlon_threshold}</td><td class="text">{rtotal}</td><td>{bank} h</td><td>{rlin} h</td><td>{rlon} h</td></tr>
+""".format
+
+_month_lines = """<details><summary>{year}-{month} time sheet lines with hours combined</summary>
+<table>
+<tr><th class="text">Description</th><th class="text">Job</th><th class="text">Activity</th><th class="text">Task</th>
+<th>Hours</th><th class="text">Type</th></tr>
+{rows}</table>
+</details>
+""".format
+
+_line_row = """<tr><td class="text">{description}</td><td class="text">{jobnumber}</td>
+<td class="text">{activitynumber}</td><td class="text">{taskname}</td><td>{hours}</td><td class="text">{type}</td></tr>
+""".format
+
+_unknown_section = """<h2>Unknown timecodes</h2>
+<p>These lines are not mapped to a bonus type, so the results might be incorrect.</p>
+<table>
+<tr><th class="text">Job</th><th class="text">Activity</th><th>Hours</th></tr>
+{rows}</table>
+""".format
+
+_org_row = """<tr><td>{year}</td><td>{employees}</td><td>{rtot_count}</td><td>{rlin_count}</td><td>{rlon_count}</td>
+<td>{current}</td><td>{new}</td><td>{better_off}</td></tr>
+""".format
+
+_employee_row = """<tr><td class="text"><a href="{href}">{employee}</a></td><td>{year}</td><td>{rtot_count}</td>
+<td>{rlin_count}</td><td>{rlon_count}</td><td>{current}</td><td class="{new_class}">{new}</td><td>{difference}</td></tr>
+""".format
+
+# Sorts a table on the clicked column, numerically when the cells are numbers
+_sort_script = """<script>
+document.querySelectorAll("th.sortable").forEach(function (th) {
+  th.addEventListener("click", function () {
+    var table = th.closest("table"), column = th.cellIndex, ascending = th.dataset.order !== "asc";
+    var rows = Array.from(table.querySelectorAll("tr")).slice(1);
+    rows.sort(function (a, b) {
+      var x = a.cells[column].textContent, y = b.cells[column].textContent;
+      var order = isNaN(x) || isNaN(y) ? x.localeCompare(y) : x - y;
+      return ascending ? order : -order;
+    });
+    rows.forEach(function (row) { table.appendChild(row); });
+    th.dataset.order = ascending ? "asc" : "desc";
+  });
+});
+</script>
+"""
+
+
+def _payouts(report: dict, info: dict) -> tuple[float, float]:
+    current = info["Rtotal_payments"] * report["info"]["Rtotal"] + info["Rlinear_hours"] * report["info"]["Rlinear"]
+    new = info["Rlon_hours"] * report["info"]["Rlon"]
+    return current, new
+
+
+def _combined_lines(rollup: dict) -> str:
+    return "".join(
+        _line_row(
+            description=escape(line["description"]),
+            jobnumber=escape(line["jobnumber"]),
+            activitynumber=escape(line["activitynumber"]),
+            taskname=escape(line["taskname"]),
+            hours=f"{line['hours']:.1f}",
+            type=escape(line["type"]),
+        )
+        for line in rollup_lines(rollup)
+        if line["hours"] != 0
+    )
+
+
+def write_employee_page(report: dict, employee: str, path: str, unknown: dict = None):
+    """Write the yearly and monthly results of one employee as an HTML page.
+
+    Args:
+        report (dict): The report from ``calculate_years`` or another engine, or a batch result file.
+        employee (str): Shown as the page title.
+        path (str): The HTML file.
+        unknown (dict, optional): Unclassified job/activity numbers, see ``add_unknown``.
+    """
+
+    rates = {
+        "rtot_val": report["info"]["Rtotal"],
+        "rlin_val": report["info"]["Rlinear"],
+        "rlon_val": report["info"]["Rlon"],
+    }
+    with open(path, "w", encoding="utf-8", buffering=BUFFER_SIZE) as fp:
+        fp.write(_page_head(title=escape(employee), style=_style, subtitle=_rates(**rates)))
+        for year, year_data in report["years"].items():
+            info = year_data["info"]
+            current, new = _payouts(report, info)
+            december = ""
+            # The carry-over is kept on the year, not in its info
+            if year_data.get("Rtotal_december"):
+                december = f"<br>{year_data['Rtotal_december']:.1f}h carries over from December"
+            fp.write(
+                _year_section(
+                    year=year,
+                    rtot_count=f"{info['Rtotal_payments']:.1f}",
+                    rlin_count=f"{info['Rlinear_hours']:.1f}",
+                    rlon_count=f"{info['Rlon_hours']:.1f}",
+                    hours_lost=f"{info['Rtotal_hours_lost']:.1f}",
+                    current=f"{current:.0f}",
+                    new=f"{new:.0f}",
+                    current_class="worse" if current < new else "better",
+                    new_class="better" if current < new else "worse",
+                    rtotal_info=escape(info["Rtotal"]),
+                    december=december,
+                    **rates,
+                )
+            )
+            for month, month_data in year_data["months"].items():
+                fp.write(
+                    _month_row(
+                        year=year,
+                        month=month,
+                        hours=month_data["hours"],
+                        rtotal_threshold=month_data["hours_adjusted_rtotal"],
+                        rlin_threshold=f"{month_data['hours_adjusted_rlin']:.1f}",
+                        rlon_threshold=month_data["hours_adjusted_rlon"],
+                        rtotal=escape(str(month_data["Rtotal"])) if month_data["Rtotal"] else "No",
+                        bank=f"{month_data['rtot_bank']:.1f}",
+                        rlin=f"{month_data['Rlin']:.1f}",
+                        rlon=f"{month_data['Rlön']:.1f}",
+                    )
+                )
+            fp.write("</table>\n")
+            for month, month_data in year_data["months"].items():
+                if month_data.get("rollup"):
+                    rows = _combined_lines(month_data["rollup"])
+                    fp.write(_month_lines(year=year, month=month, rows=rows))
+
+        if unknown:
+            rows = "".join(
+                f'<tr><td class="text">{escape(jobnumber)} {escape(job["description"])}</td>'
+                f'<td class="text">{escape(activitynumber)} {escape(activity["description"])}</td>'
+                f'<td>{activity["hours"]:.1f}</td></tr>\n'
+                for jobnumber, job in unknown.items()
+                for activitynumber, activity in job["activities"].items()
+            )
+            fp.write(_unknown_section(rows=rows))
+        fp.write(_page_tail(script=""))
+
+
+def write_index(summary: dict, path: str, page_dir: str = "html"):
+    """Write the index page with the org totals per year and a sortable table of every employee and year.
+
+    Args:
+        summary (dict): The summary from ``batch.summarize``.
+        path (str): The HTML file.
+        page_dir (str, optional): Directory of the employee pages, relative to the index. Defaults to "html".
+    """
+
+    with open(path, "w", encoding="utf-8", buffering=BUFFER_SIZE) as fp:
+        fp.write(_page_head(title="Salary model comparison", style=_style, subtitle=""))
+        fp.write("<h2>Org totals</h2>\n<table>\n")
+        fp.write(
+            "<tr><th>Year</th><th>Employees</th><th>Rtotal payments</th><th>Rlinear hours</th><th>Rlön hours</th>"
+            "<th>Total current</th><th>Total new</th><th>Better off new</th></tr>\n"
+        )
+        for year, org in summary["org"].items():
+            fp.write(
+                _org_row(
+                    year=year,
+                    employees=org["employees"],
+                    rtot_count=f"{org['Rtotal_payments']:.1f}",
+                    rlin_count=f"{org['Rlinear_hours']:.1f}",
+                    rlon_count=f"{org['Rlon_hours']:.1f}",
+                    current=f"{org['total_current']:.0f}",
+                    new=f"{org['total_new']:.0f}",
+                    better_off=org["employees_better_off_new"],
+                )
+            )
+        fp.write("</table>\n<h2>Employees</h2>\n<table>\n")
+        fp.write(
+            '<tr><th class="text sortable">Employee</th><th class="sortable">Year</th>'
+            '<th class="sortable">Rtotal payments</th><th class="sortable">Rlinear hours</th>'
+            '<th class="sortable">Rlön hours</th><th class="sortable">Total current</th>'
+            '<th class="sortable">Total new</th><th class="sortable">Difference</th></tr>\n'
+        )
+        for employee, years in summary["employees"].items():
+            href = escape(f"{page_dir}/{employee}.html")
+            for year, totals in years.items():
+                difference = totals["total_new"] - totals["total_current"]
+                fp.write(
+                    _employee_row(
+                        href=href,
+                        employee=escape(employee),
+                        year=year,
+                        rtot_count=f"{totals['Rtotal_payments']:.1f}",
+                        rlin_count=f"{totals['Rlinear_hours']:.1f}",
+                        rlon_count=f"{totals['Rlon_hours']:.1f}",
+                        current=f"{totals['total_current']:.0f}",
+                        new=f"{totals['total_new']:.0f}",
+                        new_class="better" if difference > 0 else "worse",
+                        difference=f"{difference:.0f}",
+                    )
+                )
+        fp.write("</table>\n")
+        if summary["errors"]:
+            fp.write("<h2>Errors</h2>\n<ul>\n")
+            for employee, error in summary["errors"].items():
+                fp.write(f"<li>{escape(employee)}: {escape(error)}</li>\n")
+            fp.write("</ul>\n")
+        fp.write(_page_tail(script=_sort_script))
+
+
+def render_result_file(result_file: str, page_dir: str) -> str:
+    """Render the page of one batch result file ``<employee>.json``."""
+
+    with open(result_file, "r") as fp:
+        result = json.load(fp)
+    employee = result["employee"]
+    write_employee_page(result, employee, os.path.join(page_dir, f"{employee}.html"), result["unknown"])
+    return employee
+
+
+def render_results(results_dir: str, workers: int | None = None) -> int:
+    """Render the pages and the index from a batch output directory, the pages across a process pool.
+
+    Returns:
+        int: The number of employee pages written.
+    """
+
+    with open(os.path.join(results_dir, "summary.json"), "r") as fp:
+        summary = json.load(fp)
+    page_dir = os.path.join(results_dir, "html")
+    os.makedirs(page_dir, exist_ok=True)
+    result_files = [os.path.join(results_dir, f"{employee}.json") for employee in summary["employees"].keys()]
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(result_files) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        page_dirs = [page_dir] * len(result_files)
+        pages = len(list(pool.map(render_result_file, result_files, page_dirs, chunksize=chunksize)))
+
+    write_index(summary, os.path.join(results_dir, "index.html"))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render HTML pages from the results of a batch run.")
+    parser.add_argument("results", help="Output directory of batch.py")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    pages = render_results(args.results, args.workers)
+    print(f"Rendered {pages} employee pages and {os.path.join(args.results, 'index.html')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Incremental recalculation that only revisits the months whose timesheet lines changed.
+
+The monthly sums, the timecode rollup, the unknown lines and the carry-over state of every month are stored as
+checkpoints in a JSON file. On the next run a month is reused when its lines have the same fingerprint and
+it starts with the same ``last_day_was_billable`` state as before, otherwise it is summed again. A year is
+only evaluated again when one of its months changed, its December carry-in changed or the rates changed.
+
+A run still reads the whole checkpoint file and fingerprints the lines of every month, so it takes time in
+proportion to the history, it is not constant. What it saves is classifying and summing the lines: on a 20-year
+synthetic history with nothing changed it takes 10 to 16 ms, against 13 to 22 ms for ``calculate_years``.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from array import array
+from operator import attrgetter
+
+from bonusmodel_v1 import (
+    add_unknown_lines,
+    evaluate_year,
+    get_rates,
+    get_timecode_mapping,
+    new_report,
+    print_year_result,
+    sum_month,
+)
+from work_calendar import monthly_hours, schedule
+
+CHECKPOINT_VERSION = 4
+
+# The text fields of a compact line that the sums, rollup and unknown timecodes depend on
+_line_texts = attrgetter("date", "jobnumber", "activitynumber", "taskname", "entrytext", "jobname")
+
+
+def month_fingerprint(days: dict[str, list]) -> str:
+    """Fingerprint of the compact lines of a month, in the order they are summed."""
+
+    # The fields are hashed column by column, in a few large updates instead of one per line
+    lines = [line for day_lines in days.values() for line in day_lines]
+    texts = [text for line in lines for text in _line_texts(line)]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(array("d", [line.hours for line in lines]).tobytes())
+    digest.update(bytes([line.invoiceable * 2 + line.internaljob for line in lines]))
+    # The lengths keep the joined texts unambiguous
+    digest.update(array("I", map(len, texts)).tobytes())
+    digest.update("".join(texts).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_checkpoints(checkpoint_file: str) -> dict:
+    """Load the checkpoints, or empty ones if missing or written for another version or timecode mapping."""
+
+    mapping = get_timecode_mapping().fingerprint()
+    try:
+        with open(checkpoint_file, "r") as fp:
+            checkpoints = json.load(fp)
+        if checkpoints.get("version") == CHECKPOINT_VERSION and checkpoints.get("mapping") == mapping:
+            return checkpoints
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return {"version": CHECKPOINT_VERSION, "mapping": mapping, "rates": None, "months": {}, "years": {}}
+
+
+def save_checkpoints(checkpoints: dict, checkpoint_file: str):
+    # json.dumps encodes in C, json.dump would go through the pure Python encoder
+    dump = json.dumps(checkpoints)
+    partial_file = checkpoint_file + ".partial"
+    with open(partial_file, "w") as fp:
+        fp.write(dump)
+    os.replace(partial_file, checkpoint_file)
+
+
+def calculate_years_incremental(
+    records: dict[str, dict[str, dict[str, list]]],
+    unknown: dict = None,
+    output_file=sys.stdout,
+    checkpoint_file: str = "checkpoints.json",
+    stats: dict = None,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Incremental equivalent of ``calculate_years``, reusing the checkpoints of unchanged months.
+
+    The report has the same structure as the one from ``calculate_years`` with ``keep_records=False``,
+    the months hold only the ``rollup`` of their lines.
+
+    Args:
+        records (dict): Timesheet lines grouped by ``sort_records``.
+        unknown (dict, optional): Filled with the hours of unclassified job/activity numbers.
+        output_file (optional): Where the yearly results are printed, None to print nothing.
+        checkpoint_file (str, optional): Where the checkpoints are kept. Defaults to "checkpoints.json".
+        stats (dict, optional): Filled with the number of months and years reused and recalculated.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to
+            the rates of envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        dict: The report, see ``calculate_years``.
+    """
+
+    if unknown is None:
+        unknown = {}
+    if stats is None:
+        stats = {}
+    stats.update({"months_reused": 0, "months_calculated": 0, "years_reused": 0, "years_calculated": 0})
+
+    if rates is None:
+        rates = get_rates()
+    report = new_report(*rates)
+    previous = load_checkpoints(checkpoint_file)
+    rates_changed = previous["rates"] != list(rates)
+    checkpoints = {"version": CHECKPOINT_VERSION, "mapping": previous["mapping"], "rates": list(rates)}
+    checkpoints["months"] = {}
+    checkpoints["years"] = {}
+
+    extra_bonus_hours_from_december = 0
+    last_day_was_billable = False
+    for year in records.keys():
+        month_sums = {}
+        month_rollups = {}
+        year_changed = False
+        for month in records[year].keys():
+            key = f"{year}-{month}"
+            fingerprint = month_fingerprint(records[year][month])
+            checkpoint = previous["months"].get(key)
+            if (
+                checkpoint is not None
+                and checkpoint["fingerprint"] == fingerprint
+                and checkpoint["last_day_was_billable_in"] == last_day_was_billable
+            ):
+                stats["months_reused"] += 1
+            else:
+                stats["months_calculated"] += 1
+                year_changed = True
+                month_unknown = []
+                month_rollup = {}
+                sums, last_day_was_billable_out = sum_month(
+                    records[year][month], month, last_day_was_billable, month_unknown, None, month_rollup
+                )
+                checkpoint = {
+                    "fingerprint": fingerprint,
+                    "last_day_was_billable_in": last_day_was_billable,
+                    "last_day_was_billable_out": last_day_was_billable_out,
+                    "sums": sums,
+                    "rollup": month_rollup,
+                    "unknown": month_unknown,
+                }
+
+            checkpoints["months"][key] = checkpoint
+            last_day_was_billable = checkpoint["last_day_was_billable_out"]
+            month_sums[month] = checkpoint["sums"]
+            month_rollups[month] = checkpoint["rollup"]
+            # The month keeps its unknown lines, added one by one to sum the hours like calculate_years
+            add_unknown_lines(unknown, checkpoint["unknown"])
+
+        # A year is evaluated again when the hours of its months changed, with a new schedule
+        hours = list(monthly_hours(int(year), work_schedule)[0])
+        year_checkpoint = previous["years"].get(year)
+        if (
+            year_checkpoint is not None
+            and not year_changed
+            and not rates_changed
+            and year_checkpoint["months"] == list(month_sums.keys())
+            and year_checkpoint.get("hours") == hours
+            and year_checkpoint["extra_bonus_hours_in"] == extra_bonus_hours_from_december
+        ):
+            stats["years_reused"] += 1
+            year_report = year_checkpoint["report"]
+        else:
+            stats["years_calculated"] += 1
+            year_report = {"info": {}, "months": {month: {} for month in month_sums.keys()}}
+            extra_bonus_hours_out = evaluate_year(
+                year_report, year, month_sums, extra_bonus_hours_from_december, work_schedule
+            )
+            year_checkpoint = {
+                "months": list(month_sums.keys()),
+                "hours": hours,
+                "extra_bonus_hours_in": extra_bonus_hours_from_december,
+                "extra_bonus_hours_out": extra_bonus_hours_out,
+                "report": year_report,
+            }
+
+        checkpoints["years"][year] = year_checkpoint
+        extra_bonus_hours_from_december = year_checkpoint["extra_bonus_hours_out"]
+
+        months = {month: {**values, "rollup": month_rollups[month]} for month, values in year_report["months"].items()}
+        report["years"][year] = {**year_report, "months": months}
+        if output_file is not None:
+            print_year_result(report, year, unknown, output_file)
+
+    # A run that reused every month and year leaves the checkpoints as they were
+    if (
+        rates_changed
+        or stats["months_calculated"]
+        or stats["years_calculated"]
+        or checkpoints["months"].keys() != previous["months"].keys()
+        or checkpoints["years"].keys() != previous["years"].keys()
+    ):
+        save_checkpoints(checkpoints, checkpoint_file)
+    return report
@@ -0,0 +1,112 @@
+"""Incremental parsing of the record array in a Maconomy container without loading the whole document."""
+
+import codecs
+import json
+from typing import Iterable, Iterator
+
+RECORDS_PATH = ("panes", "filter", "records")
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+class _ChunkReader:
+    """Buffer over an iterable of byte or text chunks that decodes one JSON value at a time."""
+
+    def __init__(self, chunks: Iterable[bytes | str]):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self) -> bool:
+        if self.exhausted:
+            return False
+        # Drop what has been consumed so the buffer only holds the value being parsed
+        self.buf = self.buf[self.pos :]
+        self.pos = 0
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                chunk = self.utf8.decode(chunk)
+            if chunk:
+                self.buf += chunk
+                return True
+        self.buf += self.utf8.decode(b"", final=True)
+        self.exhausted = True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos}, found '{self.buf[self.pos]}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A value running up to the end of the buffer could be a truncated number or literal
+                if end < len(self.buf) or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.fill()
+
+
+def iter_json_array(chunks: Iterable[bytes | str], path: tuple[str, ...] = RECORDS_PATH) -> Iterator:
+    """Yield the elements of the array at ``path`` one by one while reading ``chunks``.
+
+    Only one element is decoded at a time. Values outside ``path`` are decoded and dropped as they
+    are passed, and nothing after the array is read.
+
+    Args:
+        chunks (Iterable[bytes | str]): The JSON document in pieces, for example a file read in blocks
+            or the body of a streamed HTTP response.
+        path (tuple[str, ...], optional): Keys leading to the array. Defaults to ``panes.filter.records``.
+    """
+
+    reader = _ChunkReader(chunks)
+    for key in path:
+        reader.expect("{")
+        while True:
+            if reader.peek() == "}":
+                raise KeyError(key)
+            name = reader.value()
+            reader.expect(":")
+            if name == key:
+                break
+            reader.value()
+            if reader.peek() == ",":
+                reader.pos += 1
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == "]":
+            return
+        reader.expect(",")
+
+
+def iter_file_records(path: str, chunk_size: int = 1 << 16) -> Iterator[dict]:
+    """Yield the timesheet records of a cached Deltek container file one by one."""
+
+    def read_chunks():
+        with open(path, "rb") as fp:
+            while chunk := fp.read(chunk_size):
+                yield chunk
+
+    yield from iter_json_array(read_chunks())
@@ -0,0 +1,323 @@
+"""Vectorized NumPy engine for the Rtotal, Rlinear and Rlön calculation.
+
+The timesheet lines are loaded into columnar arrays and the monthly sums are computed with grouped
+reductions. Only the carry-over logic (the Rtotal hour bank and the December surplus) runs sequentially,
+once per month, through the same ``evaluate_year`` as the pure Python path.
+
+The grouped reductions are only part of a run. ``load_columns`` still reads every line in Python, and on a
+44k-line history that pass takes about as long as all the vectorized work after it. Against ``sort_records``
+followed by ``calculate_years``, the whole run is about 2.5 to 3 times faster (87 ms against 260 ms from Deltek
+records, 52 ms against 130 ms from compact lines), not an order of magnitude. ``calculate_years_columns``
+takes columns loaded elsewhere, for callers that already hold them.
+"""
+
+import sys
+from operator import attrgetter, itemgetter
+
+import numpy as np
+
+from bonusmodel_v1 import (
+    add_to_rollup,
+    add_unknown,
+    classify_record,
+    evaluate_year,
+    get_rates,
+    new_report,
+    print_year_result,
+)
+from timecode_mapping import timeline_sheet_record
+from work_calendar import schedule
+
+BONUS_TYPES = ["internal", "unknown", "billable", "vacation", "förtroendeuppdrag", "VAB", "parental", "bonus"]
+_type_code = {bonus_type: code for code, bonus_type in enumerate(BONUS_TYPES)}
+
+INTERNAL = _type_code["internal"]
+UNKNOWN = _type_code["unknown"]
+BILLABLE = _type_code["billable"]
+VACATION = _type_code["vacation"]
+FORTROENDEUPPDRAG = _type_code["förtroendeuppdrag"]
+VAB = _type_code["VAB"]
+PARENTAL = _type_code["parental"]
+BONUS = _type_code["bonus"]
+
+# Months where vacation lowers the Rlinear threshold, indexed by month number
+_rlin_vacation_months = np.isin(np.arange(13), [1, 7, 8, 12])
+
+_line_key = itemgetter("jobnumber", "activitynumber", "taskname", "invoiceable", "internaljob")
+_thedate = itemgetter("thedate")
+_hours = itemgetter("numbertransferred")
+# The same fields of compact lines
+_line_attrs = attrgetter("jobnumber", "activitynumber", "taskname", "invoiceable", "internaljob")
+_date_attr = attrgetter("date")
+_hours_attr = attrgetter("hours")
+
+
+def load_columns(records: list[dict] | list[timeline_sheet_record]) -> dict[str, np.ndarray]:
+    """Load Deltek timesheet records into columnar arrays.
+
+    Every distinct (jobnumber, activitynumber, taskname, invoiceable, internaljob) combination is
+    classified once, so the per-line cost is a single dict lookup. It is still a Python pass over the lines,
+    the slowest part of ``calculate_years_vectorized``.
+
+    Args:
+        records (list): Timesheet records as returned by ``read_dailysheetlines``, or compact lines.
+
+    Returns:
+        dict[str, np.ndarray]: ``date`` (datetime64[D]), ``hours``, ``type`` (index into ``BONUS_TYPES``)
+        and ``key`` (index into ``keys``, a list of the distinct line keys).
+    """
+
+    if records and isinstance(records[0], timeline_sheet_record):
+        data = records
+        line_key, thedate, hours = _line_attrs, _date_attr, _hours_attr
+    else:
+        data = [record["data"] for record in records]
+        line_key, thedate, hours = _line_key, _thedate, _hours
+    line_keys = list(map(line_key, data))
+    key_index = {}
+    for key in line_keys:
+        if key not in key_index:
+            key_index[key] = len(key_index)
+    keys = list(key_index.keys())
+    key_types = np.array([_classify_key(key) for key in keys], dtype=np.int8)
+
+    key = np.fromiter(map(key_index.__getitem__, line_keys), dtype=np.int32, count=len(data))
+    return {
+        "date": np.array(list(map(thedate, data)), dtype="datetime64[D]"),
+        "hours": np.fromiter(map(hours, data), dtype=np.float64, count=len(data)),
+        "type": key_types[key],
+        "key": key,
+        "keys": keys,
+        "data": data,
+    }
+
+
+def _classify_key(key: tuple) -> int:
+    jobnumber, activitynumber, taskname, invoiceable, internaljob = key
+    record = {
+        "jobnumber": jobnumber,
+        "activitynumber": activitynumber,
+        "taskname": taskname,
+        "invoiceable": invoiceable,
+        "internaljob": internaljob,
+    }
+    return _type_code[classify_record(record)]
+
+
+def _line_type_name(code: int) -> str:
+    if code % 2:
+        return BONUS_TYPES[code // 2] + " /w bonus"
+    return BONUS_TYPES[code // 2]
+
+
+def _first_seen(values: np.ndarray) -> np.ndarray:
+    """Index of the first occurrence of each line's value."""
+
+    _, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    return first[inverse.reshape(-1)]
+
+
+def _traversal_order(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    """Order the lines the way ``sort_records`` + ``calculate_years`` visit them.
+
+    Years, months and days are visited in order of first appearance, lines within a day in input order.
+    """
+
+    ym = year * 100 + month
+    ymd = ym * 100 + day
+    return np.lexsort((np.arange(len(year)), _first_seen(ymd), _first_seen(ym), _first_seen(year)))
+
+
+def _last_day_was_billable(day_start: np.ndarray, types: np.ndarray) -> np.ndarray:
+    """Whether the last deciding day before each day was billable.
+
+    A day is deciding unless its last billable, vacation or förtroendeuppdrag line is a vacation or
+    förtroendeuppdrag line. Days without any of those lines reset the flag.
+    """
+
+    n_days = len(day_start)
+    positions = np.where(
+        (types == BILLABLE) | (types == VACATION) | (types == FORTROENDEUPPDRAG), np.arange(len(types)), -1
+    )
+    last = np.maximum.reduceat(positions, day_start)
+    last_type = np.where(last >= 0, types[np.maximum(last, 0)], -1)
+    # 1: billable day, 0: not billable, -1: vacation or förtroendeuppdrag keeps the previous value
+    day_state = np.where(last_type == BILLABLE, 1, np.where(last_type == -1, 0, -1))
+
+    deciding = np.where(day_state >= 0, np.arange(n_days), -1)
+    deciding = np.maximum.accumulate(deciding)
+    after = np.where(deciding >= 0, day_state[np.maximum(deciding, 0)] == 1, False)
+
+    before = np.empty(n_days, dtype=bool)
+    before[:1] = False
+    before[1:] = after[:-1]
+    return before
+
+
+def _month_rollups(columns: dict, order: np.ndarray, month_id: np.ndarray, line_type: np.ndarray) -> list[dict]:
+    """Per month, the rollup of the lines by (jobnumber, activitynumber, taskname, type), see ``add_to_rollup``.
+
+    ``line_type`` is the bonus type code times two, plus one for lines that count " /w bonus".
+    """
+
+    keys = columns["keys"]
+    job_task = {}
+    key_job_task = np.array([job_task.setdefault(key[:3], len(job_task)) for key in keys], dtype=np.int64)
+
+    n_line_types = 2 * len(BONUS_TYPES)
+    group = (month_id * len(job_task) + key_job_task[columns["key"][order]]) * n_line_types + line_type
+    _, first, inverse = np.unique(group, return_index=True, return_inverse=True)
+    hours = np.bincount(inverse.reshape(-1), weights=columns["hours"][order], minlength=len(first))
+
+    rollups: list[dict] = [{} for _ in range(int(month_id[-1]) + 1)]
+    for g in np.argsort(first, kind="stable").tolist():
+        index = first[g]
+        line = columns["data"][order[index]]
+        add_to_rollup(
+            rollups[month_id[index]],
+            line["jobnumber"],
+            line["activitynumber"],
+            line["taskname"],
+            _line_type_name(int(line_type[index])),
+            float(hours[g]),
+            line["entrytext"],
+        )
+    return rollups
+
+
+def calculate_years_vectorized(
+    records: list[dict] | list[timeline_sheet_record],
+    unknown: dict = None,
+    output_file=sys.stdout,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Vectorized equivalent of ``sort_records`` followed by ``calculate_years``.
+
+    Produces the same report as ``calculate_years`` with ``keep_records=False``, the months hold only
+    the ``rollup`` of their lines.
+
+    Args:
+        records (list): Timesheet records as returned by ``read_dailysheetlines``, or compact lines.
+        unknown (dict, optional): Filled with the hours of unclassified job/activity numbers.
+        output_file (optional): Where the yearly results are printed, None to print nothing.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to
+            the rates of envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        dict: The report, see ``calculate_years``.
+    """
+
+    if unknown is None:
+        unknown = {}
+    if rates is None:
+        rates = get_rates()
+    if not records:
+        return new_report(*rates)
+    return calculate_years_columns(load_columns(records), unknown, output_file, rates, work_schedule)
+
+
+def calculate_years_columns(
+    columns: dict,
+    unknown: dict,
+    output_file=sys.stdout,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Run the models on timesheet lines already loaded with ``load_columns``."""
+
+    if rates is None:
+        rates = get_rates()
+    report = new_report(*rates)
+    date = columns["date"]
+    year = date.astype("datetime64[Y]").astype(np.int64) + 1970
+    month = date.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    day = (date - date.astype("datetime64[M]")).astype(np.int64) + 1
+
+    order = _traversal_order(year, month, day)
+    year, month = year[order], month[order]
+    ymd = (year * 100 + month) * 100 + day[order]
+    types = columns["type"][order]
+    hours = columns["hours"][order]
+
+    new_month = np.empty(len(order), dtype=bool)
+    new_month[0] = True
+    new_month[1:] = (year[1:] != year[:-1]) | (month[1:] != month[:-1])
+    month_id = np.cumsum(new_month) - 1
+    month_start = np.flatnonzero(new_month)
+    n_months = len(month_start)
+
+    new_day = np.empty(len(order), dtype=bool)
+    new_day[0] = True
+    new_day[1:] = ymd[1:] != ymd[:-1]
+    day_start = np.flatnonzero(new_day)
+    day_id = np.cumsum(new_day) - 1
+    last_day_was_billable = _last_day_was_billable(day_start, types)[day_id]
+
+    is_vacation = types == VACATION
+    fortroende_with_bonus = (types == FORTROENDEUPPDRAG) & last_day_was_billable
+    bonus_mask = (types == BILLABLE) | is_vacation | fortroende_with_bonus | (types == BONUS)
+    masks = {
+        "billed": types == BILLABLE,
+        "bonus": bonus_mask,
+        "non_bonus": types == INTERNAL,
+        "unknown": types == UNKNOWN,
+        "rlon_billable": fortroende_with_bonus,
+        "rlin_vacation": is_vacation & _rlin_vacation_months[month],
+        "rlon_vacation": is_vacation & last_day_was_billable,
+        "vab_equivalent": (types == VAB) | (types == PARENTAL),
+    }
+    # bincount adds the weights in line order, so the sums are identical to the sequential path.
+    # Months without any contributing line keep the integer 0 the sequential path starts from.
+    sums = {}
+    for name, mask in masks.items():
+        totals = np.bincount(month_id, weights=np.where(mask, hours, 0.0), minlength=n_months).tolist()
+        counts = np.bincount(month_id[mask], minlength=n_months).tolist()
+        sums[name] = [total if count else 0 for total, count in zip(totals, counts)]
+
+    line_type = types.astype(np.int64) * 2 + (is_vacation | fortroende_with_bonus)
+    rollups = _month_rollups(columns, order, month_id, line_type)
+
+    unknown_lines = np.flatnonzero(types == UNKNOWN).tolist()
+    unknown_month = month_id[unknown_lines].tolist()
+    hours_list = hours.tolist()
+
+    month_years = year[month_start].tolist()
+    month_numbers = month[month_start].tolist()
+    extra_bonus_hours_from_december = 0
+    m = 0
+    u = 0
+    while m < n_months:
+        year_key = f"{month_years[m]:04d}"
+        year_report = {"info": {}, "months": {}}
+        report["years"][year_key] = year_report
+        month_sums = {}
+        while m < n_months and month_years[m] == int(year_key):
+            month_key = f"{month_numbers[m]:02d}"
+            year_report["months"][month_key] = {"rollup": rollups[m]}
+            month_sums[month_key] = {name: values[m] for name, values in sums.items()}
+            m += 1
+
+        # The unknown inventory grows year by year, like in the sequential path
+        while u < len(unknown_lines) and unknown_month[u] < m:
+            index = unknown_lines[u]
+            line = columns["data"][order[index]]
+            add_unknown(
+                unknown,
+                line["jobnumber"],
+                line["jobname"] if "jobname" in line else line["description"],
+                line["activitynumber"],
+                line["entrytext"],
+                hours_list[index],
+            )
+            u += 1
+
+        extra_bonus_hours_from_december = evaluate_year(
+            year_report, year_key, month_sums, extra_bonus_hours_from_december, work_schedule
+        )
+        if output_file is not None:
+            print_year_result(report, year_key, unknown, output_file)
+
+    return report
@@ -0,0 +1,153 @@
+"""Calculation that classifies and sums the years of a history in parallel, across a process pool.
+
+Two things flow from one year into the next: whether the last day was billable, which decides how vacation and
+förtroendeuppdrag count until the first billable or non-billable day, and the Rtotal hours carried over from
+December. Each worker sums the months of one year starting from a non-billable day, and again from a billable
+day for the months up to where both starts reach the same state, usually only January. A sequential pass then
+picks the sums matching the state each year really starts with and runs ``evaluate_year`` with the December
+carry-over, which is cheap next to classifying the lines. The results are exactly those of ``calculate_years``.
+"""
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from bonusmodel_v1 import add_unknown_lines, evaluate_year, get_rates, new_report, print_year_result, sum_month
+from profiling import stage
+from work_calendar import schedule
+
+
+def sum_year(months: dict[str, dict[str, list]]) -> dict:
+    """Sum the months of a year, from both last day states, as far as they differ.
+
+    Returns:
+        dict: ``sums``, ``rollups``, the ``unknown`` lines in order (see ``add_unknown``) and
+            ``last_day_was_billable`` out of the year when it starts after a non-billable day, and
+            ``if_billable`` with the ``sums``, ``rollups`` and ``last_day_was_billable`` that differ when it
+            starts after a billable day.
+    """
+
+    result = {"sums": {}, "rollups": {}, "unknown": []}
+    if_billable = {"sums": {}, "rollups": {}}
+    last_day_was_billable = False
+    last_day_was_billable_if_billable = True
+    for month, days in months.items():
+        if last_day_was_billable != last_day_was_billable_if_billable:
+            if_billable["rollups"][month] = {}
+            # The unknown hours do not depend on the last day, they are only collected once
+            if_billable["sums"][month], last_day_was_billable_if_billable = sum_month(
+                days, month, last_day_was_billable_if_billable, {}, None, if_billable["rollups"][month]
+            )
+        result["rollups"][month] = {}
+        result["sums"][month], last_day_was_billable = sum_month(
+            days, month, last_day_was_billable, result["unknown"], None, result["rollups"][month]
+        )
+        if month not in if_billable["sums"]:
+            last_day_was_billable_if_billable = last_day_was_billable
+    result["last_day_was_billable"] = last_day_was_billable
+    if_billable["last_day_was_billable"] = last_day_was_billable_if_billable
+    result["if_billable"] = if_billable
+    return result
+
+
+# The records of the calculation in progress, read by forked workers without pickling them
+_shared_records = None
+
+
+def _sum_shared_year(year: str) -> dict:
+    return sum_year(_shared_records[year])
+
+
+def sum_years(records: dict[str, dict[str, dict[str, list]]], workers: int) -> list[dict]:
+    """``sum_year`` of every year, across a process pool.
+
+    Where processes are forked the workers inherit the records, otherwise the lines of each year are pickled
+    to its worker, which can take about as long as summing them.
+    """
+
+    global _shared_records
+
+    years = list(records.keys())
+    if workers == 1:
+        return [sum_year(records[year]) for year in years]
+    if "fork" not in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(sum_year, [records[year] for year in years]))
+
+    _shared_records = records
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            return list(pool.map(_sum_shared_year, years))
+    finally:
+        _shared_records = None
+
+
+def calculate_years_parallel(
+    records: dict[str, dict[str, dict[str, list]]],
+    unknown: dict = None,
+    output_file=sys.stdout,
+    workers: int | None = None,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Parallel equivalent of ``calculate_years``, summing the years in worker processes.
+
+    The report has the same structure as the one from ``calculate_years`` with ``keep_records=False``,
+    the months hold only the ``rollup`` of their lines.
+
+    Args:
+        records (dict): Timesheet lines grouped by ``sort_records``.
+        unknown (dict, optional): Filled with the hours of unclassified job/activity numbers.
+        output_file (optional): Where the yearly results are printed, None to print nothing.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs, but at most one
+            per year.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to
+            the rates of envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        dict: The report, see ``calculate_years``.
+    """
+
+    if unknown is None:
+        unknown = {}
+    if rates is None:
+        rates = get_rates()
+    report = new_report(*rates)
+    years = list(records.keys())
+    if not years:
+        return report
+
+    workers = min(workers or os.cpu_count() or 1, len(years))
+    with stage("classify"):
+        year_sums = sum_years(records, workers)
+
+    extra_bonus_hours_from_december = 0
+    last_day_was_billable = False
+    for year, result in zip(years, year_sums):
+        month_sums = result["sums"]
+        rollups = result["rollups"]
+        if last_day_was_billable:
+            if_billable = result["if_billable"]
+            month_sums = {**month_sums, **if_billable["sums"]}
+            rollups = {**rollups, **if_billable["rollups"]}
+            last_day_was_billable = if_billable["last_day_was_billable"]
+        else:
+            last_day_was_billable = result["last_day_was_billable"]
+
+        # The lines are added one by one, summing the hours in the same order as calculate_years
+        add_unknown_lines(unknown, result["unknown"])
+
+        year_report = {"info": {}, "months": {month: {"rollup": rollups[month]} for month in month_sums}}
+        report["years"][year] = year_report
+        with stage("model", year=year):
+            extra_bonus_hours_from_december = evaluate_year(
+                year_report, year, month_sums, extra_bonus_hours_from_december, work_schedule
+            )
+
+        if output_file is not None:
+            with stage("render", year=year):
+                print_year_result(report, year, unknown, output_file)
+    return report
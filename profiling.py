@@ -0,0 +1,213 @@
+"""Per-stage instrumentation of a salary calculation run, exported as a Chrome trace.
+
+Set envar PROFILE to the trace file (``PROFILE=trace.json``), or pass ``--profile trace.json`` to batch mode,
+and each stage of the run (download, parse, sort, classify, holidays, model, render) records its wall time,
+CPU time and how much it raised the peak memory of the process, tagged with the employee, year and month it
+worked on. The peak memory only ever grows, so a stage that stays below an earlier peak raises it by nothing, and
+the growth of a stage includes that of the stages nested within. The trace
+opens in chrome://tracing or https://ui.perfetto.dev, and a summary table per stage is printed after the run.
+
+When PROFILE is not set, ``stage`` hands out one shared context manager that does nothing.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the peak memory is then left out
+    resource = None
+
+_enabled = "PROFILE" in os.environ
+_events = []
+_context = {}
+_local = threading.local()
+_disabled = contextlib.nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable():
+    """Turn the instrumentation on in this process, and in the worker processes it starts."""
+
+    global _enabled
+    _enabled = True
+
+
+def trace_file() -> str:
+    return os.environ["PROFILE"] if "PROFILE" in os.environ else "trace.json"
+
+
+def _max_rss_kb() -> int:
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _stage:
+    __slots__ = ("name", "args", "start", "cpu_start", "child_time", "rss_start")
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        _local.stack.append(self)
+        self.child_time = 0
+        self.rss_start = _max_rss_kb()
+        self.cpu_start = time.process_time_ns()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        cpu = time.process_time_ns() - self.cpu_start
+        duration = end - self.start
+        max_rss = _max_rss_kb()
+        _local.stack.pop()
+        if _local.stack:
+            _local.stack[-1].child_time += duration
+        _events.append(
+            {
+                "name": self.name,
+                "ph": "X",
+                "ts": self.start / 1000,
+                "dur": duration / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {
+                    **_context,
+                    **self.args,
+                    "self_ms": (duration - self.child_time) / 1e6,
+                    "cpu_ms": cpu / 1e6,
+                    "max_rss_kb": max_rss,
+                    "rss_growth_kb": max_rss - self.rss_start,
+                },
+            }
+        )
+
+
+def stage(name: str, **args):
+    """Time a stage of the run, use as ``with stage("classify", year=year, month=month):``.
+
+    Args:
+        name (str): The stage.
+        **args: Shown with the stage in the trace, for example the year and month.
+    """
+
+    if not _enabled:
+        return _disabled
+    return _stage(name, args)
+
+
+@contextlib.contextmanager
+def context(**args):
+    """Tag the stages within, for example with the employee, restoring the previous tags after."""
+
+    if not _enabled:
+        yield
+        return
+    previous = dict(_context)
+    _context.update(args)
+    try:
+        yield
+    finally:
+        _context.clear()
+        _context.update(previous)
+
+
+def take_events() -> list[dict]:
+    """The events recorded in this process so far, which are then cleared."""
+
+    events = list(_events)
+    _events.clear()
+    return events
+
+
+def write_trace(path: str, events: list[dict]):
+    """Write the events as a Chrome trace, with the time of the first event as zero."""
+
+    start = min((event["ts"] for event in events), default=0)
+    trace_events = [{**event, "ts": event["ts"] - start} for event in events]
+    for pid in sorted({event["pid"] for event in events}):
+        trace_events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"salary models {pid}"}})
+    with open(path, "w") as fp:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, fp)
+
+
+def summarize(events: list[dict], by: str = "stage") -> dict[str, dict]:
+    """Calls, wall, self and CPU time, and the growth of the peak memory, per stage, employee or year."""
+
+    summary = {}
+    for event in events:
+        if event["ph"] != "X":
+            continue
+        key = event["name"] if by == "stage" else str(event["args"].get(by, "-"))
+        if key not in summary:
+            summary[key] = {"calls": 0, "wall_ms": 0.0, "self_ms": 0.0, "cpu_ms": 0.0, "rss_growth_kb": 0}
+        row = summary[key]
+        row["calls"] += 1
+        row["wall_ms"] += event["dur"] / 1000
+        row["self_ms"] += event["args"]["self_ms"]
+        row["cpu_ms"] += event["args"]["cpu_ms"]
+        # Traces written before the growth was recorded have none
+        row["rss_growth_kb"] += event["args"].get("rss_growth_kb", 0)
+    return summary
+
+
+def print_summary(events: list[dict], by: str = "stage", output_file=None):
+    """Print the summary table, slowest first by self time.
+
+    Wall time and the peak memory growth include the stages nested within.
+    """
+
+    summary = summarize(events, by)
+    print(
+        f"{by:<20} {'calls':>8} {'wall ms':>10} {'self ms':>10} {'cpu ms':>10} {'+peak MB':>8}",
+        file=output_file,
+    )
+    for key, row in sorted(summary.items(), key=lambda item: item[1]["self_ms"], reverse=True):
+        print(
+            f"{key:<20} {row['calls']:>8} {row['wall_ms']:>10.1f} {row['self_ms']:>10.1f} {row['cpu_ms']:>10.1f}"
+            f" {row['rss_growth_kb'] / 1024:>8.1f}",
+            file=output_file,
+        )
+
+
+def write_profile(events: list[dict] | None = None):
+    """Write the trace to the PROFILE file and print the summary, when the instrumentation is on."""
+
+    if not _enabled:
+        return
+    if events is None:
+        events = take_events()
+    path = trace_file()
+    write_trace(path, events)
+    print("")
+    print_summary(events)
+    print(f"Trace written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a trace written with PROFILE.")
+    parser.add_argument("trace", help="Trace file")
+    parser.add_argument(
+        "--by", choices=["stage", "employee", "year"], default="stage", help="Group by (default: stage)"
+    )
+    args = parser.parse_args()
+
+    with open(args.trace, "r") as fp:
+        events = json.load(fp)["traceEvents"]
+    print_summary(events, args.by)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Monte Carlo projection of the year-end payouts of both models, from the months reported so far.
+
+The remaining months of the year are sampled from the employee's own history: each scenario draws, for every
+remaining month, the monthly sums of a past month of the same calendar month (scaled to the working hours of the
+month), so vacation and absence follow the employee's usual pattern. The whole year, the reported months and the
+sampled ones, is then evaluated with the Rtotal hour bank and the year-end retroactive rule of ``evaluate_year``,
+for all scenarios at once as arrays.
+"""
+
+import argparse
+import datetime
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch import employee_id, list_timesheet_files, load_timesheet_records
+from bonusmodel_v1 import evaluate_year, get_rates, sort_records, sum_month
+from work_calendar import employee_schedule, monthly_hours, schedule
+
+# The monthly sums used by the models, see ``new_month_sums``
+SUM_KEYS = ["billed", "bonus", "rlon_billable", "rlin_vacation", "rlon_vacation", "vab_equivalent"]
+RLIN_VACATION_MONTHS = ["01", "07", "08", "12"]
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def history_sums(
+    records: dict[str, dict[str, dict[str, list]]], year: str, work_schedule: schedule = None
+) -> tuple[dict, float]:
+    """The monthly sums of every month, and the Rtotal hours carried into ``year`` from the December before.
+
+    Returns:
+        tuple[dict, float]: Monthly sums by year and month, and the carried hours.
+    """
+
+    sums = {}
+    extra_bonus_hours_from_december = 0
+    last_day_was_billable = False
+    for record_year, months in records.items():
+        sums[record_year] = {}
+        for month, days in months.items():
+            sums[record_year][month], last_day_was_billable = sum_month(days, month, last_day_was_billable, {}, None)
+        if record_year < year:
+            year_report = {"info": {}, "months": {}}
+            extra_bonus_hours_from_december = evaluate_year(
+                year_report, record_year, sums[record_year], extra_bonus_hours_from_december, work_schedule
+            )
+    return sums, extra_bonus_hours_from_december
+
+
+def sample_months(
+    rng: np.random.Generator,
+    sums: dict,
+    year: str,
+    months: list[str],
+    scenarios: int,
+    work_schedule: schedule = None,
+) -> dict[str, np.ndarray]:
+    """Draw the sums of the months to project from the other years, (months x scenarios) per sum.
+
+    A month is drawn among the same calendar month of the other years, or among all months of the history
+    if that month was never reported. The hours are scaled by the working hours of the months, as scheduled.
+    """
+
+    hours = monthly_hours(int(year), work_schedule)[0]
+    history = [
+        (int(past_year), month, month_sums)
+        for past_year, past_months in sums.items()
+        if past_year != year
+        for month, month_sums in past_months.items()
+    ]
+    if not history:
+        history = [(int(year), month, month_sums) for month, month_sums in sums.get(year, {}).items()]
+    if not history:
+        raise Exception("No reported months to sample from")
+
+    # One contiguous row per month keeps the month by month evaluation fast
+    sampled = {key: np.zeros((len(months), scenarios)) for key in SUM_KEYS}
+    for row, month in enumerate(months):
+        pool = [entry for entry in history if entry[1] == month] or history
+        scale = np.array(
+            [
+                hours[int(month) - 1] / monthly_hours(past_year, work_schedule)[0][int(past_month) - 1]
+                for past_year, past_month, _ in pool
+            ]
+        )
+        picks = rng.integers(0, len(pool), scenarios)
+        for key in SUM_KEYS:
+            values = np.array([month_sums[key] for _, _, month_sums in pool]) * scale
+            sampled[key][row] = values[picks]
+        if month not in RLIN_VACATION_MONTHS:
+            sampled["rlin_vacation"][row] = 0
+    return sampled
+
+
+def simulate_year(
+    year: str, months: list[str], sums: dict[str, np.ndarray], carry_in: float, work_schedule: schedule = None
+) -> dict[str, np.ndarray]:
+    """Evaluate the models of a year for every scenario, as ``evaluate_year`` does for one.
+
+    Args:
+        year (str): The year.
+        months (list[str]): The months of the year, in order.
+        sums (dict[str, np.ndarray]): The monthly sums, (months x scenarios) per key of ``SUM_KEYS``.
+        carry_in (float): Rtotal hours carried over from the previous December.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        dict[str, np.ndarray]: ``Rtotal_payments``, ``Rlinear_hours`` and ``Rlon_hours`` of each scenario.
+    """
+
+    hours_by_month, shares = monthly_hours(int(year), work_schedule)
+    scenarios = sums["billed"].shape[1]
+    rtot_bank = np.full(scenarios, float(carry_in))
+    rtot_count = np.zeros(scenarios)
+    rlin_count = np.zeros(scenarios)
+    rlon_count = np.zeros(scenarios)
+    year_bonus_hours = np.zeros(scenarios)
+    for row, month in enumerate(months):
+        hour_for_month = hours_by_month[int(month) - 1]
+        threshold = 130 * shares[int(month) - 1]
+        billed = sums["billed"][row]
+        bonus = sums["bonus"][row]
+
+        required = hour_for_month - sums["vab_equivalent"][row]
+        reached = bonus >= required
+        rtot_bank = np.where(reached, rtot_bank + (bonus - required), rtot_bank)
+        from_bank = ~reached & (bonus + rtot_bank >= required)
+        rtot_bank = np.where(from_bank, rtot_bank - (required - bonus), rtot_bank)
+        rtot_count += reached | from_bank
+        year_bonus_hours += bonus
+
+        rlin_threshold = np.where(
+            sums["rlin_vacation"][row] > 0, np.clip(billed / hour_for_month * threshold, 0, threshold), threshold
+        )
+        rlin_count += np.maximum(billed - rlin_threshold, 0)
+        rlon_hours = billed + sums["rlon_vacation"][row] + sums["rlon_billable"][row]
+        rlon_count += np.maximum(rlon_hours - threshold, 0)
+
+    yearly_hours = sum(hours_by_month)
+    rtot_count = np.where(
+        year_bonus_hours >= yearly_hours,
+        12 + np.minimum(1, (year_bonus_hours - yearly_hours) / 168),
+        np.where(year_bonus_hours >= yearly_hours - 40, 11, rtot_count),
+    )
+    return {"Rtotal_payments": rtot_count, "Rlinear_hours": rlin_count, "Rlon_hours": rlon_count}
+
+
+def distribution(values: np.ndarray) -> dict[str, float]:
+    """Mean and percentiles of the payouts of the scenarios."""
+
+    result = {"mean": float(values.mean())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        result[f"p{percentile}"] = float(value)
+    return result
+
+
+def project_year(
+    records: dict[str, dict[str, dict[str, list]]],
+    year: str | None = None,
+    through: str | None = None,
+    scenarios: int = 100000,
+    seed: int = 0,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Project the year-end payouts of both models.
+
+    Args:
+        records (dict): Timesheet lines grouped by ``sort_records``.
+        year (str, optional): The year to project. Defaults to the latest year with lines.
+        through (str, optional): Last reported month to use, "01" to "12", the later months are sampled.
+            Defaults to the month before the current one for the current year, otherwise every reported month.
+        scenarios (int, optional): Number of scenarios. Defaults to 100000.
+        seed (int, optional): Seed of the sampling. Defaults to 0.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to the rates
+            of envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        dict: The ``year``, the ``reported`` and ``projected`` months, and the ``distribution`` of the payouts
+            ``total_current`` and ``total_new``, with ``p_new_better``, the share of scenarios where the new
+            model pays more.
+    """
+
+    if not records:
+        raise Exception("No timesheet lines found")
+    if year is None:
+        year = max(records)
+    if through is None:
+        today = datetime.date.today()
+        through = f"{today.month - 1:02d}" if int(year) == today.year else "12"
+    if rates is None:
+        rates = get_rates()
+    rtot_val, rlin_val, rlon_val = rates
+
+    sums, carry_in = history_sums(records, year, work_schedule)
+    reported = [month for month in sums.get(year, {}) if month <= through]
+    projected = [f"{month:02d}" for month in range(int(through) + 1, 13)]
+
+    rng = np.random.default_rng(seed)
+    year_sums = sample_months(rng, sums, year, projected, scenarios, work_schedule) if projected else {}
+    for key in SUM_KEYS:
+        # The reported months are the same in every scenario
+        actual = np.array([sums[year][month][key] for month in reported]).reshape(-1, 1)
+        rows = [np.broadcast_to(actual, (len(reported), scenarios))]
+        if projected:
+            rows.append(year_sums[key])
+        year_sums[key] = np.concatenate(rows)
+
+    counts = simulate_year(year, reported + projected, year_sums, carry_in, work_schedule)
+    current = counts["Rtotal_payments"] * rtot_val + counts["Rlinear_hours"] * rlin_val
+    new = counts["Rlon_hours"] * rlon_val
+    return {
+        "year": year,
+        "reported": reported,
+        "projected": projected,
+        "scenarios": scenarios,
+        "distribution": {
+            "Rtotal_payments": distribution(counts["Rtotal_payments"]),
+            "Rlinear_hours": distribution(counts["Rlinear_hours"]),
+            "Rlon_hours": distribution(counts["Rlon_hours"]),
+            "total_current": distribution(current),
+            "total_new": distribution(new),
+        },
+        "p_new_better": float((new > current).mean()),
+    }
+
+
+def project_file(path: str, year: str | None, through: str | None, scenarios: int, seed: int) -> tuple[str, dict]:
+    records = sort_records(load_timesheet_records(path))
+    employee = employee_id(path)
+    return employee, project_year(records, year, through, scenarios, seed, work_schedule=employee_schedule(employee))
+
+
+def print_projection(employee: str, projection: dict):
+    print(
+        f"-- {employee} {projection['year']}, reported {len(projection['reported'])} months,"
+        f" {projection['scenarios']} scenarios --"
+    )
+    header = "".join(f"{f'p{percentile}':>10}" for percentile in PERCENTILES)
+    print(f"  {'':<16}{'mean':>10}{header}")
+    for key in ["total_current", "total_new"]:
+        values = projection["distribution"][key]
+        print(f"  {key:<16}" + "".join(f"{value:>10.0f}" for value in values.values()))
+    print(f"  New model pays more in {projection['p_new_better'] * 100:.1f}% of the scenarios")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project the year-end payouts of both models.")
+    parser.add_argument("source", help="A Deltek dump, a directory of per-employee dumps or a manifest")
+    parser.add_argument("--year", help="Year to project (default: the latest)")
+    parser.add_argument("--through", help="Last reported month to use, 01-12 (default: the last complete month)")
+    parser.add_argument("-n", "--scenarios", type=int, default=100000, help="Scenarios (default: 100000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sampling (default: 0)")
+    parser.add_argument("-o", "--output", help="Write the projections to this JSON file")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.source) and args.source.endswith(".json"):
+        paths = [args.source]
+    else:
+        paths = list_timesheet_files(args.source)
+    count = len(paths)
+    workers = args.workers or os.cpu_count() or 1
+    chunksize = max(1, count // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        projections = dict(
+            pool.map(
+                project_file,
+                paths,
+                [args.year] * count,
+                [args.through] * count,
+                [args.scenarios] * count,
+                [args.seed] * count,
+                chunksize=chunksize,
+            )
+        )
+
+    if len(projections) == 1 or not args.output:
+        for employee, projection in projections.items():
+            print_projection(employee, projection)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(projections, fp, indent=2)
+        print(f"Projections for {len(projections)} employees written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Compare the current and the proposed salary model over a whole grid of Rtotal and Rlinear rates.
+
+The hour quantities of a year (Rtotal payments, Rlinear hours and Rlön hours) do not depend on the rates,
+so they are calculated once per employee and every rate combination is then evaluated with array math.
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from batch import employee_id, list_timesheet_files, load_timesheet_records
+from bonusmodel_v1 import get_rates, run_engine, selected_engine
+from json_stream import iter_file_records
+
+# Employees evaluated at a time, keeps the (employees x rates) arrays small for company sized grids
+CHUNK_SIZE = 256
+
+
+def hour_counts(report: dict) -> dict[str, tuple[float, float, float]]:
+    """The Rtotal payments, Rlinear hours and Rlön hours of each year in a report."""
+
+    counts = {}
+    for year, year_data in report["years"].items():
+        info = year_data["info"]
+        counts[year] = (info["Rtotal_payments"], info["Rlinear_hours"], info["Rlon_hours"])
+    return counts
+
+
+def employee_hour_counts(path: str, checkpoint_dir: str = "checkpoints") -> tuple[str, dict]:
+    """Run the models once for an employee dump, without printing, and return the hour counts.
+
+    With ENGINE=incremental the employee's checkpoints are kept in ``<checkpoint_dir>/<employee>.checkpoints.json``,
+    the workers never share a checkpoint file.
+    """
+
+    if selected_engine() == "streaming":
+        records = iter_file_records(path)
+    else:
+        records = load_timesheet_records(path)
+    employee = employee_id(path)
+    checkpoint_file = os.path.join(checkpoint_dir, f"{employee}.checkpoints.json")
+    report = run_engine(records, {}, output_file=None, checkpoint_file=checkpoint_file, employee=employee)
+    return employee, hour_counts(report)
+
+
+def load_hour_counts(source: str, workers: int | None = None, checkpoint_dir: str = "checkpoints") -> dict[str, dict]:
+    """Hour counts by employee and year.
+
+    Args:
+        source (str): A ``summary.json`` written by batch mode, or a directory of per-employee Deltek
+            dumps (or a manifest listing them) to run the models on.
+        workers (int, optional): Number of worker processes for dumps. Defaults to the number of CPUs.
+        checkpoint_dir (str, optional): Where the employees' checkpoints are kept with ENGINE=incremental.
+            Defaults to "checkpoints".
+
+    Returns:
+        dict[str, dict]: By employee, the ``hour_counts`` of each year.
+    """
+
+    if os.path.isfile(source) and source.endswith("summary.json"):
+        with open(source, "r") as fp:
+            summary = json.load(fp)
+        return {
+            employee: {
+                year: (totals["Rtotal_payments"], totals["Rlinear_hours"], totals["Rlon_hours"])
+                for year, totals in years.items()
+            }
+            for employee, years in summary["employees"].items()
+        }
+
+    paths = list_timesheet_files(source)
+    if selected_engine() == "incremental":
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(
+            pool.map(partial(employee_hour_counts, checkpoint_dir=checkpoint_dir), paths, chunksize=chunksize)
+        )
+
+
+def count_matrix(counts_by_employee: dict[str, dict], year: str) -> tuple[list[str], np.ndarray]:
+    """The hour counts of one year as an (employees x 3) array, for the employees with lines that year."""
+
+    employees = [employee for employee, years in counts_by_employee.items() if year in years]
+    counts = np.array([counts_by_employee[employee][year] for employee in employees], dtype=np.float64)
+    return employees, counts.reshape(-1, 3)
+
+
+def rlon_rate(rtot: np.ndarray, rlin: np.ndarray) -> np.ndarray:
+    """The Rlön rate of the proposed model, ``ceil(rlin + rtot / 37)`` as in ``model_rates``."""
+    return np.ceil(rlin + rtot / 37)
+
+
+def rate_grid(rtot_values, rlin_values) -> tuple[np.ndarray, np.ndarray]:
+    """Every combination of the Rtotal and Rlinear values, as two flat arrays."""
+
+    rtot, rlin = np.meshgrid(np.asarray(rtot_values), np.asarray(rlin_values), indexing="ij")
+    return rtot.ravel(), rlin.ravel()
+
+
+def payouts(counts: np.ndarray, rtot: np.ndarray, rlin: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Payout of the current and the proposed model for each employee (rows) and rate combination (columns)."""
+
+    rtot_count, rlin_count, rlon_count = counts[:, 0:1], counts[:, 1:2], counts[:, 2:3]
+    current = rtot_count * rtot + rlin_count * rlin
+    new = rlon_count * rlon_rate(rtot, rlin)
+    return current, new
+
+
+def sweep(counts: np.ndarray, rtot: np.ndarray, rlin: np.ndarray) -> dict[str, np.ndarray]:
+    """Evaluate both models for every employee over every rate combination.
+
+    Args:
+        counts (np.ndarray): Hour counts, (employees x 3), see ``count_matrix``.
+        rtot (np.ndarray): Rtotal rate of each combination.
+        rlin (np.ndarray): Rlinear rate of each combination.
+
+    Returns:
+        dict[str, np.ndarray]: Per rate combination: ``rtotal``, ``rlin``, ``rlon``, the summed payouts
+        ``total_current`` and ``total_new``, the number of employees paid more by the new model
+        ``better_off_new``, and ``break_even_rlon``, the Rlön rate at which the new model would cost
+        the same as the current one.
+    """
+
+    rtot = np.asarray(rtot, dtype=np.float64)
+    rlin = np.asarray(rlin, dtype=np.float64)
+    total_current = np.zeros(len(rtot))
+    total_new = np.zeros(len(rtot))
+    better_off_new = np.zeros(len(rtot), dtype=np.int64)
+    for start in range(0, len(counts), CHUNK_SIZE):
+        current, new = payouts(counts[start : start + CHUNK_SIZE], rtot, rlin)
+        total_current += current.sum(axis=0)
+        total_new += new.sum(axis=0)
+        better_off_new += (new > current).sum(axis=0)
+
+    rlon_hours = counts[:, 2].sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        break_even_rlon = np.where(rlon_hours > 0, total_current / rlon_hours, np.inf)
+    return {
+        "rtotal": rtot,
+        "rlin": rlin,
+        "rlon": rlon_rate(rtot, rlin),
+        "total_current": total_current,
+        "total_new": total_new,
+        "better_off_new": better_off_new,
+        "break_even_rlon": break_even_rlon,
+    }
+
+
+def parse_range(value: str) -> np.ndarray:
+    """Parse "start:stop:step" (stop included) or a comma separated list of rates."""
+
+    if ":" in value:
+        start, stop, step = (float(part) for part in value.split(":"))
+        return np.arange(start, stop + step / 2, step)
+    return np.array([float(part) for part in value.split(",")])
+
+
+def write_sweep(result: dict[str, np.ndarray], path: str):
+    with open(path, "w", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(result.keys())
+        writer.writerows(zip(*(values.tolist() for values in result.values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the salary models over a grid of Rtotal and Rlinear rates")
+    parser.add_argument("source", help="Batch summary.json, or a directory of per-employee Deltek dumps")
+    parser.add_argument("--rtotal", default="1500:3000:50", help="Rtotal rates, start:stop:step or a list")
+    parser.add_argument("--rlin", default="20:80:1", help="Rlinear rates, start:stop:step or a list")
+    parser.add_argument("--year", help="Year to compare (default: the latest)")
+    parser.add_argument("-o", "--output", help="Write every rate combination to this CSV file")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument(
+        "--checkpoints", default="checkpoints", help="Directory of the ENGINE=incremental checkpoints of the employees"
+    )
+    args = parser.parse_args()
+
+    counts_by_employee = load_hour_counts(args.source, args.workers, args.checkpoints)
+    years = sorted({year for years in counts_by_employee.values() for year in years})
+    if not years:
+        raise Exception("No timesheet lines found")
+    year = args.year if args.year else years[-1]
+    employees, counts = count_matrix(counts_by_employee, year)
+
+    start = time.perf_counter()
+    rtot, rlin = rate_grid(parse_range(args.rtotal), parse_range(args.rlin))
+    result = sweep(counts, rtot, rlin)
+    elapsed = time.perf_counter() - start
+
+    print(f"-- {year} --")
+    print(f"  Swept {len(rtot)} rate combinations for {len(employees)} employees in {elapsed:.3f}s")
+    difference = result["total_new"] - result["total_current"]
+    for label, index in [("Cheapest", int(np.argmin(difference))), ("Most expensive", int(np.argmax(difference)))]:
+        print(
+            f"  {label} new model: Rtotal={result['rtotal'][index]:.0f} Rlin={result['rlin'][index]:.0f}"
+            f" Rlön={result['rlon'][index]:.0f}: {difference[index]:+.0f} kr,"
+            f" {result['better_off_new'][index]} of {len(employees)} better off"
+        )
+    rtot_val, rlin_val, rlon_val = get_rates()
+    configured = sweep(counts, np.array([rtot_val]), np.array([rlin_val]))
+    print(
+        f"  At Rtotal={rtot_val} Rlin={rlin_val} the new model costs the same as the current one with"
+        f" Rlön={configured['break_even_rlon'][0]:.1f} (proposed {rlon_val})"
+    )
+
+    if args.output:
+        write_sweep(result, args.output)
+        print(f"  Written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
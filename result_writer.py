@@ -0,0 +1,82 @@
+"""Machine-readable results for payroll tools, streamed as JSON Lines or CSV through a buffered file."""
+
+import csv
+import json
+
+YEAR_FIELDS = [
+    "employee",
+    "year",
+    "Rtotal_rate",
+    "Rlinear_rate",
+    "Rlon_rate",
+    "Rtotal_payments",
+    "Rlinear_hours",
+    "Rlon_hours",
+    "Rtotal_hours_lost",
+    "Rtotal_december",
+    "total_current",
+    "total_new",
+]
+
+MONTH_FIELDS = [
+    "employee",
+    "year",
+    "month",
+    "hours",
+    "hours_adjusted_rtotal",
+    "hours_adjusted_rlin",
+    "hours_adjusted_rlon",
+    "Rtotal_received",
+    "rtot_bank",
+    "Rlin",
+    "Rlön",
+]
+
+BUFFER_SIZE = 1 << 20
+
+
+class result_writer:
+    """Writes year rows, and optionally month rows, to JSON Lines or CSV files.
+
+    JSON Lines puts both kinds in one file, told apart by their "record" field ("year" or "month").
+    CSV writes the year rows to ``path`` and the month rows next to it, to ``<name>_months.csv``.
+    """
+
+    def __init__(self, path: str, output_format: str = "jsonl", months: bool = False):
+        if output_format not in ["jsonl", "csv"]:
+            raise Exception(f"Unknown output format {output_format}")
+        self.output_format = output_format
+        self.months = months
+        self.files = [open(path, "w", newline="", buffering=BUFFER_SIZE)]
+        if output_format == "csv":
+            self.year_writer = csv.DictWriter(self.files[0], YEAR_FIELDS)
+            self.year_writer.writeheader()
+            if months:
+                root, _ = path.rsplit(".", 1) if "." in path else (path, "")
+                self.files.append(open(f"{root}_months.csv", "w", newline="", buffering=BUFFER_SIZE))
+                self.month_writer = csv.DictWriter(self.files[1], MONTH_FIELDS)
+                self.month_writer.writeheader()
+
+    def write_year(self, row: dict):
+        if self.output_format == "csv":
+            self.year_writer.writerow(row)
+        else:
+            self.files[0].write(json.dumps({"record": "year", **row}, ensure_ascii=False) + "\n")
+
+    def write_month(self, row: dict):
+        if not self.months:
+            return
+        if self.output_format == "csv":
+            self.month_writer.writerow(row)
+        else:
+            self.files[0].write(json.dumps({"record": "month", **row}, ensure_ascii=False) + "\n")
+
+    def close(self):
+        for fp in self.files:
+            fp.close()
+
+    def __enter__(self) -> "result_writer":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,371 @@
+"""Salary models described as data, all evaluated in one pass over the timesheet lines.
+
+A model definition (see ``salary_models.json``, or the file in envar SALARY_MODELS) says which line types count
+towards the model, the monthly threshold and how it is adjusted, whether surplus hours are banked, the year-end
+retroactive rule and the rate paid. The lines of a month are classified once into the line types below, and
+summed into one accumulator per distinct group of line types used by any model. Every model is then evaluated
+from those monthly sums, so comparing several proposals costs about as much as computing one.
+
+Line types are the bonus types of ``classify`` (billable, bonus, internal, unknown, VAB, parental, vacation,
+förtroendeuppdrag), where vacation and förtroendeuppdrag directly after a billable day are told apart as
+``vacation_after_billable`` and ``förtroendeuppdrag_after_billable``, as they count like the surrounding time.
+
+A model definition:
+
+    name: Name of the model.
+    pays: "month" for a payment per month the threshold is reached (like Rtotal), "hour" for a payment per hour
+        above the threshold (like Rlinear and Rlön).
+    rate: Paid per payment or hour, a number or one of the configured rates "Rtotal", "Rlinear" or "Rlon".
+    hours: Terms summed, in order, into the counted hours of a month. A term is a line type or a list of line
+        types summed together line by line.
+    threshold: Hours required in a month, a number or "month" for the working hours of the month. With a
+        part-time schedule a number is reduced by the scheduled share of the month.
+    threshold_reduced_by (optional): Terms subtracted from the threshold, like VAB and parental leave for Rtotal.
+    scale_threshold (optional): ``{"when": terms, "months": [...]}``, in the listed months with hours of the
+        ``when`` terms the threshold is scaled by the counted hours over the working hours of the month.
+    bank (optional): Only for "month", the hours above the threshold are banked and make up for later months
+        below it, and the surplus of December is carried into the next year. Defaults to false.
+    retroactive (optional): Only for "month", ``{"within", "payments", "full_payments",
+        "hours_per_extra_payment", "max_extra_payments"}``. With counted hours of the year within ``within``
+        hours of the working hours of the year, the year pays ``payments``. With all the working hours, it pays
+        ``full_payments`` plus a part payment per ``hours_per_extra_payment`` hours above them.
+
+Plans combine the payouts of models, like the current plan of Rtotal and Rlinear.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from bonusmodel_v1 import (
+    add_unknown,
+    classify,
+    get_rates,
+    new_report,
+    sort_records,
+)
+from profiling import stage
+from work_calendar import employee_schedule, monthly_hours, schedule
+
+LINE_TYPES = [
+    "billable",
+    "bonus",
+    "internal",
+    "unknown",
+    "VAB",
+    "parental",
+    "vacation",
+    "vacation_after_billable",
+    "förtroendeuppdrag",
+    "förtroendeuppdrag_after_billable",
+]
+
+RATES = ["Rtotal", "Rlinear", "Rlon"]
+
+
+def models_file() -> str:
+    """The model definitions from envar SALARY_MODELS, or the salary_models.json next to this file."""
+    if "SALARY_MODELS" in os.environ:
+        return os.environ["SALARY_MODELS"]
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "salary_models.json")
+
+
+def load_models(path: str | None = None) -> dict:
+    """Load and check model definitions, see the module docstring for the format."""
+
+    with open(path or models_file(), "r", encoding="utf-8") as fp:
+        definitions = json.load(fp)
+    check_models(definitions)
+    return definitions
+
+
+def _term(term) -> tuple[str, ...]:
+    return (term,) if isinstance(term, str) else tuple(term)
+
+
+def check_models(definitions: dict):
+    """Raise an Exception describing the first invalid model or plan definition."""
+
+    names = set()
+    for model in definitions["models"]:
+        name = model.get("name")
+        if not name or name in names:
+            raise Exception(f"Model without a name or defined twice: {name}")
+        names.add(name)
+        if model.get("pays") not in ["month", "hour"]:
+            raise Exception(f"Model {name}: pays must be month or hour")
+        rate = model.get("rate")
+        if not isinstance(rate, (int, float)) and rate not in RATES:
+            raise Exception(f"Model {name}: rate must be a number or one of {', '.join(RATES)}")
+        threshold = model.get("threshold")
+        if not isinstance(threshold, (int, float)) and threshold != "month":
+            raise Exception(f"Model {name}: threshold must be a number or month")
+        if model["pays"] == "hour" and (model.get("bank") or "retroactive" in model):
+            raise Exception(f"Model {name}: only models paying per month have a bank or retroactive payments")
+        terms = model.get("hours", []) + model.get("threshold_reduced_by", [])
+        terms += model.get("scale_threshold", {}).get("when", [])
+        if not model.get("hours"):
+            raise Exception(f"Model {name}: no hours counted")
+        for term in terms:
+            for line_type in _term(term):
+                if line_type not in LINE_TYPES:
+                    raise Exception(f"Model {name}: unknown line type {line_type}")
+
+    for plan, models in definitions.get("plans", {}).items():
+        for name in models:
+            if name not in names:
+                raise Exception(f"Plan {plan}: unknown model {name}")
+
+
+def compile_models(definitions: dict) -> dict:
+    """Number the distinct terms of the models, and list the terms each line type is added to.
+
+    Returns:
+        dict: ``terms``, the distinct terms in order, ``targets``, the term indices by line type, and ``models``,
+            the definitions with their terms replaced by indices.
+    """
+
+    terms = []
+    models = []
+    for model in definitions["models"]:
+        compiled = dict(model)
+        for key in ["hours", "threshold_reduced_by"]:
+            compiled[key] = [_add_term(terms, term) for term in model.get(key, [])]
+        if "scale_threshold" in model:
+            compiled["scale_threshold"] = {
+                "when": [_add_term(terms, term) for term in model["scale_threshold"]["when"]],
+                "months": model["scale_threshold"]["months"],
+            }
+        models.append(compiled)
+
+    targets = {line_type: [] for line_type in LINE_TYPES}
+    for index, term in enumerate(terms):
+        for line_type in term:
+            targets[line_type].append(index)
+    return {"terms": terms, "targets": targets, "models": models, "plans": definitions.get("plans", {})}
+
+
+def _add_term(terms: list, term) -> int:
+    term = _term(term)
+    if term not in terms:
+        terms.append(term)
+    return terms.index(term)
+
+
+def sum_month_terms(days: dict, targets: dict, term_count: int, last_day_was_billable: bool, unknown: dict):
+    """Classify the lines of a month and sum their hours into every term, in line order.
+
+    Returns:
+        tuple[list, bool]: The sum of each term and whether the last day of the month was billable.
+    """
+
+    sums = [0] * term_count
+    for lines in days.values():
+        day_is_billable = None
+        for line in lines:
+            line_type = classify(line.jobnumber, line.activitynumber, line.taskname, line.invoiceable, line.internaljob)
+            match line_type:
+                case "billable":
+                    day_is_billable = True
+                case "vacation":
+                    if last_day_was_billable:
+                        line_type = "vacation_after_billable"
+                    day_is_billable = "vacation"
+                case "förtroendeuppdrag":
+                    if last_day_was_billable:
+                        line_type = "förtroendeuppdrag_after_billable"
+                    day_is_billable = "förtroendeuppdrag"
+                case "unknown":
+                    add_unknown(unknown, line.jobnumber, line.jobname, line.activitynumber, line.entrytext, line.hours)
+            for index in targets[line_type]:
+                sums[index] += line.hours
+
+        # As in ``sum_month``, the last billable, vacation or förtroendeuppdrag line decides the day, and
+        # vacation and förtroendeuppdrag days keep the state of the days around them
+        if day_is_billable is None:
+            last_day_was_billable = False
+        elif day_is_billable is True:
+            last_day_was_billable = True
+    return sums, last_day_was_billable
+
+
+def _terms_total(sums: list, indices: list[int]):
+    total = 0
+    for index in indices:
+        total += sums[index]
+    return total
+
+
+def evaluate_month(
+    model: dict, state: dict, sums: list, month: str, hours_for_month: float, share: float = 1
+) -> dict:
+    """Evaluate a model for one month, updating the model's ``state`` for the year (and bank).
+
+    ``share`` is the scheduled share of the full-time month, that fixed thresholds are reduced by.
+    """
+
+    hours = _terms_total(sums, model["hours"])
+    threshold = hours_for_month if model["threshold"] == "month" else model["threshold"] * share
+    if model["threshold_reduced_by"]:
+        threshold = threshold - _terms_total(sums, model["threshold_reduced_by"])
+    if "scale_threshold" in model:
+        scale = model["scale_threshold"]
+        if month in scale["months"] and _terms_total(sums, scale["when"]) > 0:
+            threshold = max(min(threshold, hours / hours_for_month * threshold), 0)
+    state["year_hours"] += hours
+
+    result = {"hours": hours, "threshold": threshold}
+    if model["pays"] == "hour":
+        quantity = max(hours - threshold, 0)
+    elif hours >= threshold:
+        quantity = 1
+        if model.get("bank"):
+            state["bank"] += hours - threshold
+            state["carry"] = hours - threshold
+    else:
+        quantity = 0
+        state["carry"] = 0
+        if model.get("bank") and hours + state["bank"] >= threshold:
+            quantity = 1
+            state["bank"] -= threshold - hours
+    state["quantity"] += quantity
+    result["quantity"] = quantity
+    if model.get("bank"):
+        result["bank"] = state["bank"]
+    return result
+
+
+def finish_year(model: dict, state: dict, yearly_hours: int):
+    """Apply the year-end retroactive rule of a model."""
+
+    if "retroactive" not in model:
+        return
+    rule = model["retroactive"]
+    if state["year_hours"] < yearly_hours - rule["within"]:
+        return
+    if state["year_hours"] >= yearly_hours:
+        extra = (state["year_hours"] - yearly_hours) / rule["hours_per_extra_payment"]
+        state["quantity"] = rule["full_payments"] + min(rule["max_extra_payments"], extra)
+        # The surplus is paid out, not carried over
+        state["carry"] = 0
+    else:
+        state["quantity"] = rule["payments"]
+
+
+def calculate_models(
+    records: dict[str, dict[str, dict[str, list]]],
+    definitions: dict | None = None,
+    unknown: dict = None,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Evaluate every model of the definitions over the timesheet lines, with one pass over the lines.
+
+    Args:
+        records (dict): Timesheet lines grouped by ``sort_records``.
+        definitions (dict, optional): Model definitions, see ``load_models``. Defaults to the models file.
+        unknown (dict, optional): Filled with the hours of unclassified job/activity numbers.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to the rates of
+            envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        dict: ``info`` with the rates, and by year, ``models`` with the ``quantity`` (payments or hours), the
+            ``hours`` counted and the ``payout`` of each model, ``plans`` with the payout of each plan, and by
+            month the ``hours``, ``threshold``, ``quantity`` and ``bank`` of each model.
+    """
+
+    if definitions is None:
+        definitions = load_models()
+    if unknown is None:
+        unknown = {}
+    if rates is None:
+        rates = get_rates()
+    compiled = compile_models(definitions)
+    models = compiled["models"]
+    report = new_report(*rates)
+    report["models"] = [model["name"] for model in models]
+
+    carry = {model["name"]: 0 for model in models}
+    last_day_was_billable = False
+    for year, months in records.items():
+        with stage("holidays", year=year):
+            hours_by_month, shares = monthly_hours(int(year), work_schedule)
+        states = {
+            model["name"]: {"quantity": 0, "year_hours": 0, "bank": carry[model["name"]], "carry": 0}
+            for model in models
+        }
+        year_report = {"models": {}, "plans": {}, "months": {}}
+        for month, days in months.items():
+            with stage("classify", year=year, month=month):
+                sums, last_day_was_billable = sum_month_terms(
+                    days, compiled["targets"], len(compiled["terms"]), last_day_was_billable, unknown
+                )
+            with stage("model", year=year, month=month):
+                year_report["months"][month] = {
+                    model["name"]: evaluate_month(
+                        model,
+                        states[model["name"]],
+                        sums,
+                        month,
+                        hours_by_month[int(month) - 1],
+                        shares[int(month) - 1],
+                    )
+                    for model in models
+                }
+
+        for model in models:
+            state = states[model["name"]]
+            finish_year(model, state, sum(hours_by_month))
+            carry[model["name"]] = state["carry"] if model.get("bank") else 0
+            rate = report["info"][model["rate"]] if isinstance(model["rate"], str) else model["rate"]
+            year_report["models"][model["name"]] = {
+                "pays": model["pays"],
+                "quantity": state["quantity"],
+                "hours": state["year_hours"],
+                "payout": state["quantity"] * rate,
+            }
+        for plan, names in compiled["plans"].items():
+            year_report["plans"][plan] = sum(year_report["models"][name]["payout"] for name in names)
+        report["years"][year] = year_report
+    return report
+
+
+def print_models_report(report: dict, output_file=sys.stdout):
+    for year, year_report in report["years"].items():
+        print(f"-- {year} --", file=output_file)
+        for name, result in year_report["models"].items():
+            unit = "payments" if result["pays"] == "month" else "hours"
+            print(
+                f"  {name:<16} {result['quantity']:>7.1f} {unit:<8} of {result['hours']:>7.1f}h counted"
+                f" {result['payout']:>9.0f} kr",
+                file=output_file,
+            )
+        for plan, payout in year_report["plans"].items():
+            print(f"  Plan {plan:<48} {payout:>9.0f} kr", file=output_file)
+        print("", file=output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the salary model definitions on a timesheet dump.")
+    parser.add_argument("dump", nargs="?", default="timesheets.json", help="Deltek dump (default: timesheets.json)")
+    parser.add_argument("-m", "--models", help="Model definitions (default: envar SALARY_MODELS or salary_models.json)")
+    parser.add_argument(
+        "-e", "--employee", default="me", help="Whose schedule in envar SCHEDULES applies (default: me)"
+    )
+    args = parser.parse_args()
+
+    from batch import load_timesheet_records
+
+    report = calculate_models(
+        sort_records(load_timesheet_records(args.dump)),
+        load_models(args.models),
+        work_schedule=employee_schedule(args.employee),
+    )
+    print_models_report(report)
+
+
+if __name__ == "__main__":
+    main()
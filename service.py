@@ -0,0 +1,270 @@
+"""Local calculation service that keeps the timesheets of many employees warm in memory.
+
+The first request for an employee loads their Deltek dump, runs the models once and keeps the report. The hour
+quantities of a year do not depend on the rates, so "the yearly result of employee X with rates Y" is then
+answered from memory in well under a millisecond. A dump is loaded again when its file changes, and the dumps of
+the source are listed again for an employee that is not known yet and for /employees, so dumps added or removed
+while the service runs are picked up. The timecode mapping and the holiday tables are loaded once when the service
+starts.
+
+    python service.py dumps/                    # http://127.0.0.1:8765
+    python service.py dumps/ --socket calc.sock # Unix socket
+    curl "http://127.0.0.1:8765/result?employee=emp0001&rtotal=2200&rlin=45"
+
+Endpoints, all answering JSON:
+
+    GET /employees                                      The employees of the source
+    GET /result?employee=X[&rtotal=R][&rlin=R][&year=Y] Yearly totals with the rates (default RTOTAL/RLIN)
+    GET /months?employee=X&year=Y                       Monthly results and combined timesheet lines of a year
+"""
+
+import argparse
+import datetime
+import json
+import os
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from batch import employee_id, list_timesheet_files, load_timesheet_records, yearly_totals
+from bonusmodel_v1 import (
+    calculate_years,
+    get_monthly_billable_hours_by_year,
+    get_rates,
+    get_timecode_mapping,
+    model_rates,
+    new_report,
+    rollup_lines,
+    sort_records,
+)
+from work_calendar import employee_schedule
+
+DEFAULT_PORT = 8765
+# Years back from the current one whose holiday tables are loaded at start
+WARM_YEARS = 10
+
+
+class calculation_service:
+    """The reports of the employees of a source, calculated on first use and kept in memory.
+
+    Safe to use from many threads: each employee is calculated by one thread at a time, and the cached
+    reports are never modified after they are stored.
+    """
+
+    def __init__(self, source: str):
+        """
+        Args:
+            source (str): A Deltek dump of one employee, a directory with one ``<employee>.json`` dump per
+                employee, or a manifest file listing them (see ``batch.list_timesheet_files``).
+        """
+
+        self.source = source
+        self._lock = threading.Lock()
+        self._employee_locks = {}
+        self._entries = {}
+        self._paths = {}
+        self.refresh()
+
+    def refresh(self):
+        """List the employees of the source again, for dumps added or removed since the last listing."""
+
+        if os.path.isfile(self.source) and self.source.endswith(".json"):
+            paths = [self.source]
+        else:
+            paths = list_timesheet_files(self.source)
+        with self._lock:
+            self._paths = {employee_id(path): path for path in paths}
+            for employee in list(self._entries):
+                if employee not in self._paths:
+                    del self._entries[employee]
+
+    def employees(self) -> list[str]:
+        return sorted(self._paths)
+
+    def _employee_lock(self, employee: str) -> threading.Lock:
+        with self._lock:
+            if employee not in self._employee_locks:
+                self._employee_locks[employee] = threading.Lock()
+            return self._employee_locks[employee]
+
+    def report(self, employee: str) -> dict:
+        """The report and unknown timecodes of an employee, calculated again if the dump has changed.
+
+        Returns:
+            dict: ``report`` as from ``calculate_years`` with ``keep_records=False``, and ``unknown``.
+        """
+
+        if employee not in self._paths:
+            # The dump may have been added since the employees were listed
+            self.refresh()
+            if employee not in self._paths:
+                raise KeyError(employee)
+        path = self._paths[employee]
+        with self._employee_lock(employee):
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self.refresh()
+                raise KeyError(employee)
+            entry = self._entries.get(employee)
+            if entry is None or entry["mtime"] != mtime:
+                # The lines are modified while they are classified, so they are only used by this thread
+                unknown = {}
+                try:
+                    records = sort_records(load_timesheet_records(path))
+                    report = calculate_years(
+                        records,
+                        unknown,
+                        None,
+                        keep_records=False,
+                        rates=get_rates(),
+                        work_schedule=employee_schedule(employee),
+                    )
+                except Exception as error:
+                    # An unreadable or corrupt dump is not a bad request, nor a missing employee or year
+                    raise Exception(f"Could not calculate {employee}: {error!r}") from error
+                entry = {"mtime": mtime, "report": report, "unknown": unknown}
+                self._entries[employee] = entry
+            return entry
+
+    def result(self, employee: str, rtot_val: int, rlin_val: int, year: str | None = None) -> dict:
+        """The yearly totals of an employee with the given rates, see ``batch.yearly_totals``."""
+
+        report = self.report(employee)["report"]
+        rates = model_rates(rtot_val, rlin_val)
+        totals = yearly_totals({"info": new_report(*rates)["info"], "years": report["years"]})
+        if year is not None:
+            if year not in totals:
+                raise KeyError(year)
+            totals = {year: totals[year]}
+        return {
+            "employee": employee,
+            "rates": {"Rtotal": rates[0], "Rlinear": rates[1], "Rlon": rates[2]},
+            "years": totals,
+        }
+
+    def months(self, employee: str, year: str) -> dict:
+        """The monthly results of an employee for a year, with the combined timesheet lines of each month."""
+
+        report = self.report(employee)["report"]
+        if year not in report["years"]:
+            raise KeyError(year)
+        months = {}
+        for month, month_data in report["years"][year]["months"].items():
+            values = {key: value for key, value in month_data.items() if key != "rollup"}
+            values["lines"] = list(rollup_lines(month_data["rollup"]))
+            months[month] = values
+        return {"employee": employee, "year": year, "info": report["years"][year]["info"], "months": months}
+
+    def preload(self, workers: int | None = None):
+        """Calculate every employee up front instead of on their first request."""
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(self.report, self.employees()))
+
+
+def warm_up(years: range):
+    """Load the timecode mapping and the holiday tables of the years before the first request."""
+
+    get_timecode_mapping()
+    for year in years:
+        get_monthly_billable_hours_by_year(year)
+
+
+def make_handler(service: calculation_service):
+    class handler(BaseHTTPRequestHandler):
+        def address_string(self) -> str:
+            # Unix socket clients have no address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def send_json(self, status: int, body: dict):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                match url.path:
+                    case "/employees":
+                        service.refresh()
+                        self.send_json(200, {"employees": service.employees()})
+                    case "/result":
+                        rtot_val, rlin_val, _ = get_rates()
+                        if "rtotal" in query:
+                            rtot_val = int(query["rtotal"])
+                        if "rlin" in query:
+                            rlin_val = int(query["rlin"])
+                        body = service.result(query["employee"], rtot_val, rlin_val, query.get("year"))
+                        self.send_json(200, body)
+                    case "/months":
+                        self.send_json(200, service.months(query["employee"], query["year"]))
+                    case _:
+                        self.send_json(404, {"error": f"Unknown path {url.path}"})
+            except KeyError as error:
+                if error.args and error.args[0] in ("employee", "year") and error.args[0] not in query:
+                    self.send_json(400, {"error": f"Missing parameter {error.args[0]}"})
+                else:
+                    self.send_json(404, {"error": f"Not found: {error.args[0]}"})
+            except ValueError as error:
+                self.send_json(400, {"error": str(error)})
+            except Exception as error:
+                # A corrupt dump or any other failure still gets an answer, instead of a closed connection
+                self.send_json(500, {"error": f"{type(error).__name__}: {error}"})
+
+    return handler
+
+
+class unix_http_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(service: calculation_service, host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: str = None):
+    """Answer requests until interrupted, on a local TCP port or on a Unix socket."""
+
+    handler = make_handler(service)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = unix_http_server(socket_path, handler)
+        where = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        where = f"http://{host}:{server.server_address[1]}"
+    print(f"Serving {len(service.employees())} employees on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve salary model results from timesheets kept in memory.")
+    parser.add_argument("source", help="A Deltek dump, a directory of per-employee dumps or a manifest")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--preload", action="store_true", help="Calculate every employee before serving")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of threads for --preload")
+    args = parser.parse_args()
+
+    service = calculation_service(args.source)
+    this_year = datetime.date.today().year
+    warm_up(range(this_year - WARM_YEARS, this_year + 2))
+    if args.preload:
+        service.preload(args.workers)
+    serve(service, args.host, args.port, args.socket)
+
+
+if __name__ == "__main__":
+    main()
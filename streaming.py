@@ -0,0 +1,200 @@
+"""Streaming calculation that folds timesheet records into per-month accumulators as they arrive.
+
+Each record is classified, added to the sums and the timecode rollup of its month, and then dropped, so
+memory stays flat however long the history is. The lines are added in the order they arrive, which gives
+exactly the sums of ``calculate_years`` as long as the lines of each year, month and day are grouped
+together in the stream, as they are in the date-ordered Deltek response.
+"""
+
+import sys
+from typing import Iterable
+
+from bonusmodel_v1 import (
+    add_to_rollup,
+    add_unknown,
+    classify_record,
+    evaluate_year,
+    get_rates,
+    new_month_sums,
+    new_report,
+    print_year_result,
+)
+from work_calendar import schedule
+
+
+class StreamOrderError(ValueError):
+    pass
+
+
+def new_month_accumulator() -> dict:
+    return {"sums": new_month_sums(), "rollup": {}}
+
+
+def add_line(month: dict, month_key: str, record: dict, last_day_was_billable: bool, unknown: dict) -> str:
+    """Classify one timesheet line and add it to its month.
+
+    Returns:
+        str: How the line affects whether the day counts as billable: "Yes", "Vacay",
+            "Förtroendeuppdrag" or "" when it does not.
+    """
+
+    sums = month["sums"]
+    hours = record["numbertransferred"]
+    bonus_type = classify_record(record)
+    line_type = bonus_type
+    day_is_billable = ""
+    match bonus_type:
+        case "internal":
+            sums["non_bonus"] += hours
+        case "unknown":
+            sums["unknown"] += hours
+            add_unknown(
+                unknown,
+                record["jobnumber"],
+                record["description"],
+                record["activitynumber"],
+                record["entrytext"],
+                hours,
+            )
+        case "billable":
+            sums["billed"] += hours
+            sums["bonus"] += hours
+            day_is_billable = "Yes"
+        case "vacation":
+            sums["bonus"] += hours
+            if last_day_was_billable:
+                sums["rlon_vacation"] += hours
+            if month_key in ["07", "08", "12", "01"]:
+                sums["rlin_vacation"] += hours
+            line_type += " /w bonus"
+            day_is_billable = "Vacay"
+        case "förtroendeuppdrag":
+            if last_day_was_billable:
+                sums["bonus"] += hours
+                sums["rlon_billable"] += hours
+                line_type += " /w bonus"
+            day_is_billable = "Förtroendeuppdrag"
+        case "VAB" | "parental":
+            sums["vab_equivalent"] += hours
+        case "bonus":
+            sums["bonus"] += hours
+
+    add_to_rollup(
+        month["rollup"],
+        record["jobnumber"],
+        record["activitynumber"],
+        record["taskname"],
+        line_type,
+        hours,
+        record["entrytext"],
+    )
+
+    return day_is_billable
+
+
+def calculate_years_streaming(
+    records: Iterable[dict],
+    unknown: dict = None,
+    output_file=sys.stdout,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Run the models over a stream of timesheet records, for example from ``stream_dailysheetlines``.
+
+    The report has the same structure as the one from ``calculate_years`` with ``keep_records=False``,
+    the months hold only the ``rollup`` of their lines.
+
+    Args:
+        records (Iterable[dict]): Timesheet records, consumed once.
+        unknown (dict, optional): Filled with the hours of unclassified job/activity numbers.
+        output_file (optional): Where the yearly results are printed, None to print nothing.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to
+            the rates of envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Raises:
+        StreamOrderError: Thrown when the lines of a year, month or day are not grouped together.
+
+    Returns:
+        dict: The report, see ``calculate_years``.
+    """
+
+    if unknown is None:
+        unknown = {}
+    if rates is None:
+        rates = get_rates()
+
+    report = new_report(*rates)
+    extra_bonus_hours_from_december = 0
+    last_day_was_billable = False
+
+    current_year = current_month = current_day = None
+    day_is_billable = "No"
+    month_sums = {}
+    month = None
+    seen_years, seen_months, seen_days = set(), set(), set()
+
+    def finish_day():
+        nonlocal last_day_was_billable
+        # This is relevant for how to count vacay or fiduciary duties,
+        # as they count the same as "surrounding time".
+        if day_is_billable == "No":
+            last_day_was_billable = False
+        elif day_is_billable == "Yes":
+            last_day_was_billable = True
+
+    def finish_month():
+        month_sums[current_month] = month["sums"]
+        report["years"][current_year]["months"][current_month] = {"rollup": month["rollup"]}
+
+    def finish_year():
+        nonlocal extra_bonus_hours_from_december
+        extra_bonus_hours_from_december = evaluate_year(
+            report["years"][current_year], current_year, month_sums, extra_bonus_hours_from_december, work_schedule
+        )
+        if output_file is not None:
+            print_year_result(report, current_year, unknown, output_file)
+
+    for record in records:
+        data = record["data"]
+        year, month_key, day = tuple(data["thedate"].split("-"))
+
+        if year != current_year or month_key != current_month or day != current_day:
+            if current_day is not None:
+                finish_day()
+            day_is_billable = "No"
+            if year != current_year or month_key != current_month:
+                if current_month is not None:
+                    finish_month()
+                if year != current_year:
+                    if current_year is not None:
+                        finish_year()
+                    if year in seen_years:
+                        raise StreamOrderError(f"Timesheet lines for {year} are not grouped together")
+                    seen_years.add(year)
+                    seen_months = set()
+                    report["years"][year] = {"info": {}, "months": {}}
+                    month_sums = {}
+                    current_year = year
+                if month_key in seen_months:
+                    raise StreamOrderError(f"Timesheet lines for {year}-{month_key} are not grouped together")
+                seen_months.add(month_key)
+                seen_days = set()
+                month = new_month_accumulator()
+                current_month = month_key
+            if day in seen_days:
+                raise StreamOrderError(f"Timesheet lines for {data['thedate']} are not grouped together")
+            seen_days.add(day)
+            current_day = day
+
+        line_effect = add_line(month, month_key, data, last_day_was_billable, unknown)
+        if line_effect:
+            day_is_billable = line_effect
+
+    if current_year is not None:
+        finish_day()
+        finish_month()
+        finish_year()
+
+    return report
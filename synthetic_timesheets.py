@@ -0,0 +1,229 @@
+"""Synthetic Deltek timesheet dumps for benchmarks and for trying the models without a Deltek account.
+
+Each employee gets a deterministic history from their seed: client assignments billed for months at a time,
+a summer vacation block and scattered vacation days, VAB days, parental leave blocks, sick days, internal time
+with bonus hours (181) and safety committee duties (280), and a few lines on timecodes that are not mapped.
+Lines are only reported on the working days of ``work_calendar``, without the Swedish public holidays.
+The dumps have the ``panes.filter.records`` layout of ``timesheets.json``.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from work_calendar import year_calendar
+
+INTERNAL_JOB = "9830Internt"
+ABSENCE_JOB = "9930Frånvaro"
+
+# (jobnumber, jobname, activitynumber, taskname, entrytext, invoiceable, internaljob)
+BONUS_HOURS = (INTERNAL_JOB, "Interntid", "230", "181", "Bonusgrundande interntid", False, True)
+SAFETY_COMMITTEE = (INTERNAL_JOB, "Interntid", "230", "280", "Skyddskommitten", False, True)
+INTERNAL_TIME = (INTERNAL_JOB, "Interntid", "230", "300", "Internt", False, True)
+VACATION = (ABSENCE_JOB, "Frånvaro", "100", "120", "Semester", False, True)
+PARENTAL_LEAVE = (ABSENCE_JOB, "Frånvaro", "100", "130", "Föräldraledig", False, True)
+VAB = (ABSENCE_JOB, "Frånvaro", "100", "140", "VAB", False, True)
+SICK_LEAVE = (ABSENCE_JOB, "Frånvaro", "100", "110", "Sjukdom", False, True)
+UNMAPPED = [
+    ("7010", "Sälj", "10", "1", "Offertarbete", False, False),
+    ("7020", "Rekrytering", "20", "1", "Intervjuer", False, False),
+]
+
+CLIENTS = ["Kund", "Bank", "Myndighet", "Försäkring", "Energi", "Telekom", "Handel", "Industri"]
+
+
+def working_days(year: int) -> list[datetime.date]:
+    """The weekdays of a year that are not public holidays or the eves treated as holidays."""
+    return year_calendar(year).workdays()
+
+
+def new_assignment(rng: random.Random, start: datetime.date) -> dict:
+    """The next client assignment, or some weeks on the bench without one (a None code)."""
+
+    if rng.random() < 0.1:
+        return {"code": None, "ends": start + datetime.timedelta(days=rng.randrange(7, 60))}
+    jobnumber = str(rng.randrange(1000000, 1100000))
+    return {
+        "code": (jobnumber, f"{rng.choice(CLIENTS)} {jobnumber[-3:]}", "100", "100", "Konsulttjänst", True, False),
+        "ends": start + datetime.timedelta(days=rng.randrange(90, 540)),
+    }
+
+
+def plan_year(rng: random.Random, profile: dict, days: list[datetime.date]) -> dict[datetime.date, tuple]:
+    """Pick the absence of each day of the year: vacation, parental leave, VAB or sick leave."""
+
+    absence = {}
+    year = days[0].year
+
+    # Three to five weeks of summer vacation, and most take the days between Christmas and New Year
+    summer_start = datetime.date(year, 6, 20) + datetime.timedelta(days=rng.randrange(0, 28))
+    summer_end = summer_start + datetime.timedelta(weeks=rng.randrange(3, 6))
+    for day in days:
+        if summer_start <= day < summer_end:
+            absence[day] = VACATION
+        elif day.month == 12 and day.day > 26 and rng.random() < 0.7:
+            absence[day] = VACATION
+    for day in rng.sample(days, rng.randrange(2, 8)):
+        absence.setdefault(day, VACATION)
+
+    if profile["children"] and rng.random() < profile["parental_leave"]:
+        start = rng.randrange(0, len(days) - 20)
+        for day in days[start : start + rng.randrange(10, 60)]:
+            absence[day] = PARENTAL_LEAVE
+
+    for _ in range(rng.randrange(0, 4 * profile["children"] + 1)):
+        start = rng.randrange(0, len(days) - 3)
+        for day in days[start : start + rng.randrange(1, 4)]:
+            absence.setdefault(day, VAB)
+
+    for _ in range(rng.randrange(0, 4)):
+        start = rng.randrange(0, len(days) - 5)
+        for day in days[start : start + rng.randrange(1, 6)]:
+            absence.setdefault(day, SICK_LEAVE)
+    return absence
+
+
+def day_lines(rng: random.Random, profile: dict, assignment: dict, day: datetime.date) -> list[tuple]:
+    """The (timecode, hours) lines of a working day without absence."""
+
+    lines = []
+    hours = 8.0
+    if day.weekday() == 4 and rng.random() < profile["bonus_hours"]:
+        bonus = rng.choice([1.0, 2.0, 4.0])
+        lines.append((BONUS_HOURS, bonus))
+        hours -= bonus
+    if profile["safety_committee"] and day.day <= 7 and day.weekday() == 2:
+        lines.append((SAFETY_COMMITTEE, 2.0))
+        hours -= 2.0
+    if rng.random() < 0.01:
+        unmapped = rng.choice([0.5, 1.0, 2.0])
+        lines.append((rng.choice(UNMAPPED), unmapped))
+        hours -= unmapped
+
+    if assignment["code"] is not None and rng.random() < profile["utilization"]:
+        overtime = rng.choice([0.0, 0.0, 0.0, 0.5, 1.0, 2.0]) if rng.random() < profile["overtime"] else 0.0
+        lines.append((assignment["code"], hours + overtime))
+    else:
+        lines.append((INTERNAL_TIME, hours))
+    return lines
+
+
+def generate_records(seed: int, start_year: int = 2019, years: int = 6) -> list[dict]:
+    """The timesheet records of one synthetic employee, in date order like the Deltek response.
+
+    Args:
+        seed (int): Seed of the employee, the same seed gives the same history.
+        start_year (int, optional): First year with lines. Defaults to 2019.
+        years (int, optional): Number of years. Defaults to 6.
+
+    Returns:
+        list[dict]: Records as in ``panes.filter.records`` of a Deltek dump.
+    """
+
+    rng = random.Random(seed)
+    profile = {
+        "utilization": rng.uniform(0.8, 0.99),
+        "overtime": rng.uniform(0.0, 0.4),
+        "bonus_hours": rng.uniform(0.0, 0.5),
+        "safety_committee": rng.random() < 0.15,
+        "children": rng.choice([0, 0, 1, 2, 3]),
+        "parental_leave": rng.uniform(0.1, 0.5),
+    }
+
+    records = []
+    assignment = None
+    for year in range(start_year, start_year + years):
+        days = working_days(year)
+        absence = plan_year(rng, profile, days)
+        for day in days:
+            if assignment is None or day >= assignment["ends"]:
+                assignment = new_assignment(rng, day)
+
+            if day in absence:
+                lines = [(absence[day], 8.0)]
+            else:
+                lines = day_lines(rng, profile, assignment, day)
+
+            thedate = day.isoformat()
+            weeknumber = day.isocalendar()[1]
+            for linenumber, (code, hours) in enumerate(lines, 1):
+                jobnumber, jobname, activitynumber, taskname, entrytext, invoiceable, internaljob = code
+                records.append(
+                    {
+                        "data": {
+                            "instancekey": f"{seed}-{thedate}-{linenumber}",
+                            "thedate": thedate,
+                            "weeknumber": weeknumber,
+                            "linenumber": linenumber,
+                            "jobnumber": jobnumber,
+                            "description": jobname,
+                            "activitynumber": activitynumber,
+                            "taskname": taskname,
+                            "entrytext": entrytext,
+                            "numberof": hours,
+                            "numbertransferred": hours,
+                            "timeregistrationunit": "hours",
+                            "invoiceable": invoiceable,
+                            "internaljob": internaljob,
+                        }
+                    }
+                )
+    return records
+
+
+def write_employee(path: str, seed: int, start_year: int, years: int) -> int:
+    """Write the dump of one synthetic employee, returns the number of lines."""
+
+    records = generate_records(seed, start_year, years)
+    # json.dumps encodes in C, json.dump would go through the pure Python encoder
+    dump = json.dumps({"panes": {"filter": {"records": records}}}, separators=(",", ":"), ensure_ascii=False)
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(dump)
+    return len(records)
+
+
+def write_employees(
+    directory: str, employees: int, start_year: int = 2019, years: int = 6, seed: int = 0, workers: int | None = None
+) -> int:
+    """Write ``<directory>/emp<n>.json`` dumps for a number of synthetic employees, across a process pool.
+
+    Returns:
+        int: The total number of lines written.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    width = max(4, len(str(employees - 1)))
+    paths = [os.path.join(directory, f"emp{n:0{width}d}.json") for n in range(employees)]
+    seeds = [seed + n for n in range(employees)]
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, employees // (workers * 4))
+    start_years = [start_year] * employees
+    year_counts = [years] * employees
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(write_employee, paths, seeds, start_years, year_counts, chunksize=chunksize))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Deltek timesheet dumps.")
+    parser.add_argument("target", help="A .json file for one employee, or a directory for many")
+    parser.add_argument("-n", "--employees", type=int, default=1, help="Number of employees (default: 1)")
+    parser.add_argument("--start-year", type=int, default=2019, help="First year with lines (default: 2019)")
+    parser.add_argument("--years", type=int, default=6, help="Number of years (default: 6)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first employee (default: 0)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    if args.target.endswith(".json"):
+        lines = write_employee(args.target, args.seed, args.start_year, args.years)
+        print(f"Wrote {lines} lines to {args.target}")
+    else:
+        lines = write_employees(args.target, args.employees, args.start_year, args.years, args.seed, args.workers)
+        print(f"Wrote {lines} lines for {args.employees} employees to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
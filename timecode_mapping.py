@@ -1,18 +1,121 @@
+import hashlib
 import json
+import sys
 
 
 class timeline_sheet_record:
-    def __init__(self):
-        pass
+    """Compact timesheet line holding only the Deltek fields the salary models use.
+
+    Repeated strings (dates, job, activity and task numbers, texts) are interned, so the lines of a long
+    history share them. The line can be read like the dicts it replaces, using either the Deltek field
+    names ("thedate", "numbertransferred", ...) or the keys of a parsed line ("hours", "type", "description"
+    for the entry text).
+    """
+
+    __slots__ = (
+        "date",
+        "jobnumber",
+        "activitynumber",
+        "taskname",
+        "hours",
+        "invoiceable",
+        "internaljob",
+        "entrytext",
+        "jobname",
+        "type",
+    )
+
+    _aliases = {"thedate": "date", "numbertransferred": "hours", "description": "entrytext"}
+
+    def __init__(
+        self,
+        date: str,
+        jobnumber: str,
+        activitynumber: str,
+        taskname: str,
+        hours: float,
+        invoiceable: bool,
+        internaljob: bool,
+        entrytext: str,
+        jobname: str = "",
+    ):
+        self.date = sys.intern(date)
+        self.jobnumber = sys.intern(jobnumber)
+        self.activitynumber = sys.intern(activitynumber)
+        self.taskname = sys.intern(taskname)
+        self.hours = hours
+        self.invoiceable = invoiceable
+        self.internaljob = internaljob
+        self.entrytext = sys.intern(entrytext)
+        self.jobname = sys.intern(jobname)
+        self.type = "unknown"
+
+    @classmethod
+    def from_deltek(cls, data: dict) -> "timeline_sheet_record":
+        """Create a line from the "data" of a Deltek dailytimesheetlines record."""
+        return cls(
+            data["thedate"],
+            data["jobnumber"],
+            data["activitynumber"],
+            data["taskname"],
+            data["numbertransferred"],
+            data["invoiceable"],
+            data["internaljob"],
+            data["entrytext"],
+            data["description"],
+        )
+
+    def __reduce__(self):
+        # Pickled as the constructor arguments, much faster than the generic state of a slotted class.
+        # The type is left out, it is set again when the line is classified.
+        return (
+            timeline_sheet_record,
+            (
+                self.date,
+                self.jobnumber,
+                self.activitynumber,
+                self.taskname,
+                self.hours,
+                self.invoiceable,
+                self.internaljob,
+                self.entrytext,
+                self.jobname,
+            ),
+        )
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, self._aliases.get(key, key))
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        setattr(self, self._aliases.get(key, key), value)
+
+    def __contains__(self, key: str) -> bool:
+        return self._aliases.get(key, key) in self.__slots__
+
+    def __repr__(self) -> str:
+        return (
+            f"timeline_sheet_record({self.date}, job={self.jobnumber}, activity={self.activitynumber}, "
+            f"task={self.taskname}, hours={self.hours}, type={self.type})"
+        )
 
 
 class timecode_mapping:
+    """Mapping from Deltek timecodes (jobnumber, activitynumber, taskname) to bonus types.
 
-    def __init__(self):
-        pass
+    The nested JSON mapping is compiled into flat lookup tables when loaded, with the activity,
+    "any" activity and job level fallbacks resolved, and every classified key is memoized. Classifying
+    a line is then a single dict lookup for any timecode seen before.
+    """
 
-    def __init__(self, path: str):
-        self.load_mapping(path)
+    def __init__(self, path: str = ""):
+        self.mappings = {}
+        self.path = path
+        self.compile()
+        if path:
+            self.load_mapping(path)
 
     def load_mapping(self, path: str) -> bool:
         self.mappings = {}
@@ -24,6 +127,8 @@ class timecode_mapping:
         except Exception as e:
             print(str(e))
             return False
+        finally:
+            self.compile()
 
     def save_mapping(self) -> bool:
         try:
@@ -34,29 +139,55 @@ class timecode_mapping:
             print(str(e))
             return False
 
-    def classify_record(self, record) -> str:
-
-        jobnumber = record["jobnumber"]
-        activitynumber = record["activitynumber"]
-        taskname = record["taskname"]
-
-        if jobnumber in self.mappings:
-            activities = self.mappings[jobnumber]["activities"]
-            if activitynumber in activities:
-                if taskname in activities[activitynumber]["tasks"]:
-                    return activities[activitynumber]["tasks"][taskname]["bonus_type"]
-                else:
-                    if "bonus_type" in activities[activitynumber]:
-                        return activities[activitynumber]["bonus_type"]
+    def compile(self):
+        """Flatten the nested mapping into lookup tables, in the order classify_record checks them."""
+        self._by_task = {}  # (jobnumber, activitynumber, taskname) -> bonus type
+        self._by_activity = {}  # (jobnumber, activitynumber) -> bonus type
+        self._by_any_task = {}  # (jobnumber, taskname) -> bonus type
+        self._by_job = {}  # jobnumber -> bonus type
+        self._memo = {}
+        for jobnumber, job in self.mappings.items():
+            activities = job.get("activities", {})
+            for activitynumber, activity in activities.items():
+                if activitynumber == "any":
+                    continue
+                for taskname, task in activity.get("tasks", {}).items():
+                    self._by_task[(jobnumber, activitynumber, taskname)] = task["bonus_type"]
+                if "bonus_type" in activity:
+                    self._by_activity[(jobnumber, activitynumber)] = activity["bonus_type"]
             if "any" in activities:
-                if taskname in activities["any"]["tasks"]:
-                    return activities["any"]["tasks"][taskname]["bonus_type"]
-                elif "bonus_type" in activities["any"]:
-                    return activities["any"]["bonus_type"]
-            if "bonus_type" in self.mappings[jobnumber]:
-                return self.mappings[jobnumber]["bonus_type"]
+                for taskname, task in activities["any"].get("tasks", {}).items():
+                    self._by_any_task[(jobnumber, taskname)] = task["bonus_type"]
+                if "bonus_type" in activities["any"]:
+                    self._by_job[jobnumber] = activities["any"]["bonus_type"]
+                    continue
+            if "bonus_type" in job:
+                self._by_job[jobnumber] = job["bonus_type"]
 
-        return "unknown"
+    def fingerprint(self) -> str:
+        """Stable hash of the mapping, to tell whether results classified with it are still valid."""
+        content = json.dumps(self.mappings, sort_keys=True).encode("utf-8")
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    def classify(self, jobnumber: str, activitynumber: str, taskname: str) -> str:
+        key = (jobnumber, activitynumber, taskname)
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+
+        bonus_type = self._by_task.get(key)
+        if bonus_type is None:
+            bonus_type = self._by_activity.get((jobnumber, activitynumber))
+        if bonus_type is None:
+            bonus_type = self._by_any_task.get((jobnumber, taskname))
+        if bonus_type is None:
+            bonus_type = self._by_job.get(jobnumber, "unknown")
+        self._memo[key] = bonus_type
+        return bonus_type
+
+    def classify_record(self, record) -> str:
+        return self.classify(record["jobnumber"], record["activitynumber"], record["taskname"])
 
     def add_mapping(self, bonus_type: str, jobnumber: str, activitynumber=None, taskname=None):
         if jobnumber not in self.mappings:
@@ -66,6 +197,7 @@ class timecode_mapping:
                 print("suspected error")
                 return
             self.mappings[jobnumber]["bonus_type"] = bonus_type
+            self.compile()
             return
         if activitynumber not in self.mappings[jobnumber]["activities"]:
             self.mappings[jobnumber]["activities"][activitynumber] = {"tasks": {}}
@@ -75,8 +207,10 @@ class timecode_mapping:
                 print("suspected error")
                 return
             self.mappings[jobnumber]["activities"][activitynumber]["bonus_type"] = bonus_type
+            self.compile()
             return
 
         if taskname not in self.mappings[jobnumber]["activities"][activitynumber]["tasks"]:
             self.mappings[jobnumber]["activities"][activitynumber]["tasks"][taskname] = {"bonus_type": bonus_type}
+            self.compile()
         return
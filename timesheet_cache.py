@@ -0,0 +1,226 @@
+"""Compact binary cache of the timesheet lines, as an alternative to the raw Deltek JSON in timesheets.json.
+
+Only the fields the salary models read are kept, column by column. The strings (dates, job, activity and
+task numbers, texts) are stored once in a string table and referenced by index, the hours as doubles and
+the invoiceable/internal flags as one byte per line. The columns are optionally zlib compressed.
+
+File layout, little-endian::
+
+    magic (8 bytes) | version (u16) | flags (u16) | lines (u32) | strings (u32) | string table size (u32)
+    | payload size (u32) | payload
+
+    payload: string lengths (u32 characters per string) | string table (utf-8, concatenated) | thedate,
+             jobnumber, activitynumber, taskname, entrytext, description (u32 string indexes per line, a column
+             each) | hours (f64 per line) | flags (u8 per line)
+
+The sizes in the header are checked against the file and the payload, a truncated or corrupt cache is read as
+no cache at all.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+from timecode_mapping import timeline_sheet_record
+
+CACHE_MAGIC = b"VSMLINES"
+CACHE_VERSION = 2
+COMPRESSED = 1
+
+INVOICEABLE = 1
+INTERNALJOB = 2
+
+_header = struct.Struct("<8sHHIIII")
+_string_columns = ("date", "jobnumber", "activitynumber", "taskname", "entrytext", "jobname")
+
+
+def _line_fields(record: dict | timeline_sheet_record) -> tuple:
+    if isinstance(record, timeline_sheet_record):
+        return (
+            record.date,
+            record.jobnumber,
+            record.activitynumber,
+            record.taskname,
+            record.entrytext,
+            record.jobname,
+            record.hours,
+            record.invoiceable,
+            record.internaljob,
+        )
+    data = record["data"]
+    return (
+        data["thedate"],
+        data["jobnumber"],
+        data["activitynumber"],
+        data["taskname"],
+        data["entrytext"],
+        data["description"],
+        data["numbertransferred"],
+        data["invoiceable"],
+        data["internaljob"],
+    )
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def write_cache(records: list[dict] | list[timeline_sheet_record], path: str, compress: bool = True):
+    """Write timesheet lines, Deltek records or compact lines, to a binary cache file.
+
+    The file is written next to ``path`` first and then moved in place, so a reader never sees half a file.
+
+    Args:
+        records (list): Timesheet records as returned by ``read_dailysheetlines``, or compact lines.
+        path (str): The cache file.
+        compress (bool, optional): zlib compress the columns. Defaults to True. Uncompressed caches are
+            larger but are loaded straight from a memory map.
+    """
+
+    string_index = {}
+    string_columns = [array("I") for _ in _string_columns]
+    hours = array("d")
+    flags = array("B")
+    for fields in map(_line_fields, records):
+        for column, value in zip(string_columns, fields[:6]):
+            index = string_index.get(value)
+            if index is None:
+                index = string_index[value] = len(string_index)
+            column.append(index)
+        hours.append(fields[6])
+        flags.append((INVOICEABLE if fields[7] else 0) | (INTERNALJOB if fields[8] else 0))
+
+    # The strings are delimited by their lengths, any character can appear in them
+    lengths = array("I", map(len, string_index.keys()))
+    strings = "".join(string_index.keys()).encode("utf-8")
+    payload = b"".join(
+        [_little_endian(lengths), strings, *map(_little_endian, string_columns), _little_endian(hours), flags.tobytes()]
+    )
+    if compress:
+        payload = zlib.compress(payload, 1)
+
+    header = _header.pack(
+        CACHE_MAGIC,
+        CACHE_VERSION,
+        COMPRESSED if compress else 0,
+        len(hours),
+        len(string_index),
+        len(strings),
+        len(payload),
+    )
+    partial_file = path + ".partial"
+    with open(partial_file, "wb") as fp:
+        fp.write(header)
+        fp.write(payload)
+    os.replace(partial_file, path)
+
+
+def _read_column(buffer, offset: int, typecode: str, count: int) -> tuple[array, int]:
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    column.frombytes(buffer[offset:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column, end
+
+
+def read_cache(path: str) -> list[timeline_sheet_record] | None:
+    """Load the timesheet lines of a binary cache file as compact lines.
+
+    Returns:
+        list[timeline_sheet_record] | None: The lines, or None when the file is missing, was written by
+            another version or is truncated or corrupt.
+    """
+
+    try:
+        fp = open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+    with fp:
+        file_size = os.fstat(fp.fileno()).st_size
+        if file_size < _header.size:
+            return None
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, flags, n_lines, n_strings, strings_size, payload_size = _header.unpack_from(mapped)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION or _header.size + payload_size != file_size:
+                return None
+            try:
+                with memoryview(mapped) as view, view[_header.size :] as payload:
+                    if flags & COMPRESSED:
+                        return _read_lines(zlib.decompress(payload), n_lines, n_strings, strings_size)
+                    return _read_lines(payload, n_lines, n_strings, strings_size)
+            except (zlib.error, UnicodeDecodeError, IndexError):
+                return None
+
+
+def _payload_size(n_lines: int, n_strings: int, strings_size: int) -> int:
+    return 4 * n_strings + strings_size + (4 * len(_string_columns) + 8 + 1) * n_lines
+
+
+def _read_lines(payload, n_lines: int, n_strings: int, strings_size: int) -> list[timeline_sheet_record] | None:
+    if len(payload) != _payload_size(n_lines, n_strings, strings_size):
+        return None
+    lengths, offset = _read_column(payload, 0, "I", n_strings)
+    text = bytes(payload[offset : offset + strings_size]).decode("utf-8")
+    ends = list(accumulate(lengths))
+    if (ends[-1] if ends else 0) != len(text):
+        return None
+    strings = [sys.intern(text[end - length : end]) for end, length in zip(ends, lengths)]
+
+    offset += strings_size
+    columns = []
+    for _ in _string_columns:
+        column, offset = _read_column(payload, offset, "I", n_lines)
+        columns.append(map(strings.__getitem__, column))
+    hours, offset = _read_column(payload, offset, "d", n_lines)
+    flags = bytes(payload[offset : offset + n_lines])
+
+    new_line = timeline_sheet_record.__new__
+    lines = []
+    for date, jobnumber, activitynumber, taskname, entrytext, jobname, line_hours, line_flags in zip(
+        *columns, hours, flags
+    ):
+        # The strings are interned once above, so the lines are filled in without going through __init__.
+        # An index past the string table raises IndexError, read as a corrupt cache by read_cache
+        line = new_line(timeline_sheet_record)
+        line.date = date
+        line.jobnumber = jobnumber
+        line.activitynumber = activitynumber
+        line.taskname = taskname
+        line.hours = line_hours
+        line.invoiceable = bool(line_flags & INVOICEABLE)
+        line.internaljob = bool(line_flags & INTERNALJOB)
+        line.entrytext = entrytext
+        line.jobname = jobname
+        line.type = "unknown"
+        lines.append(line)
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Convert a Deltek timesheets.json dump to a binary cache file.")
+    parser.add_argument("source", nargs="?", default="timesheets.json", help="Deltek dump (default: timesheets.json)")
+    parser.add_argument("target", nargs="?", default="timesheets.bin", help="Cache file (default: timesheets.bin)")
+    parser.add_argument("--uncompressed", action="store_true", help="Do not compress the columns")
+    args = parser.parse_args()
+
+    with open(args.source, "r") as fp:
+        source_records = json.load(fp)["panes"]["filter"]["records"]
+    write_cache(source_records, args.target, compress=not args.uncompressed)
+
+    start = time.perf_counter()
+    lines = read_cache(args.target)
+    print(f"{len(lines)} lines written to {args.target}, {os.path.getsize(args.target)} bytes")
+    print(f"Loaded again in {(time.perf_counter() - start) * 1000:.1f} ms")
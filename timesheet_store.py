@@ -0,0 +1,402 @@
+"""SQLite store for the timesheet lines of one or many employees, with the monthly sums as aggregate queries.
+
+Lines are stored per employee in the order ``calculate_years`` visits them (``seq``), with indexes on the
+date, the year and month, and the timecode. How each timecode counts is kept in the ``timecodes`` table,
+filled from the timecode mapping before every query, so a changed mapping never needs the lines reloaded.
+The monthly sums are running sums over the lines in ``seq`` order, which adds the hours in the same order
+as ``calculate_years`` does.
+"""
+
+import sqlite3
+import sys
+
+from bonusmodel_v1 import (
+    add_to_rollup,
+    add_unknown,
+    classify,
+    evaluate_year,
+    get_rates,
+    get_timecode_mapping,
+    new_report,
+    print_year_result,
+    sort_records,
+)
+from work_calendar import schedule
+
+_schema = """
+CREATE TABLE IF NOT EXISTS lines (
+    employee TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    thedate TEXT NOT NULL,
+    year TEXT NOT NULL,
+    month TEXT NOT NULL,
+    day TEXT NOT NULL,
+    jobnumber TEXT NOT NULL,
+    activitynumber TEXT NOT NULL,
+    taskname TEXT NOT NULL,
+    hours,
+    invoiceable INTEGER NOT NULL,
+    internaljob INTEGER NOT NULL,
+    entrytext TEXT,
+    jobname TEXT,
+    PRIMARY KEY (employee, seq)
+);
+CREATE INDEX IF NOT EXISTS lines_date ON lines (thedate);
+CREATE INDEX IF NOT EXISTS lines_year_month ON lines (year, month, employee);
+CREATE INDEX IF NOT EXISTS lines_timecode ON lines (jobnumber, activitynumber, taskname, invoiceable, internaljob);
+CREATE TABLE IF NOT EXISTS timecodes (
+    jobnumber TEXT NOT NULL,
+    activitynumber TEXT NOT NULL,
+    taskname TEXT NOT NULL,
+    invoiceable INTEGER NOT NULL,
+    internaljob INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    PRIMARY KEY (jobnumber, activitynumber, taskname, invoiceable, internaljob)
+);
+CREATE TABLE IF NOT EXISTS store_info (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# The lines of one employee with their bonus type, and whether the last deciding day before theirs was
+# billable. A day decides by its last billable, vacation or förtroendeuppdrag line: billable sets the state,
+# vacation and förtroendeuppdrag keep it, and a day without any of them resets it. Days are identified by
+# the seq of their first line.
+_classify_lines = [
+    "DROP TABLE IF EXISTS temp.classified",
+    "DROP TABLE IF EXISTS temp.day_state",
+    """
+    CREATE TEMP TABLE classified (
+        seq INTEGER PRIMARY KEY,
+        day_seq INTEGER NOT NULL,
+        year TEXT NOT NULL,
+        month TEXT NOT NULL,
+        jobnumber TEXT NOT NULL,
+        activitynumber TEXT NOT NULL,
+        taskname TEXT NOT NULL,
+        hours,
+        entrytext TEXT,
+        jobname TEXT,
+        type TEXT NOT NULL,
+        last_day_was_billable INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    INSERT INTO classified (seq, day_seq, year, month, jobnumber, activitynumber, taskname, hours, entrytext,
+        jobname, type)
+    SELECT l.seq, MIN(l.seq) OVER (PARTITION BY l.year, l.month, l.day), l.year, l.month, l.jobnumber,
+        l.activitynumber, l.taskname, l.hours, l.entrytext, l.jobname, t.type
+    FROM lines AS l
+    JOIN timecodes AS t ON t.jobnumber = l.jobnumber AND t.activitynumber = l.activitynumber
+        AND t.taskname = l.taskname AND t.invoiceable = l.invoiceable AND t.internaljob = l.internaljob
+    WHERE l.employee = :employee
+    """,
+    "CREATE INDEX temp.classified_day ON classified (day_seq)",
+    "CREATE TEMP TABLE day_state (day_seq INTEGER PRIMARY KEY, state INTEGER, carry INTEGER)",
+    """
+    INSERT INTO day_state (day_seq, state)
+    SELECT d.day_seq, CASE WHEN d.deciding_seq IS NULL THEN 0 WHEN c.type = 'billable' THEN 1 END
+    FROM (
+        SELECT day_seq, MAX(CASE WHEN type IN ('billable', 'vacation', 'förtroendeuppdrag') THEN seq END)
+            AS deciding_seq
+        FROM classified
+        GROUP BY day_seq
+    ) AS d
+    LEFT JOIN classified AS c ON c.seq = d.deciding_seq
+    """,
+    """
+    UPDATE day_state SET carry = COALESCE((
+        SELECT p.state FROM day_state AS p
+        WHERE p.day_seq < day_state.day_seq AND p.state IS NOT NULL
+        ORDER BY p.day_seq DESC LIMIT 1
+    ), 0)
+    """,
+    """
+    UPDATE classified SET last_day_was_billable = (
+        SELECT carry FROM day_state WHERE day_state.day_seq = classified.day_seq
+    )
+    """,
+]
+
+_month_sums = """
+SELECT year, month, billed, bonus, non_bonus, unknown, rlon_billable, rlin_vacation, rlon_vacation, vab_equivalent
+FROM (
+    SELECT year, month, seq,
+        SUM(CASE WHEN type = 'billable' THEN hours ELSE 0 END) OVER running AS billed,
+        SUM(CASE WHEN type IN ('billable', 'vacation', 'bonus') OR (type = 'förtroendeuppdrag'
+            AND last_day_was_billable) THEN hours ELSE 0 END) OVER running AS bonus,
+        SUM(CASE WHEN type = 'internal' THEN hours ELSE 0 END) OVER running AS non_bonus,
+        SUM(CASE WHEN type = 'unknown' THEN hours ELSE 0 END) OVER running AS unknown,
+        SUM(CASE WHEN type = 'förtroendeuppdrag' AND last_day_was_billable THEN hours ELSE 0 END)
+            OVER running AS rlon_billable,
+        SUM(CASE WHEN type = 'vacation' AND month IN ('07', '08', '12', '01') THEN hours ELSE 0 END)
+            OVER running AS rlin_vacation,
+        SUM(CASE WHEN type = 'vacation' AND last_day_was_billable THEN hours ELSE 0 END)
+            OVER running AS rlon_vacation,
+        SUM(CASE WHEN type IN ('VAB', 'parental') THEN hours ELSE 0 END) OVER running AS vab_equivalent,
+        ROW_NUMBER() OVER (PARTITION BY year, month ORDER BY seq DESC) AS from_last
+    FROM classified
+    WINDOW running AS (PARTITION BY year, month ORDER BY seq ROWS UNBOUNDED PRECEDING)
+)
+WHERE from_last = 1
+ORDER BY seq
+"""
+
+_month_rollup = """
+SELECT year, month, jobnumber, activitynumber, taskname, hours, line_type, description
+FROM (
+    SELECT year, month, seq, jobnumber, activitynumber, taskname,
+        type || CASE WHEN with_bonus THEN ' /w bonus' ELSE '' END AS line_type,
+        SUM(hours) OVER running AS hours,
+        FIRST_VALUE(entrytext) OVER running AS description,
+        MIN(seq) OVER running AS first_seq,
+        ROW_NUMBER() OVER (
+            PARTITION BY year, month, jobnumber, activitynumber, taskname, type, with_bonus ORDER BY seq DESC
+        ) AS from_last
+    FROM (
+        SELECT *, type = 'vacation' OR (type = 'förtroendeuppdrag' AND last_day_was_billable) AS with_bonus
+        FROM classified
+    )
+    WINDOW running AS (
+        PARTITION BY year, month, jobnumber, activitynumber, taskname, type, with_bonus
+        ORDER BY seq ROWS UNBOUNDED PRECEDING
+    )
+)
+WHERE from_last = 1
+ORDER BY first_seq
+"""
+
+_unknown_lines = """
+SELECT year, jobnumber, jobname, activitynumber, entrytext, hours
+FROM classified
+WHERE type = 'unknown'
+ORDER BY seq
+"""
+
+_month_sum_names = [
+    "billed",
+    "bonus",
+    "non_bonus",
+    "unknown",
+    "rlon_billable",
+    "rlin_vacation",
+    "rlon_vacation",
+    "vab_equivalent",
+]
+
+
+def open_store(path: str = "timesheets.db") -> sqlite3.Connection:
+    """Open the store, creating the tables and indexes if needed."""
+
+    conn = sqlite3.connect(path, timeout=60)
+    # Lets batch workers write their employees while others read
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_schema)
+    return conn
+
+
+def store_records(conn: sqlite3.Connection, employee: str, records) -> int:
+    """Replace the timesheet lines of an employee.
+
+    Args:
+        conn (sqlite3.Connection): The store.
+        employee (str): Who the lines belong to.
+        records: Timesheet records as returned by ``read_dailysheetlines``, or grouped by ``sort_records``.
+
+    Returns:
+        int: The number of lines stored.
+    """
+
+    if not isinstance(records, dict):
+        records = sort_records(records)
+
+    def rows():
+        seq = 0
+        for year, months in records.items():
+            for month, days in months.items():
+                for day, lines in days.items():
+                    for line in lines:
+                        yield (
+                            employee,
+                            seq,
+                            line.date,
+                            year,
+                            month,
+                            day,
+                            line.jobnumber,
+                            line.activitynumber,
+                            line.taskname,
+                            line.hours,
+                            line.invoiceable,
+                            line.internaljob,
+                            line.entrytext,
+                            line.jobname,
+                        )
+                        seq += 1
+
+    with conn:
+        conn.execute("DELETE FROM lines WHERE employee = ?", (employee,))
+        conn.executemany("INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows())
+    return conn.execute("SELECT COUNT(*) FROM lines WHERE employee = ?", (employee,)).fetchone()[0]
+
+
+def refresh_timecodes(conn: sqlite3.Connection, employee_list: list[str] = None):
+    """Classify the timecodes of the lines that are not classified yet, of the employees or the whole store.
+
+    The classified timecodes are kept until the timecode mapping changes, so an employee only costs the
+    timecodes nobody used before, however many employees the store holds.
+    """
+
+    mapping = get_timecode_mapping().fingerprint()
+    row = conn.execute("SELECT value FROM store_info WHERE name = 'mapping'").fetchone()
+    if row is None or row[0] != mapping:
+        with conn:
+            conn.execute("DELETE FROM timecodes")
+            conn.execute("INSERT OR REPLACE INTO store_info VALUES ('mapping', ?)", (mapping,))
+
+    query = """
+        SELECT DISTINCT jobnumber, activitynumber, taskname, invoiceable, internaljob
+        FROM lines AS l
+        WHERE NOT EXISTS (
+            SELECT 1 FROM timecodes AS t
+            WHERE t.jobnumber = l.jobnumber AND t.activitynumber = l.activitynumber AND t.taskname = l.taskname
+                AND t.invoiceable = l.invoiceable AND t.internaljob = l.internaljob
+        )
+    """
+    parameters = []
+    if employee_list:
+        query += f" AND l.employee IN ({', '.join('?' for _ in employee_list)})"
+        parameters += employee_list
+    keys = conn.execute(query, parameters).fetchall()
+    if keys:
+        with conn:
+            # Workers may classify the same new timecode at the same time
+            conn.executemany(
+                "INSERT OR IGNORE INTO timecodes VALUES (?, ?, ?, ?, ?, ?)",
+                [(*key, classify(key[0], key[1], key[2], bool(key[3]), bool(key[4]))) for key in keys],
+            )
+
+
+def employees(conn: sqlite3.Connection) -> list[str]:
+    return [row[0] for row in conn.execute("SELECT DISTINCT employee FROM lines ORDER BY employee")]
+
+
+def calculate_years_store(
+    conn: sqlite3.Connection,
+    employee: str,
+    unknown: dict = None,
+    output_file=sys.stdout,
+    rates: tuple[int, int, int] = None,
+    work_schedule: schedule = None,
+) -> dict:
+    """Run the models on the lines of one employee in the store, with the monthly sums as queries.
+
+    The report has the same structure as the one from ``calculate_years`` with ``keep_records=False``,
+    the months hold only the ``rollup`` of their lines.
+
+    Args:
+        conn (sqlite3.Connection): The store.
+        employee (str): Whose lines to use.
+        unknown (dict, optional): Filled with the hours of unclassified job/activity numbers.
+        output_file (optional): Where the yearly results are printed, None to print nothing.
+        rates (tuple, optional): Rtotal, Rlinear and Rlön rates, see ``model_rates``. Defaults to
+            the rates of envars RTOTAL and RLIN.
+        work_schedule (schedule, optional): The employee's part-time periods, see ``work_calendar``.
+            Defaults to full time.
+
+    Returns:
+        dict: The report, see ``calculate_years``.
+    """
+
+    if unknown is None:
+        unknown = {}
+    if rates is None:
+        rates = get_rates()
+    refresh_timecodes(conn, [employee])
+    with conn:
+        for statement in _classify_lines:
+            conn.execute(statement, {"employee": employee})
+
+    report = new_report(*rates)
+    month_sums = {}
+    for year, month, *sums in conn.execute(_month_sums):
+        if year not in report["years"]:
+            report["years"][year] = {"info": {}, "months": {}}
+            month_sums[year] = {}
+        report["years"][year]["months"][month] = {"rollup": {}}
+        month_sums[year][month] = dict(zip(_month_sum_names, sums))
+
+    for year, month, jobnumber, activitynumber, taskname, hours, line_type, description in conn.execute(
+        _month_rollup
+    ):
+        rollup = report["years"][year]["months"][month]["rollup"]
+        add_to_rollup(rollup, jobnumber, activitynumber, taskname, line_type, hours, description)
+
+    unknown_lines = {}
+    for year, *line in conn.execute(_unknown_lines):
+        unknown_lines.setdefault(year, []).append(line)
+
+    extra_bonus_hours_from_december = 0
+    for year in report["years"].keys():
+        # The unknown inventory grows year by year, like in calculate_years
+        for jobnumber, jobname, activitynumber, desc, hours in unknown_lines.get(year, []):
+            add_unknown(unknown, jobnumber, jobname, activitynumber, desc, hours)
+
+        extra_bonus_hours_from_december = evaluate_year(
+            report["years"][year], year, month_sums[year], extra_bonus_hours_from_december, work_schedule
+        )
+        if output_file is not None:
+            print_year_result(report, year, unknown, output_file)
+
+    return report
+
+
+def monthly_hours_by_type(conn: sqlite3.Connection, bonus_type: str, employee_list: list[str] = None) -> list[tuple]:
+    """Hours of one bonus type per employee and month, for example all VAB hours by month for the team.
+
+    Returns:
+        list[tuple]: (employee, year, month, hours) rows, ordered by employee, year and month.
+    """
+
+    refresh_timecodes(conn, employee_list)
+    query = """
+        SELECT l.employee, l.year, l.month, SUM(l.hours)
+        FROM timecodes AS t
+        JOIN lines AS l ON l.jobnumber = t.jobnumber AND l.activitynumber = t.activitynumber
+            AND l.taskname = t.taskname AND l.invoiceable = t.invoiceable AND l.internaljob = t.internaljob
+        WHERE t.type = ?
+    """
+    parameters = [bonus_type]
+    if employee_list:
+        query += f" AND l.employee IN ({', '.join('?' for _ in employee_list)})"
+        parameters += employee_list
+    query += " GROUP BY l.employee, l.year, l.month ORDER BY l.employee, l.year, l.month"
+    return conn.execute(query, parameters).fetchall()
+
+
+if __name__ == "__main__":
+    import argparse
+    from contextlib import closing
+
+    from batch import employee_id, list_timesheet_files, load_timesheet_records
+
+    parser = argparse.ArgumentParser(description="Load timesheets into the SQLite store and query it.")
+    parser.add_argument("--store", default="timesheets.db", help="Store file (default: timesheets.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load_parser = commands.add_parser("load", help="Load per-employee Deltek dumps, replacing their lines")
+    load_parser.add_argument("source", help="Directory of per-employee Deltek dumps, or a manifest file listing them")
+    hours_parser = commands.add_parser("hours", help="Hours of a bonus type per employee and month")
+    hours_parser.add_argument("type", help="Bonus type, for example VAB, vacation or billable")
+    hours_parser.add_argument("employees", nargs="*", help="Only these employees")
+    args = parser.parse_args()
+
+    with closing(open_store(args.store)) as store:
+        match args.command:
+            case "load":
+                for path in list_timesheet_files(args.source):
+                    count = store_records(store, employee_id(path), load_timesheet_records(path))
+                    print(f"{employee_id(path)}: {count} lines")
+            case "hours":
+                for employee, year, month, hours in monthly_hours_by_type(store, args.type, args.employees):
+                    print(f"{employee}  {year}-{month}  {hours:.1f}h")
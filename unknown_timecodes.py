@@ -0,0 +1,187 @@
+"""Org-wide inventory of the timecodes that are not in the timecode mapping.
+
+Each employee's unclassified job/activity numbers are collected into a small inventory, in the worker processing
+the employee, and the inventories are merged at the end into one list for the whole org: the hours of each code,
+how many employees used it and a few sample entry texts, with the most used codes first. It is the list to go
+through when extending ``timecode_mapping.json``.
+
+A batch run writes it to ``unknown_timecodes.json`` next to ``summary.json``. Run on its own it only classifies
+the lines, without running the models, so it goes through the full history of every employee quickly:
+
+    python unknown_timecodes.py timesheets/ -o unknown_timecodes.json
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from bonusmodel_v1 import classify
+
+# Distinct entry texts kept per timecode
+SAMPLE_TEXTS = 5
+
+
+def add_line(inventory: dict, jobnumber: str, jobname: str, activitynumber: str, entrytext: str, hours: float):
+    """Add the hours of an unclassified line to an employee's inventory.
+
+    The inventory maps (jobnumber, activitynumber) to the ``jobname``, the ``hours`` and up to ``SAMPLE_TEXTS``
+    distinct ``entrytexts`` of the code.
+    """
+
+    key = (jobnumber, activitynumber)
+    code = inventory.get(key)
+    if code is None:
+        code = inventory[key] = {"jobname": jobname, "hours": 0, "entrytexts": []}
+    code["hours"] += hours
+    if entrytext and len(code["entrytexts"]) < SAMPLE_TEXTS and entrytext not in code["entrytexts"]:
+        code["entrytexts"].append(entrytext)
+
+
+def employee_inventory(unknown: dict) -> dict:
+    """An employee's inventory from the ``unknown`` dict filled by the models, see ``add_unknown``."""
+
+    inventory = {}
+    for jobnumber, job in unknown.items():
+        for activitynumber, activity in job["activities"].items():
+            add_line(
+                inventory, jobnumber, job["description"], activitynumber, activity["description"], activity["hours"]
+            )
+    return inventory
+
+
+def scan_records(records: list[dict]) -> dict:
+    """An employee's inventory straight from the timesheet records, classifying them without running the models."""
+
+    inventory = {}
+    # Most lines repeat a handful of timecodes, each is only classified once
+    types = {}
+    for record in records:
+        record = record["data"]
+        key = (
+            record["jobnumber"],
+            record["activitynumber"],
+            record["taskname"],
+            record["invoiceable"],
+            record["internaljob"],
+        )
+        bonus_type = types.get(key)
+        if bonus_type is None:
+            bonus_type = types[key] = classify(*key)
+        if bonus_type == "unknown":
+            add_line(
+                inventory,
+                record["jobnumber"],
+                record["description"],
+                record["activitynumber"],
+                record["entrytext"],
+                record["numbertransferred"],
+            )
+    return inventory
+
+
+def scan_file(path: str) -> dict:
+    from batch import load_timesheet_records
+
+    return scan_records(load_timesheet_records(path))
+
+
+def merge_inventories(inventories) -> dict:
+    """Merge the inventories of the employees into the org inventory.
+
+    Args:
+        inventories: Iterable of employee inventories, see ``add_line``.
+
+    Returns:
+        dict: (jobnumber, activitynumber) to the ``jobname``, the total ``hours``, the number of ``employees``
+            and the sample ``entrytexts`` of the code.
+    """
+
+    merged = {}
+    for inventory in inventories:
+        for key, code in inventory.items():
+            total = merged.get(key)
+            if total is None:
+                total = merged[key] = {"jobname": code["jobname"], "hours": 0, "employees": 0, "entrytexts": []}
+            total["hours"] += code["hours"]
+            total["employees"] += 1
+            for entrytext in code["entrytexts"]:
+                if len(total["entrytexts"]) >= SAMPLE_TEXTS:
+                    break
+                if entrytext not in total["entrytexts"]:
+                    total["entrytexts"].append(entrytext)
+    return merged
+
+
+def inventory_rows(inventory: dict) -> list[dict]:
+    """The codes of a merged inventory as rows, the most hours first."""
+
+    rows = [
+        {
+            "jobnumber": jobnumber,
+            "jobname": code["jobname"],
+            "activitynumber": activitynumber,
+            "hours": code["hours"],
+            "employees": code["employees"],
+            "entrytexts": code["entrytexts"],
+        }
+        for (jobnumber, activitynumber), code in inventory.items()
+    ]
+    rows.sort(key=lambda row: (-row["hours"], row["jobnumber"], row["activitynumber"]))
+    return rows
+
+
+def write_inventory(inventory: dict, path: str):
+    with open(path, "w") as fp:
+        json.dump(inventory_rows(inventory), fp, indent=2, ensure_ascii=False)
+
+
+def collect(source: str, workers: int | None = None) -> dict:
+    """The merged inventory of every employee dump in ``source``, scanned across a process pool.
+
+    Args:
+        source (str): A Deltek dump, a directory of per-employee dumps or a manifest listing them.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+    """
+
+    from batch import list_timesheet_files
+
+    if os.path.isfile(source) and source.endswith(".json"):
+        paths = [source]
+    else:
+        paths = list_timesheet_files(source)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return merge_inventories(pool.map(scan_file, paths, chunksize=chunksize))
+
+
+def print_inventory(inventory: dict, limit: int = 20):
+    rows = inventory_rows(inventory)
+    print(f"{len(rows)} unknown timecodes, {sum(row['hours'] for row in rows):.1f} hours")
+    for row in rows[:limit]:
+        sample = row["entrytexts"][0] if row["entrytexts"] else ""
+        print(
+            f"  {row['jobnumber']:<12} {row['activitynumber']:<8} {row['hours']:>10.1f} h"
+            f" {row['employees']:>5} employees  {row['jobname']} / {sample}"
+        )
+    if len(rows) > limit:
+        print(f"  ... and {len(rows) - limit} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the timecodes missing from the timecode mapping.")
+    parser.add_argument("source", help="A Deltek dump, a directory of per-employee dumps or a manifest")
+    parser.add_argument("-o", "--output", help="Write the inventory to this JSON file")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    inventory = collect(args.source, args.workers)
+    print_inventory(inventory)
+    if args.output:
+        write_inventory(inventory, args.output)
+        print(f"Inventory written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Working-day calendars, and the per-employee schedules layered on top of them.
+
+The working days of a year are the weekdays that are not Swedish public holidays, Midsummer Eve, Christmas Eve
+or New Year's Eve. Each year is computed once into a bitmap with one bit per day of the year, and the running
+count of working days up to every day, so whether a day is a working day and the working days of any period, a
+month or a leave, are a lookup or two:
+
+    calendar = year_calendar(2024)
+    calendar.is_workday(datetime.date(2024, 6, 21))  # False, Midsummer Eve
+    calendar.month_hours                            # (168, 160, ...)
+
+A schedule lists the periods an employee works less than full time, as a percentage of the full day, for
+part-time work or part-time parental leave:
+
+    [{"from": "2024-03-01", "to": "2024-08-31", "percent": 80}, {"from": "2025-01-01", "percent": 90}]
+
+A period without ``to`` lasts until further notice. The schedules of the employees are read from the file in envar
+SCHEDULES, keyed by employee, with the one of the main program under "me":
+
+    {"me": [{"from": "2024-03-01", "percent": 80}], "anna.svensson": [...]}
+
+The year calendars are shared by all employees, a schedule only subtracts the hours of its periods.
+"""
+
+import datetime
+import json
+import os
+from array import array
+from functools import cache
+
+from holiday_api import get_midsummers_eve, holiday_index
+
+HOURS_PER_DAY = 8
+
+# Share of a full-time month of every month, when working full time
+FULL_TIME = (1,) * 12
+
+
+class working_calendar:
+    """The working days of a year, as a bitmap and running counts by day of the year (0 for 1 January)."""
+
+    def __init__(self, year: int, days_off: set[str]):
+        self.year = year
+        self.first_day = datetime.date(year, 1, 1).toordinal()
+        days = datetime.date(year + 1, 1, 1).toordinal() - self.first_day
+        bitmap = bytearray((days + 7) // 8)
+        # counts[i] is the number of working days before day i, so a period is the difference of two counts
+        counts = array("H", [0])
+        for index in range(days):
+            date = datetime.date.fromordinal(self.first_day + index)
+            workday = date.weekday() < 5 and date.isoformat() not in days_off
+            if workday:
+                bitmap[index >> 3] |= 1 << (index & 7)
+            counts.append(counts[-1] + workday)
+        self.bitmap = bytes(bitmap)
+        self.counts = counts
+        self.month_starts = tuple(
+            datetime.date(year, month, 1).toordinal() - self.first_day for month in range(1, 13)
+        ) + (days,)
+        self.month_days = tuple(counts[self.month_starts[i + 1]] - counts[self.month_starts[i]] for i in range(12))
+        self.month_hours = tuple(days * HOURS_PER_DAY for days in self.month_days)
+
+    def is_workday(self, date: datetime.date) -> bool:
+        index = date.toordinal() - self.first_day
+        return bool(self.bitmap[index >> 3] >> (index & 7) & 1)
+
+    def workdays_between(self, start: datetime.date, end: datetime.date) -> int:
+        """The number of working days from ``start`` to ``end``, both included, within the year."""
+
+        first = max(start.toordinal() - self.first_day, 0)
+        last = min(end.toordinal() - self.first_day + 1, len(self.counts) - 1)
+        if last <= first:
+            return 0
+        return self.counts[last] - self.counts[first]
+
+    def workdays(self) -> list[datetime.date]:
+        return [
+            datetime.date.fromordinal(self.first_day + index)
+            for index in range(len(self.counts) - 1)
+            if self.counts[index + 1] > self.counts[index]
+        ]
+
+
+def days_off(year: int) -> set[str]:
+    """The weekdays of a year that are not worked: the public holidays and the eves treated as holidays."""
+
+    days = set(holiday_index(year).values())
+    days.add(get_midsummers_eve(year))
+    days.update([f"{year}-12-24", f"{year}-12-31"])
+    return days
+
+
+@cache
+def year_calendar(year: int) -> working_calendar:
+    """The working calendar of a year, computed once per year."""
+    return working_calendar(year, days_off(year))
+
+
+class schedule:
+    """The periods an employee works part time, see the module docstring for the format."""
+
+    def __init__(self, periods: list[dict]):
+        self.periods = []
+        for period in periods:
+            if "from" not in period or "percent" not in period:
+                raise Exception(f"A schedule period needs 'from' and 'percent': {period}")
+            start = datetime.date.fromisoformat(period["from"])
+            end = datetime.date.fromisoformat(period["to"]) if "to" in period else datetime.date.max
+            percent = period["percent"]
+            if end < start or not 0 < percent <= 100:
+                raise Exception(f"Invalid schedule period: {period}")
+            self.periods.append((start, end, percent))
+        self.periods.sort()
+        for (_, end, _), (start, _, _) in zip(self.periods, self.periods[1:]):
+            if start <= end:
+                raise Exception(f"Schedule periods overlap at {start}")
+        self._months = {}
+
+    def month_hours(self, year: int) -> tuple[tuple[float, ...], tuple[float, ...]]:
+        """The scheduled hours of each month of a year, and their share of the full-time hours."""
+
+        if year in self._months:
+            return self._months[year]
+
+        calendar = year_calendar(year)
+        # The working days not worked in each month, in hundredths of a day, so full shares stay exact
+        reduced = [0] * 12
+        for start, end, percent in self.periods:
+            first = max(start.toordinal() - calendar.first_day, 0)
+            last = min(end.toordinal() - calendar.first_day + 1, len(calendar.counts) - 1)
+            for month in range(12):
+                month_first = max(first, calendar.month_starts[month])
+                month_last = min(last, calendar.month_starts[month + 1])
+                if month_last > month_first:
+                    days = calendar.counts[month_last] - calendar.counts[month_first]
+                    reduced[month] += days * (100 - percent)
+        hours = tuple(
+            (days * 100 - off) * HOURS_PER_DAY / 100 if off else days * HOURS_PER_DAY
+            for days, off in zip(calendar.month_days, reduced)
+        )
+        shares = tuple(
+            (days * 100 - off) / (days * 100) if off else 1 for days, off in zip(calendar.month_days, reduced)
+        )
+        self._months[year] = (tuple(hours), shares)
+        return self._months[year]
+
+
+def schedules_file() -> str:
+    """The schedules file set with envar SCHEDULES, or an empty string when everyone works full time."""
+    return os.environ["SCHEDULES"] if "SCHEDULES" in os.environ else ""
+
+
+@cache
+def load_schedules(path: str) -> dict[str, schedule]:
+    with open(path, "r") as fp:
+        return {employee: schedule(periods) for employee, periods in json.load(fp).items()}
+
+
+def employee_schedule(employee: str) -> schedule | None:
+    """The schedule of an employee from the schedules file, None when working full time."""
+
+    path = schedules_file()
+    if not path:
+        return None
+    return load_schedules(path).get(employee)
+
+
+def monthly_hours(year: int, work_schedule: schedule | None = None) -> tuple[tuple, tuple]:
+    """The hours of each month of a year and their share of full time, for a schedule or full time."""
+
+    if work_schedule is None:
+        return year_calendar(year).month_hours, FULL_TIME
+    return work_schedule.month_hours(year)